@@ -0,0 +1,115 @@
+"""
+    两种下载引擎装一整套资源文件的吞吐对比：本地起一个 HTTP/1.1 长连接的静态服务器（单独一个进程）冒充资源服务器，
+    安装器分别用 "thread"（一个下载一个线程，小文件合批）和 "asyncio"（一个事件循环）把同一套资源下一遍，
+    看用时、每秒文件数、最多同时有几个线程和长连接复用率
+    用法：python benchmarks/download_engines.py --assets 3000 --max-size 16384 --workers 128
+"""
+
+import argparse
+import functools
+import hashlib
+import http.server
+import json
+import multiprocessing
+import os
+import pathlib
+import random
+import tempfile
+import threading
+import time
+
+from granite_core import granite_settings
+from granite_core import minecraft_installer
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    request_queue_size = 1024  # 默认的 listen backlog 只有 5，一下子连上来 128 条的话会丢 SYN、等一秒重传
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def serve(directory: str, port_queue: multiprocessing.Queue) -> None:
+    server = _Server(("127.0.0.1", 0), functools.partial(_Handler, directory=directory))
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def make_assets(root: pathlib.Path, count: int, max_size: int) -> dict[str, any]:
+    """在 root/assets 下按 散列前缀/散列 放好资源文件，返回资源索引"""
+    rng: random.Random = random.Random(0)
+    objects: dict[str, dict[str, any]] = {}
+    for i in range(count):
+        data: bytes = rng.randbytes(rng.randint(256, max_size))
+        sha1: str = hashlib.sha1(data).hexdigest()
+        os.makedirs(root / "assets" / sha1[: 2], exist_ok=True)
+        (root / "assets" / sha1[: 2] / sha1).write_bytes(data)
+        objects[f"minecraft/sounds/dir{i % 40}/sound{i}.ogg"] = {"hash": sha1, "size": len(data)}
+    return {"objects": objects}
+
+
+def bench(engine: str, base_url: str, asset_index: dict[str, any], workers: int) -> tuple[float, int, int, dict[str, any]]:
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_path: pathlib.Path = pathlib.Path(work_dir)
+        os.makedirs(work_path / "assets" / "indexes")
+        with open(work_path / "assets" / "indexes" / "bench.json", "w") as f:
+            json.dump(asset_index, f)
+
+        settings: granite_settings.GraniteSettings = granite_settings.GraniteSettings()
+        settings.set("working_path", work_path)
+        settings.set("temp_path", work_path / "temp")
+        settings.set("max_workers", workers)
+        settings.set("rate_limits", {})
+        settings.set("process_workers", 0)
+        settings.set("download_engine", engine)
+        installer: minecraft_installer.MinecraftInstaller = minecraft_installer.MinecraftInstaller(settings, "bench", "Mojang")
+        installer.minecraft_assets_path["Mojang"] = f"{base_url}/assets"
+        installer.version_metadata = {"assetIndex": {"id": "bench"}}
+        installer._print_progress = lambda *args: None
+
+        peak_threads: list[int] = [threading.active_count()]
+        done: threading.Event = threading.Event()
+
+        def sample_threads() -> None:
+            while not done.wait(0.01):
+                peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+        sampler: threading.Thread = threading.Thread(target=sample_threads)
+        sampler.start()
+        start_time: float = time.perf_counter()
+        installer.install_queue.add_task({"id": "assets", "function": installer.download_game_assets})
+        installer.install_queue.run()
+        elapsed: float = time.perf_counter() - start_time
+        done.set()
+        sampler.join()
+        installer.install_queue.shutdown()
+
+        return elapsed, installer.installed_assets, peak_threads[0] - 1, installer.transport.get_stats()  # 线程数不算采样线程
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=3000)
+    parser.add_argument("--max-size", type=int, default=16384)
+    parser.add_argument("--workers", type=int, default=128)
+    parser.add_argument("--engine", nargs="+", choices=["thread", "asyncio"], default=["thread", "asyncio"])
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as server_dir:
+        index: dict[str, any] = make_assets(pathlib.Path(server_dir), arguments.assets, arguments.max_size)
+        ports: multiprocessing.Queue = multiprocessing.Queue()
+        server_process = multiprocessing.Process(target=serve, args=(server_dir, ports), daemon=True)
+        server_process.start()
+        url: str = f"http://127.0.0.1:{ports.get()}"
+        try:
+            for download_engine in arguments.engine:
+                seconds, installed, threads, connections = bench(download_engine, url, index, arguments.workers)
+                print(f"{download_engine:>7}: {installed} / {arguments.assets} assets in {seconds:.2f}s, "
+                      f"{installed / seconds:,.0f} files/s, peak {threads} threads, "
+                      f"{connections["requests"]} requests over {connections["connections"]} connections ({connections["reuse_ratio"]:.1%} reused)")
+        finally:
+            server_process.terminate()
@@ -0,0 +1,87 @@
+"""
+    TaskQueue 调度开销的微基准：一堆空任务，看每秒能跑多少个
+    用法：python benchmarks/task_queue_dispatch.py --tasks 10000 100000 --workers 128 [--bulk] [--baseline d99fbf6^]
+    顺便打印入队耗时，--bulk 用 add_tasks 一次性入队，不加就是一个个 add_task
+    --baseline 给一个 git 版本（比如改调度器之前的 d99fbf6^），把那时候的 src/granite_core 导出到临时目录，
+    在子进程里跑同样的参数，前后对比着打印；那个版本还没有 add_tasks 的话 --bulk 退回一个个加
+"""
+
+import argparse
+import io
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import typing
+
+from granite_core import task_queue
+
+
+def noop() -> None:
+    return None
+
+
+def bench(tasks: int, workers: int, bulk: bool) -> tuple[float, float]:
+    queue: task_queue.TaskQueue = task_queue.TaskQueue(workers)
+    start_time: float = time.perf_counter()
+    task_list: typing.Iterator[dict[str, any]] = ({
+        "id": i,
+        "description": "空任务",
+        "function": noop,
+    } for i in range(tasks))
+    if bulk and hasattr(queue, "add_tasks"):
+        queue.add_tasks(task_list)
+    else:
+        for task in task_list:
+            queue.add_task(task)
+    enqueue_time: float = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    queue.run()
+    elapsed: float = time.perf_counter() - start_time
+    queue.shutdown()
+
+    return enqueue_time, tasks / elapsed
+
+
+def bench_baseline(ref: str, tasks: list[int], workers: int, bulk: bool) -> list[tuple[float, float]]:
+    """git archive 导出 ref 那时候的 src/granite_core，子进程里用它跑本脚本，结果用 JSON 传回来"""
+    repo_root: pathlib.Path = pathlib.Path(__file__).resolve().parent.parent
+    with tempfile.TemporaryDirectory() as temp_dir:
+        archive: bytes = subprocess.run(["git", "archive", ref, "src/granite_core"], cwd=repo_root, check=True,
+                                        capture_output=True).stdout
+        with tarfile.open(fileobj=io.BytesIO(archive)) as archive_file:
+            archive_file.extractall(temp_dir, filter="data")
+        env: dict[str, str] = {**os.environ, "PYTHONPATH": os.pathsep.join(
+            [str(pathlib.Path(temp_dir) / "src"), *filter(None, [os.environ.get("PYTHONPATH")])])}
+        output: str = subprocess.run(
+            [sys.executable, __file__, "--tasks", *map(str, tasks), "--workers", str(workers), "--json"] + (["--bulk"] if bulk else []),
+            env=env, check=True, capture_output=True, text=True).stdout
+    return [tuple(result) for result in json.loads(output)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--workers", type=int, default=128)
+    parser.add_argument("--bulk", action="store_true")
+    parser.add_argument("--baseline", help="git ref to compare against, e.g. d99fbf6^")
+    parser.add_argument("--json", action="store_true", help=argparse.SUPPRESS)  # --baseline 的子进程用
+    arguments = parser.parse_args()
+
+    results: list[tuple[float, float]] = [bench(task_count, arguments.workers, arguments.bulk) for task_count in arguments.tasks]
+    if arguments.json:
+        print(json.dumps(results))
+        sys.exit()
+
+    baseline: list[tuple[float, float] | None] = bench_baseline(arguments.baseline, arguments.tasks, arguments.workers, arguments.bulk) \
+        if arguments.baseline else [None] * len(results)
+    for task_count, (enqueue_time, throughput), before in zip(arguments.tasks, results, baseline):
+        line: str = f"{task_count} tasks, {arguments.workers} workers: enqueue {enqueue_time * 1000:.1f} ms, {throughput:,.0f} tasks/s"
+        if before is not None:
+            line += f" | {arguments.baseline}: enqueue {before[0] * 1000:.1f} ms, {before[1]:,.0f} tasks/s -> {throughput / before[1]:.2f}x"
+        print(line)
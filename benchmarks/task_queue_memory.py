@@ -0,0 +1,113 @@
+"""
+    排队中任务的内存占用：模拟资源索引规模的下载任务，只入队不跑，用 tracemalloc 看每个任务占多少
+    --format dict 是安装器以前的写法（整条 dict、格式化好的描述、每个任务三个新 Path）
+    --format record 是现在的写法（Task、描述用到才拼、存放目录共用）
+    用法：python benchmarks/task_queue_memory.py --tasks 4000 --format dict record
+"""
+
+import argparse
+import hashlib
+import pathlib
+import tracemalloc
+
+from granite_core import task_queue
+
+
+def download(*args, **kwargs) -> None:
+    return None
+
+
+def make_assets(count: int) -> list[tuple[str, str]]:
+    # 真实索引里大概几十个目录，散列前缀 256 种
+    return [(f"minecraft/sounds/dir{i % 40}/sound{i}.ogg", hashlib.sha1(str(i).encode()).hexdigest()) for i in range(count)]
+
+
+def make_dict_task(base: pathlib.Path, i: int, name: str, sha1: str) -> dict[str, any]:
+    return {
+        "id": f"asset-downloading-worker-{i}",
+        "description": f"下载游戏资源文件的 ({name}, {sha1})",
+        "function": download,
+        "args": (
+            f"asset-downloading-worker-{i}",
+            f"https://resources.download.minecraft.net/{sha1[: 2]}/{sha1}",
+            [
+                base / "assets" / "objects" / sha1[: 2],
+                (base / "assets" / "virtual" / "legacy" / name).parent,
+                (base / "assets" / "virtual" / "pre-1.6" / name).parent
+            ],
+            [sha1, pathlib.Path(name).name, pathlib.Path(name).name],
+            sha1
+        ),
+        "callback": download,
+        "callback_args": (f"asset-downloading-worker-{i}",),
+        "max_time": 60,
+        "cancellable": True,
+        "max_retries": 3,
+        "retry_delay": 1,
+        "retry_max_delay": 30,
+        "adaptive": False,
+        "rate_key": "resources.download.minecraft.net",
+        "priority": 11
+    }
+
+
+def intern_path(base: pathlib.Path, interned_paths: dict, *parts: str) -> pathlib.Path:
+    if (path := interned_paths.get(parts)) is None:
+        path = interned_paths[parts] = base.joinpath(*parts)
+    return path
+
+
+def make_record_task(base: pathlib.Path, interned_paths: dict, i: int, name: str, sha1: str) -> task_queue.Task:
+    worker_id: str = f"asset-downloading-worker-{i}"
+    asset_dir, _, file_name = name.rpartition("/")
+    paths: tuple[pathlib.Path, ...] = (
+        intern_path(base, interned_paths, "assets", "objects", sha1[: 2]),
+        intern_path(base, interned_paths, "assets", "virtual", "legacy", asset_dir),
+        intern_path(base, interned_paths, "assets", "virtual", "pre-1.6", asset_dir)
+    )
+    return task_queue.Task(
+        worker_id,
+        download,
+        (worker_id, f"https://resources.download.minecraft.net/{sha1[: 2]}/{sha1}", paths, (sha1, file_name, file_name), sha1),
+        description=("下载游戏资源文件的 ({}, {})", name, sha1),
+        callback=download,
+        callback_args=(worker_id,),
+        max_time=60,
+        cancellable=True,
+        max_retries=3,
+        retry_delay=1,
+        retry_max_delay=30,
+        rate_key="resources.download.minecraft.net",
+        priority=11
+    )
+
+
+def bench(count: int, task_format: str) -> float:
+    assets: list[tuple[str, str]] = make_assets(count)
+    base: pathlib.Path = pathlib.Path(".minecraft")
+    interned_paths: dict = {}
+    queue: task_queue.TaskQueue = task_queue.TaskQueue(8)
+
+    tracemalloc.start()
+    before: int = tracemalloc.get_traced_memory()[0]
+    if task_format == "dict":
+        tasks: list = [make_dict_task(base, i, name, sha1) for i, (name, sha1) in enumerate(assets)]
+    else:
+        tasks = [make_record_task(base, interned_paths, i, name, sha1) for i, (name, sha1) in enumerate(assets)]
+    queue.add_tasks(tasks)
+    del tasks  # 只算队列自己抓着的
+    after: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    queue.shutdown()
+
+    return (after - before) / count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=4000)
+    parser.add_argument("--format", nargs="+", choices=["dict", "record"], default=["dict", "record"])
+    arguments = parser.parse_args()
+
+    for task_format in arguments.format:
+        print(f"{arguments.tasks} queued tasks, {task_format}: {bench(arguments.tasks, task_format):,.0f} bytes/task")
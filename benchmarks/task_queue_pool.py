@@ -0,0 +1,65 @@
+"""
+    弹性线程池的基准：建队列要多久、起了几个线程，以及一波任务前后线程数怎么变
+    用法：python benchmarks/task_queue_pool.py --workers 128 --idle-timeout 0.5
+"""
+
+import argparse
+import threading
+import time
+
+from granite_core import task_queue
+
+
+def bench_construction(workers: int, rounds: int) -> tuple[float, int]:
+    elapsed: float = 0.0
+    threads: int = 0
+    for _ in range(rounds):
+        baseline_threads: int = threading.active_count()
+        start_time: float = time.perf_counter()
+        queue: task_queue.TaskQueue = task_queue.TaskQueue(workers)
+        elapsed += time.perf_counter() - start_time
+        threads = threading.active_count() - baseline_threads
+        queue.shutdown()
+
+    return elapsed / rounds, threads
+
+
+def bench_thread_count(workers: int, idle_timeout: float, tasks: int, task_time: float) -> list[tuple[float, int]]:
+    queue: task_queue.TaskQueue = task_queue.TaskQueue(workers, idle_timeout=idle_timeout)
+    for i in range(tasks):
+        queue.add_task({
+            "id": i,
+            "description": "睡一小会儿的任务",
+            "function": time.sleep,
+            "args": (task_time,),
+        })
+
+    samples: list[tuple[float, int]] = []
+    start_time: float = time.perf_counter()
+    runner: threading.Thread = threading.Thread(target=queue.run)
+    runner.start()
+    while time.perf_counter() - start_time < idle_timeout * 2 + tasks * task_time / workers + 1:
+        samples.append((time.perf_counter() - start_time, queue.get_worker_count()))
+        time.sleep(0.1)
+    runner.join()
+    queue.shutdown()
+
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=128)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--idle-timeout", type=float, default=0.5)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--task-time", type=float, default=0.01)
+    arguments = parser.parse_args()
+
+    construction_time, construction_threads = bench_construction(arguments.workers, arguments.rounds)
+    print(f"TaskQueue({arguments.workers}): {construction_time * 1000:.3f} ms, {construction_threads} threads after construction")
+
+    print(f"{arguments.tasks} x {arguments.task_time}s tasks, idle_timeout={arguments.idle_timeout}s:")
+    for sample_time, worker_count in bench_thread_count(arguments.workers, arguments.idle_timeout,
+                                                       arguments.tasks, arguments.task_time):
+        print(f"  t={sample_time:5.2f}s  workers={worker_count}")
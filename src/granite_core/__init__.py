@@ -1,3 +1,10 @@
+from . import async_http
+from . import async_task_queue
 from . import granite_settings
+from . import http_transport
+from . import install_journal
+from . import metadata_cache
 from . import minecraft_installer
+from . import object_store
 from . import task_queue
+from . import verify_index
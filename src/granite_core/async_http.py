@@ -0,0 +1,218 @@
+"""
+    asyncio 上的一个很小的 HTTP/1.1 客户端，只管 GET，给 AsyncTaskQueue 跑的下载协程用
+    不多拉依赖，标准库的 asyncio 流就够了：按 (scheme, host, port) 复用长连接，认 Content-Length 和 chunked，跟着重定向走
+"""
+
+import asyncio
+import ssl
+import typing
+import urllib.parse
+
+
+class HttpResponse:
+    """status_code / headers（键全小写）/ content，边收边写进 sink 的话 content 是 None"""
+    __slots__ = ("url", "status_code", "headers", "content")
+
+    def __init__(self, url: str, status_code: int, headers: dict[str, str], content: bytes | None) -> None:
+        self.url: str = url
+        self.status_code: int = status_code
+        self.headers: dict[str, str] = headers
+        self.content: bytes | None = content
+
+
+class HttpError(Exception):
+    """状态码 >= 400，response 挂在异常上，和 requests.HTTPError 一样，task_queue.is_congestion_error 认得"""
+
+    def __init__(self, response: HttpResponse, message: str | None = None) -> None:
+        super().__init__(message or f"{response.status_code} Error for url: {response.url}")
+        self.response: HttpResponse = response
+
+
+class AsyncHttpClient:
+    """
+    max_connections_per_host: 每个 (scheme, host, port) 最多同时开几条连接，多出来的请求排队等连接
+    timeout: 连接 / 等响应 / 两次收到数据之间最多等多久（秒），和 requests 的 timeout 一个意思，不是整个下载的时间
+    verify: 验不验 SSL 证书，默认和安装器的 requests 一样不验
+    headers: 每个请求都带的请求头，请求自己给的同名的优先
+    stats: 有 record_request(host) / record_connection(host) 的话每发一个请求、每建一条连接记一笔，见 http_transport.ConnectionStats
+    retries / retry_status / backoff_factor: 和 HttpTransport 的 urllib3 Retry 一个规矩：连不上、断了（还没往 sink 里写东西的时候），
+    或者状态码在 retry_status 里的，等 backoff_factor * 2 ** (第几次 - 1) 秒（第一次不等，最多 BACKOFF_MAX；
+    413 / 429 / 503 带了 Retry-After 的照它等）再来，最多 retries 次；次数用完了状态码还不对的照常抛 HttpError
+    只能在一个事件循环里用，用完 await close()
+    """
+    REDIRECT_CODES: tuple[int, ...] = (301, 302, 303, 307, 308)
+    RETRY_AFTER_CODES: tuple[int, ...] = (413, 429, 503)
+    BACKOFF_MAX: float = 120
+    READ_SIZE: int = 65536
+
+    def __init__(self, max_connections_per_host: int = 32, timeout: float = 30, verify: bool = False,
+                 max_redirects: int = 5, headers: dict[str, str] | None = None, stats: typing.Any = None,
+                 retries: int = 0, retry_status: typing.Collection[int] = (), backoff_factor: float = 0.5) -> None:
+        self.max_connections_per_host: int = max_connections_per_host
+        self.timeout: float = timeout
+        self.max_redirects: int = max_redirects
+        self.retries: int = retries
+        self.retry_status: typing.Collection[int] = retry_status
+        self.backoff_factor: float = backoff_factor
+        self.headers: dict[str, str] = headers or {}
+        self.stats = stats
+        self.ssl_context: ssl.SSLContext = ssl.create_default_context()
+        if not verify:
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.idle_connections: dict[tuple, list[tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self.connection_slots: dict[tuple, asyncio.Semaphore] = {}
+
+    async def get(self, url: str, headers: dict[str, str] | None = None,
+                  sink: typing.Callable[[bytes], any] | None = None) -> HttpResponse:
+        """
+        GET 一个地址，跟着重定向走，最后状态码 >= 400 的抛 HttpError
+        :param sink: 给了的话 2xx 的 body 边收边喂给它（比如写文件），不在内存里攒，response.content 是 None
+        """
+        for _ in range(self.max_redirects + 1):
+            response: HttpResponse = await self._request_with_retries(url, {**self.headers, **headers} if headers else self.headers, sink)
+            if response.status_code in self.REDIRECT_CODES and "location" in response.headers:
+                url = urllib.parse.urljoin(url, response.headers["location"])
+                continue
+            if response.status_code >= 400:
+                raise HttpError(response)
+            return response
+        raise HttpError(response, f"Exceeded {self.max_redirects} redirects: {url}")
+
+    async def _request_with_retries(self, url: str, headers: dict[str, str], sink: typing.Callable[[bytes], any] | None) -> HttpResponse:
+        """_request 加上重试，见类的说明；已经往 sink 里写了东西的就不能重来了，直接抛"""
+        written: bool = False
+
+        def tracking_sink(data: bytes) -> any:
+            nonlocal written
+            written = True
+            return sink(data)
+
+        retry: int = 0
+        while True:
+            response: HttpResponse | None = None
+            try:
+                response = await self._request(url, headers, tracking_sink if sink is not None else None)
+            except (OSError, asyncio.IncompleteReadError):  # 连不上、断了、超时（TimeoutError 也是 OSError）
+                if written or retry >= self.retries:
+                    raise
+            else:
+                if response.status_code not in self.retry_status or retry >= self.retries:
+                    return response
+            retry += 1
+            await asyncio.sleep(self._get_backoff(retry, response))
+
+    def _get_backoff(self, retry: int, response: HttpResponse | None) -> float:
+        """第 retry 次重试之前等多久，和 urllib3 一样：第一次不等，之后 backoff_factor 翻倍；服务器说了 Retry-After 的照它的"""
+        if response is not None and response.status_code in self.RETRY_AFTER_CODES \
+                and (retry_after := response.headers.get("retry-after", "")).isdigit():
+            return float(retry_after)
+        return 0 if retry <= 1 else min(self.BACKOFF_MAX, self.backoff_factor * 2 ** (retry - 1))
+
+    async def _request(self, url: str, headers: dict[str, str], sink: typing.Callable[[bytes], any] | None) -> HttpResponse:
+        parts: urllib.parse.SplitResult = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {url}")
+        key: tuple = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        target: str = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        request: bytes = (f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+                          + "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+                          + "\r\n").encode("latin-1")
+
+        if (slot := self.connection_slots.get(key)) is None:
+            slot = self.connection_slots[key] = asyncio.Semaphore(self.max_connections_per_host)
+        async with slot, asyncio.timeout(self.timeout) as timeout:  # 排队等连接不算在 timeout 里，拿到了才开始计
+            for attempt in range(2):  # 复用的连接可能已经被服务器关了，换条新的再来一次
+                reused, reader, writer = await self._get_connection(key)
+                if self.stats is not None:
+                    self.stats.record_request(f"{key[1]}:{key[2]}")
+                try:
+                    writer.write(request)
+                    await writer.drain()
+                    status_line: bytes = await reader.readline()
+                    if not status_line:
+                        raise ConnectionResetError("Connection closed before the response")
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused and not attempt:
+                        continue
+                    raise
+                break
+
+            try:
+                response, keep_alive = await self._read_response(url, status_line, reader, sink, timeout)
+            except BaseException:  # 收到一半的连接不能再用了（取消也一样）
+                writer.close()
+                raise
+        if keep_alive:
+            self.idle_connections.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+        return response
+
+    async def _get_connection(self, key: tuple) -> tuple[bool, asyncio.StreamReader, asyncio.StreamWriter]:
+        """先拿闲着的长连接，没有再新建，返回 (是不是复用的, reader, writer)"""
+        idle: list = self.idle_connections.get(key, [])
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return True, reader, writer
+            writer.close()
+        scheme, host, port = key
+        reader, writer = await asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == "https" else None)
+        if self.stats is not None:
+            self.stats.record_connection(f"{host}:{port}")
+        return False, reader, writer
+
+    async def _read_response(self, url: str, status_line: bytes, reader: asyncio.StreamReader,
+                             sink: typing.Callable[[bytes], any] | None, timeout: asyncio.Timeout) -> tuple[HttpResponse, bool]:
+        """读状态行之后的部分，返回 (响应, 连接还能不能接着用)"""
+        version, status_code, *_ = status_line.decode("latin-1").split(None, 2)
+        headers: dict[str, str] = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        response: HttpResponse = HttpResponse(url, int(status_code), headers, None)
+        content: bytearray = bytearray()
+        streaming: bool = sink is not None and 200 <= response.status_code < 300  # 重定向和出错的 body 不能写进 sink 里
+        write: typing.Callable[[bytes], any] = sink if streaming else content.extend
+        keep_alive: bool = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while size := int((await reader.readline()).split(b";")[0], 16):
+                await self._read_exactly(reader, size, write, timeout)
+                await reader.readexactly(2)  # 块后面的 \r\n
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # trailer，用不上
+        elif "content-length" in headers:
+            await self._read_exactly(reader, int(headers["content-length"]), write, timeout)
+        else:  # 没说多长就读到连接关掉
+            while data := await reader.read(self.READ_SIZE):
+                write(data)
+                timeout.reschedule(asyncio.get_running_loop().time() + self.timeout)
+            keep_alive = False
+
+        if not streaming:
+            response.content = bytes(content)
+        return response, keep_alive
+
+    async def _read_exactly(self, reader: asyncio.StreamReader, size: int, write: typing.Callable[[bytes], any],
+                            timeout: asyncio.Timeout) -> None:
+        while size > 0:
+            if not (data := await reader.read(min(size, self.READ_SIZE))):
+                raise asyncio.IncompleteReadError(b"", size)
+            write(data)
+            size -= len(data)
+            timeout.reschedule(asyncio.get_running_loop().time() + self.timeout)  # 还在收数据就不算超时
+
+    async def close(self) -> None:
+        writers: list[asyncio.StreamWriter] = [writer for idle in self.idle_connections.values() for _, writer in idle]
+        self.idle_connections = {}
+        for writer in writers:
+            writer.close()
+        for writer in writers:
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
@@ -0,0 +1,247 @@
+"""
+    TaskQueue 的 asyncio 版：一个事件循环代替一池子工人线程，等网络的活写成协程，几千个一起下也就一个线程
+    登记表、优先级堆、前置任务、限流、自适应并发、重试、统计全是 TaskQueue 那套，只是换了个跑法
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import heapq
+import inspect
+import queue
+import threading
+import time
+import traceback
+import typing
+
+from . import task_queue
+
+
+class AsyncTaskQueue(task_queue.TaskQueue):
+    """
+    function 是协程函数的话直接在事件循环里 await，普通函数扔进一个小线程池（executor_workers 个线程），
+    "executor": "process" 的照样进进程池；max_concurrency 是同时在跑的任务数，协程不占线程，可以开得比线程数大很多
+    add_task / add_tasks 在哪个线程调都行（任务里面、线程池里面也行）；回调和钩子在事件循环线程里调，别阻塞
+    max_time 到了的协程直接取消，普通函数只能取消令牌、让它自己退，占着的那个线程池线程要等它跑完才回来
+    """
+
+    def __init__(self, max_concurrency: int, retention: str = task_queue.TaskQueue.RETENTION_ALL,
+                 result_stream: queue.Queue | None = None, rate_limits: dict[str, dict[str, float]] | None = None,
+                 adaptive_concurrency: task_queue.AdaptiveConcurrency | None = None,
+                 executor_workers: int = 8, process_workers: int | None = None) -> None:
+        super().__init__(max_concurrency, retention, result_stream, rate_limits, adaptive_concurrency,
+                         process_workers=process_workers)
+        self.executor_workers: int = executor_workers
+        self.thread_executor: concurrent.futures.ThreadPoolExecutor | None = None  # 普通函数用的，第一次用到才建
+        self.loop: asyncio.AbstractEventLoop | None = None  # run() 期间才有
+        self.idle_event: asyncio.Event | None = None
+        self.timer_handle: asyncio.TimerHandle | None = None  # 事件循环里只挂一个最早的定时器，定时器本身还是在 self.timers 里
+        self.dispatch_scheduled: bool = False
+        self.attempts: dict[task_queue._RunningTask, asyncio.Task] = {}  # 正在跑的执行 -> 对应的 asyncio.Task
+        self.loop_cleanups: list[typing.Callable[[], typing.Awaitable]] = []  # 事件循环关掉之前要 await 的，见 add_loop_cleanup
+
+    def _task_ready(self, count: int = 1) -> None:  # 需持有锁
+        if not self.running_flag or self.stop_flag or self.loop is None or self.dispatch_scheduled:
+            return
+        self.dispatch_scheduled = True
+        self.loop.call_soon_threadsafe(self._dispatch)
+
+    def _add_timer(self, when: float, kind: str, payload: any) -> None:  # 需持有锁
+        heapq.heappush(self.timers, (when, self.task_counter, kind, payload))
+        self.task_counter += 1
+        if self.loop is not None and self.timers[0][3] is payload:
+            self.loop.call_soon_threadsafe(self._arm_timer)
+
+    def _abandon_attempt(self, running: task_queue._RunningTask) -> None:  # 需持有锁，没有线程要顶替，_run_due_timers 会取消协程
+        return
+
+    def _notify_if_idle(self) -> None:  # 需持有锁
+        super()._notify_if_idle()
+        if self.idle_event is not None and (self.stop_flag or not (self.active_tasks or self.tasks or self.delayed_tasks)):
+            self.loop.call_soon_threadsafe(self.idle_event.set)
+
+    def add_loop_cleanup(self, function: typing.Callable[[], typing.Awaitable]) -> None:
+        """run() 结束、事件循环关掉之前 await function()，比如关掉协程里建的连接池"""
+        with self.lock:
+            self.loop_cleanups.append(function)
+
+    def get_thread_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self.lock:
+            if self.thread_executor is None:
+                self.thread_executor = concurrent.futures.ThreadPoolExecutor(
+                    self.executor_workers, thread_name_prefix=f"AsyncTaskQueue-{id(self)}")
+            return self.thread_executor
+
+    def run(self) -> None:
+        """在调用的线程里开一个事件循环，跑到队列空了为止"""
+        asyncio.run(self._run_loop())
+
+        if self.result_stream is not None:
+            self.result_stream.put(task_queue._STREAM_END)
+
+    async def _run_loop(self) -> None:
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            self.idle_event = asyncio.Event()
+            self.running_flag = True
+            self.dispatch_scheduled = False
+            self._notify_if_idle()  # 一开始就是空的
+        self._arm_timer()
+        self._dispatch()
+
+        while True:
+            await self.idle_event.wait()
+            with self.lock:  # set 之后可能又有别的线程塞了任务进来
+                if self.stop_flag or not (self.active_tasks or self.tasks or self.delayed_tasks):
+                    break
+                self.idle_event.clear()
+
+        if self.attempts:  # 停机的时候被取消的执行，等它们收尾
+            await asyncio.gather(*self.attempts.values(), return_exceptions=True)
+        for cleanup in self.loop_cleanups:
+            try:
+                await cleanup()
+            except Exception:
+                traceback.print_exc()
+        with self.lock:
+            self.loop_cleanups = []
+            if self.timer_handle is not None:
+                self.timer_handle.cancel()
+                self.timer_handle = None
+            self.loop = None
+            self.idle_event = None
+
+    def _dispatch(self) -> None:
+        """在事件循环线程里：从堆里按优先级拿任务开跑，直到堆空或者 max_concurrency 满了"""
+        started: list[task_queue._RunningTask] = []
+        with self.lock:
+            self.dispatch_scheduled = False
+            while not self.stop_flag and self.tasks and self.active_tasks < self.max_workers:
+                entry: tuple = heapq.heappop(self.tasks)
+                _, _, task, future = entry
+                if not self._acquire_gates(entry):
+                    continue  # 限流了，已经先放一边，接着看堆里下一个
+                if not future.running() and not future.set_running_or_notify_cancel():
+                    self._release_gates(task, refund=True)
+                    self._set_task_state(task.task_id, "cancelled")
+                    self.metrics.observe_outcome(task.category, "cancelled")
+                    self._finish_task(task.task_id)
+                    self._release_task(task.task_id)
+                    self._notify_if_idle()
+                    continue
+                self._set_task_state(task.task_id, "running")
+                started.append(self._start_attempt(task, future, 0))  # 就一个事件循环线程
+                self.active_tasks += 1
+
+        for running in started:
+            if self.metrics.hooks["on_start"]:
+                self.metrics.fire("on_start", running.task.info)
+            self.attempts[running] = self.loop.create_task(self._run_attempt(running))
+
+    async def _run_attempt(self, running: task_queue._RunningTask) -> None:
+        """跑一次任务本体，收尾和 TaskQueue._execute_task 一样：失败按 max_retries 放回堆里，出最终结果了再跑回调"""
+        task: task_queue.Task = running.task
+        kwargs: dict[str, any] = task.kwargs or {}
+        if task.cancellable:
+            kwargs = {**kwargs, "cancel_token": running.token}
+
+        result: any = None
+        error: BaseException | None = None
+        try:
+            if inspect.iscoroutinefunction(task.function):
+                result = await task.function(*task.args, **kwargs)
+            else:
+                executor: concurrent.futures.Executor = \
+                    self.get_process_pool() if task.executor == "process" else self.get_thread_executor()
+                result = await self.loop.run_in_executor(executor, functools.partial(task.function, *task.args, **kwargs))
+        except asyncio.CancelledError:
+            if running.abandoned:
+                return  # 超时被取消的，定时器那边已经记过了
+            error = task_queue.TaskCancelled("shutdown")
+            result = f"TaskCancelled: {error}"
+        except Exception as e:
+            error = e
+            result = traceback.format_exc()
+        finally:
+            self.attempts.pop(running, None)
+
+        with self.lock:
+            if running.abandoned:
+                return
+            finished: bool = self._complete_attempt(running, result, error)
+
+        try:
+            if finished:
+                self._resolve_future(running.future, result, error)
+                if self.metrics.hooks["on_finish"]:
+                    self.metrics.fire("on_finish", task.info)
+                self._run_callback(task)
+        finally:
+            with self.lock:
+                if finished:  # 还要重试的话登记表里留着，重试次数、回调都要查
+                    self._release_task(task.task_id)
+                self.active_tasks -= 1
+                self._notify_if_idle()
+            self._dispatch()  # 空出一个名额
+
+    def _arm_timer(self) -> None:
+        """在事件循环线程里：按 self.timers 里最早的点重新挂定时器"""
+        with self.lock:
+            when: float | None = self.timers[0][0] if self.timers and not self.stop_flag else None
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+        self.timer_handle = None if when is None else \
+            self.loop.call_at(self.loop.time() + max(0.0, when - time.monotonic()), self._run_due_timers)
+
+    def _run_due_timers(self) -> None:
+        """到点了：重试放回堆里、限流键放行，超时的执行取消掉，回调直接在这跑"""
+        self.timer_handle = None
+        with self.lock:
+            timed_out: list[tuple[task_queue._RunningTask, bool, task_queue.TaskTimedOut]] = \
+                self._fire_due_timers(time.monotonic())
+        self._arm_timer()
+
+        for running, finished, error in timed_out:
+            if (attempt := self.attempts.pop(running, None)) is not None:
+                attempt.cancel()  # 协程直接停，线程池里的普通函数只能靠令牌
+            if finished:
+                self._resolve_future(running.future, None, error)
+                if self.metrics.hooks["on_finish"]:
+                    self.metrics.fire("on_finish", running.task.info)
+                self._run_callback(running.task)
+                with self.lock:
+                    self._release_task(running.task.task_id)
+        if timed_out:
+            self._dispatch()
+
+    def _cancel_attempts(self) -> None:
+        for attempt in list(self.attempts.values()):
+            attempt.cancel()
+
+    def shutdown(self, cancel_pending: bool = True, timeout: float | None = None) -> bool:
+        """
+        停机，参数和 TaskQueue.shutdown 一样；正在跑的协程直接取消，线程池里的普通函数取消令牌
+        cancel_pending=False 又没有 run() 在跑的话，就在这个线程里 run() 到队列空
+        """
+        with self.lock:
+            loop: asyncio.AbstractEventLoop | None = self.loop
+        if not cancel_pending and loop is None:
+            self.run()
+        deadline: float | None = None if timeout is None else time.monotonic() + timeout
+        stopped: bool = super().shutdown(cancel_pending, timeout)
+
+        with self.lock:
+            loop = self.loop
+            executor, self.thread_executor = self.thread_executor, None
+            if loop is not None:
+                loop.call_soon_threadsafe(self._cancel_attempts)
+                self._notify_if_idle()
+        if executor is None:
+            return stopped
+        executor.shutdown(wait=False, cancel_futures=True)
+        # 在线程池里面停机的话不能等自己
+        threads: list[threading.Thread] = [thread for thread in threading.enumerate() if thread is not threading.current_thread()
+                                           and thread.name.startswith(f"AsyncTaskQueue-{id(self)}_")]
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return stopped and not any(thread.is_alive() for thread in threads)
@@ -15,6 +15,43 @@ class GraniteSettings:
         self.current_version: str = getattr(settings, "current_version", None)  # 当前选择的 Minecraft 版本
         self.working_path: pathlib.Path = getattr(settings, "working_path", pathlib.Path.cwd() / ".minecraft")
         self.max_workers: int = getattr(settings, "max_workers", 128)  # 最大线程数
+        self.result_retention: str = getattr(settings, "result_retention", "callback")  # 任务结果保留策略，见 TaskQueue.RETENTION_*
+        # 按域名限流：rate 每秒请求数，burst 突发容量，max_in_flight 同时在下的最大数量，见 TaskQueue.set_rate_limit
+        # 自适应并发（AIMD）：按延迟、错误率和 429 / 503 自动调下载并发，上限是 max_workers
+        self.adaptive_concurrency: bool = getattr(settings, "adaptive_concurrency", False)
+        self.rate_limits: dict[str, dict[str, float]] = getattr(settings, "rate_limits", {
+            "piston-data.mojang.com": {"max_in_flight": 8},
+            "launcher.mojang.com": {"max_in_flight": 8},
+            "libraries.minecraft.net": {"rate": 100, "burst": 20, "max_in_flight": 32},
+            "resources.download.minecraft.net": {"rate": 200, "burst": 50, "max_in_flight": 64},
+            "bmclapi2.bangbang93.com": {"rate": 50, "burst": 20, "max_in_flight": 32},  # BMCLAPI 比较容易 429
+        })
+        # 小资源文件合批：小于 asset_batch_threshold 字节的资源文件按索引里的 size 凑成一批，一个任务用同一条连接顺序下完
+        # 一批凑够 asset_batch_bytes 字节或者 asset_batch_max_count 个就封口，threshold 设 0 关掉合批
+        self.asset_batch_threshold: int = getattr(settings, "asset_batch_threshold", 65536)
+        self.asset_batch_bytes: int = getattr(settings, "asset_batch_bytes", 1048576)
+        self.asset_batch_max_count: int = getattr(settings, "asset_batch_max_count", 64)
+        # 校验 SHA1 之类吃 CPU 的活用几个子进程，默认留一个核给主进程，0 就是不开进程池，在线程里算
+        self.process_workers: int = getattr(settings, "process_workers", (os.cpu_count() or 1) - 1)
+        # 下载引擎："thread" 是一个下载一个线程（最多 max_workers 个）；"asyncio" 是一个事件循环带所有下载，
+        # 同时在下的还是最多 max_workers 个，但只用几个线程，这时小资源文件也不用再合批了
+        self.download_engine: str = getattr(settings, "download_engine", "thread")
+        # 资源对象库的位置，None 就是 working_path / "assets" / "objects"；指到同一个地方的话几个游戏目录共用一份资源，
+        # 各自的 assets 下面全是硬链接（跨盘的话 reflink 或者复制）
+        self.asset_store_path: pathlib.Path | None = getattr(settings, "asset_store_path", None)
+        # 分段下载：主文件、支持库、资源文件里不小于 segment_threshold 字节的拆成几段，最多 segment_max_count 条连接一起下，
+        # 每段多大按测出来的速度自己调；threshold 设 0 的话只有主文件分段
+        self.segment_threshold: int = getattr(settings, "segment_threshold", 4194304)
+        self.segment_max_count: int = getattr(settings, "segment_max_count", 8)
+        # 断点续传：不分段但不小于 resume_threshold 字节的支持库、资源文件也下进 .part，进程挂了或者断线重试只补没下的部分，0 关掉
+        self.resume_threshold: int = getattr(settings, "resume_threshold", 1048576)
+        # 深度校验：不信校验索引和安装日志，磁盘上已有的文件全部重新算 SHA1，怀疑文件被悄悄改坏了的时候开
+        self.deep_verify: bool = getattr(settings, "deep_verify", False)
+        # 元数据缓存（放在 temp_path / "metadata_cache"，几个游戏目录、几个进程共用）：版本清单和版本 JSON 拿到不到
+        # metadata_cache_ttl 秒的直接用，过期了带 ETag / Last-Modified 问服务器有没有变；资源索引有 SHA1，对得上就一直用
+        # offline 的话元数据只从缓存拿，缓存里没有就装不了
+        self.metadata_cache_ttl: int = getattr(settings, "metadata_cache_ttl", 600)
+        self.offline: bool = getattr(settings, "offline", False)
         self.temp_path: pathlib.Path = getattr(settings, "temp_path",
                                                pathlib.Path(os.environ.get("TEMP", pathlib.Path.cwd())) / "Granite" / "temp")  # 缓存路径
 
@@ -26,6 +63,21 @@ class GraniteSettings:
             "current_version": self.current_version,
             "working_path": self.working_path,
             "max_workers": self.max_workers,
+            "result_retention": self.result_retention,
+            "adaptive_concurrency": self.adaptive_concurrency,
+            "rate_limits": self.rate_limits,
+            "asset_batch_threshold": self.asset_batch_threshold,
+            "asset_batch_bytes": self.asset_batch_bytes,
+            "asset_batch_max_count": self.asset_batch_max_count,
+            "process_workers": self.process_workers,
+            "download_engine": self.download_engine,
+            "asset_store_path": self.asset_store_path,
+            "segment_threshold": self.segment_threshold,
+            "segment_max_count": self.segment_max_count,
+            "resume_threshold": self.resume_threshold,
+            "deep_verify": self.deep_verify,
+            "metadata_cache_ttl": self.metadata_cache_ttl,
+            "offline": self.offline,
             "temp_path": self.temp_path,
         }
         with open("settings.json", "w") as file:
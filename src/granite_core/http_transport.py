@@ -0,0 +1,129 @@
+"""
+    安装器的 HTTP 都走这：一个 requests.Session，http 和 https 挂同一个按域名分的连接池，重试策略、超时、默认请求头、验不验证书都在这定；
+    asyncio 引擎的 AsyncHttpClient 也从这建，参数一样
+    顺便按域名数发了多少请求、新建了多少条连接，看长连接到底复用上了没有
+"""
+
+import threading
+
+import requests
+import requests.adapters
+import urllib3
+
+from . import async_http
+
+
+class ConnectionStats:
+    """域名:端口 -> [请求数, 新建连接数]；请求数按真发出去的算，urllib3 自己重试的也算一次；线程和事件循环里都能记"""
+
+    def __init__(self) -> None:
+        self.lock: threading.Lock = threading.Lock()
+        self.hosts: dict[str, list[int]] = {}
+
+    def record_request(self, host: str) -> None:
+        with self.lock:
+            self.hosts.setdefault(host, [0, 0])[0] += 1
+
+    def record_connection(self, host: str) -> None:
+        with self.lock:
+            self.hosts.setdefault(host, [0, 0])[1] += 1
+
+    def snapshot(self) -> dict[str, any]:
+        """总的和每个域名的 requests / connections / reused（用的是已有连接的请求数）/ reuse_ratio"""
+        with self.lock:
+            hosts: dict[str, list[int]] = {host: list(counts) for host, counts in self.hosts.items()}
+        total: list[int] = [sum(counts[0] for counts in hosts.values()), sum(counts[1] for counts in hosts.values())]
+        return {**self._summarize(*total), "hosts": {host: self._summarize(*counts) for host, counts in hosts.items()}}
+
+    @staticmethod
+    def _summarize(requests_sent: int, connections: int) -> dict[str, any]:
+        reused: int = max(requests_sent - connections, 0)
+        return {"requests": requests_sent, "connections": connections, "reused": reused,
+                "reuse_ratio": reused / requests_sent if requests_sent else 0.0}
+
+
+def _make_counting_pool(base: type, stats: ConnectionStats) -> type:
+    """urllib3 的连接池类套一层，发请求、建连接的时候记一笔"""
+
+    class CountingConnectionPool(base):
+        def urlopen(self, *args, **kwargs):
+            stats.record_request(f"{self.host}:{self.port}")
+            return super().urlopen(*args, **kwargs)
+
+        def _new_conn(self):
+            stats.record_connection(f"{self.host}:{self.port}")
+            return super()._new_conn()
+
+    return CountingConnectionPool
+
+
+class _CountingAdapter(requests.adapters.HTTPAdapter):
+    def __init__(self, stats: ConnectionStats, **kwargs) -> None:
+        self.stats: ConnectionStats = stats  # 父类 __init__ 里就会建 poolmanager，得先设
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _make_counting_pool(urllib3.HTTPConnectionPool, self.stats),
+            "https": _make_counting_pool(urllib3.HTTPSConnectionPool, self.stats),
+        }
+
+
+class HttpTransport:
+    """
+    max_connections_per_host: 每个域名的连接池留几条长连接（同时在下的再多的话用完就关，urllib3 会打 "Connection pool is full"）
+    max_hosts: 最多同时留几个域名的连接池
+    timeout: 默认的连接 / 两次收到数据之间的超时（秒），单个请求可以另给
+    retries: 连不上、429 / 5xx 这些 urllib3 自己退避重试几次，还不行抛 requests.exceptions.RetryError；asyncio 引擎的客户端照一样的规矩重试
+    verify: 验不验 SSL 证书，下载的文件都有 SHA1，默认不验
+    """
+    USER_AGENT: str = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+    RETRY_STATUS: tuple[int, ...] = (403, 429, 500, 502, 503, 504, 567)
+    BACKOFF_FACTOR: float = 0.5
+
+    def __init__(self, max_connections_per_host: int, max_hosts: int = 16, timeout: float = 30, retries: int = 3,
+                 verify: bool = False) -> None:
+        if not verify:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)  # 把 SSL 验证禁了，拖慢速度不说，报错率直线上涨
+        self.max_connections_per_host: int = max_connections_per_host
+        self.timeout: float = timeout
+        self.retries: int = retries
+        self.verify: bool = verify
+        self.stats: ConnectionStats = ConnectionStats()
+        self.session: requests.Session = requests.Session()
+        self.session.headers["User-Agent"] = self.USER_AGENT
+        adapter: _CountingAdapter = _CountingAdapter(
+            self.stats,
+            pool_connections=max_hosts,
+            pool_maxsize=max_connections_per_host,
+            max_retries=urllib3.util.Retry(total=retries, backoff_factor=self.BACKOFF_FACTOR, status_forcelist=self.RETRY_STATUS)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url: str, headers: dict[str, str] | None = None, timeout: float | None = None, stream: bool = False) -> requests.Response:
+        """
+        GET，状态码 >= 400 的抛 requests.HTTPError（响应关掉，连接回池子）
+        stream=True 的要用 with 包着，body 收完或者关掉了连接才回池子
+        """
+        response: requests.Response = self.session.get(url, headers=headers, timeout=timeout or self.timeout, verify=self.verify,
+                                                        stream=stream)
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+
+    def create_async_client(self) -> async_http.AsyncHttpClient:
+        """asyncio 引擎用的客户端：一样的每域名连接数、超时、请求头和重试策略，连接也记进 self.stats；要在事件循环里建、用完 await close()"""
+        return async_http.AsyncHttpClient(self.max_connections_per_host, timeout=self.timeout, verify=self.verify,
+                                          headers={"User-Agent": self.USER_AGENT}, stats=self.stats,
+                                          retries=self.retries, retry_status=self.RETRY_STATUS, backoff_factor=self.BACKOFF_FACTOR)
+
+    def get_stats(self) -> dict[str, any]:
+        return self.stats.snapshot()
+
+    def close(self) -> None:
+        self.session.close()
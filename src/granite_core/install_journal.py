@@ -0,0 +1,91 @@
+"""
+    安装日志：只追加的 JSON Lines，装到一半进程挂了，下次照着日志接着装，做完的不再做一遍
+"""
+
+import json
+import os
+import pathlib
+import threading
+
+
+class InstallJournal:
+    """
+    一次安装一个日志文件，每行一条记录：
+    {"type": "step", "name": ...}：安装步骤做完了（比如版本元数据已经存到本地）
+    {"type": "file", "path": ..., "sha1": ..., "size": ..., "mtime_ns": ...}：文件已经下好 / 校验过，
+    下次只要大小和修改时间对得上就不用再算 SHA1
+    {"type": "forget", "path": ...}：之前记的这个文件不算数了（深度校验发现内容不对）
+    下到一半的 .part 文件不记在这，写完了哪些块记在它旁边的 .part.json 里，见 minecraft_installer.RangedFileWriter
+    每条写完就 flush，进程挂了最多丢最后半行，读的时候跳过
+    """
+
+    def __init__(self, journal_path: pathlib.Path) -> None:
+        self.journal_path: pathlib.Path = journal_path
+        self.lock: threading.Lock = threading.Lock()
+        self.steps: set[str] = set()
+        self.files: dict[str, tuple[str, int, int]] = {}  # 路径 -> (sha1, size, mtime_ns)
+        torn: bool = self._load()
+        os.makedirs(journal_path.parent, exist_ok=True)
+        self.journal_file = open(journal_path, "a", encoding="utf-8")
+        if torn:
+            self.journal_file.write("\n")  # 上次写了半行，先换行，别把新记录接在半行后面
+
+    def _load(self) -> bool:
+        """读已有的日志，返回最后一行是不是写了一半"""
+        if not self.journal_path.exists():
+            return False
+        with open(self.journal_path, "r", encoding="utf-8", errors="replace") as f:
+            content: str = f.read()
+        for line in content.splitlines():
+            try:
+                record: dict = json.loads(line)
+            except ValueError:
+                continue  # 写了一半的行
+            if record.get("type") == "step":
+                self.steps.add(record["name"])
+            elif record.get("type") == "file":
+                self.files[record["path"]] = (record["sha1"], record["size"], record["mtime_ns"])
+            elif record.get("type") == "forget":
+                self.files.pop(record["path"], None)
+        return bool(content) and not content.endswith("\n")
+
+    def _append(self, record: dict) -> None:  # 需持有锁
+        self.journal_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.journal_file.flush()
+
+    def record_step(self, name: str) -> None:
+        with self.lock:
+            self.steps.add(name)
+            self._append({"type": "step", "name": name})
+
+    def is_step_done(self, name: str) -> bool:
+        return name in self.steps
+
+    def record_file(self, path: pathlib.Path, sha1: str) -> os.stat_result:
+        stat: os.stat_result = os.stat(path)
+        with self.lock:
+            self.files[str(path)] = (sha1, stat.st_size, stat.st_mtime_ns)
+            self._append({"type": "file", "path": str(path), "sha1": sha1, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        return stat
+
+    def forget_file(self, path: pathlib.Path) -> None:
+        with self.lock:
+            if self.files.pop(str(path), None) is not None:
+                self._append({"type": "forget", "path": str(path)})
+
+    def is_file_done(self, path: pathlib.Path, sha1: str) -> bool:
+        """日志里有这个文件、散列值对得上，而且之后没被动过"""
+        if (entry := self.files.get(str(path))) is None or entry[0] != sha1:
+            return False
+        try:
+            stat: os.stat_result = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == entry[1:]
+
+    def close(self, remove: bool = False) -> None:
+        """remove=True：装完了，日志没用了，删掉"""
+        with self.lock:
+            self.journal_file.close()
+            if remove:
+                self.journal_path.unlink(missing_ok=True)
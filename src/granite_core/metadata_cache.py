@@ -0,0 +1,116 @@
+"""
+    元数据（版本清单、版本 JSON、资源索引）的磁盘缓存：几个安装器、几个进程共用一个目录，
+    没过期的直接用，过期了带 If-None-Match / If-Modified-Since 问一下服务器，304 就接着用；离线模式只从缓存拿
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+
+import requests
+
+from . import http_transport
+
+
+class MetadataUnavailable(Exception):
+    """离线模式下缓存里没有，或者网络不通、缓存里也没有"""
+
+
+class MetadataHashMismatch(MetadataUnavailable):
+    """给了 sha1，缓存里和刚下下来的都对不上"""
+
+
+class MetadataCache:
+    """
+    一个地址一个文件，文件名是地址的 SHA1：第一行是 JSON 头（url、etag、last_modified、fetched_at），后面是原样的响应体
+    整个文件先写临时文件再原子地替换，别的进程读到的要么是旧的要么是新的；几个进程同时过期一起去问也没关系，谁写的都一样
+    get() 给了 sha1 的话（资源索引这种内容由散列值定下来的）缓存里的内容对得上就一直能用，不用问服务器
+    网络出错的时候缓存里有（哪怕过期了）就先用着，记一笔 stale
+    """
+
+    def __init__(self, cache_dir: pathlib.Path, transport: http_transport.HttpTransport, offline: bool = False) -> None:
+        self.cache_dir: pathlib.Path = cache_dir
+        self.transport: http_transport.HttpTransport = transport
+        self.offline: bool = offline
+        self.lock: threading.Lock = threading.Lock()
+        self.stats: dict[str, int] = {"fresh": 0, "revalidated": 0, "downloaded": 0, "stale": 0}
+
+    def get_path(self, url: str) -> pathlib.Path:
+        return self.cache_dir / hashlib.sha1(url.encode()).hexdigest()
+
+    def get(self, url: str, ttl: float = 0, sha1: str | None = None, timeout: float | None = None) -> bytes:
+        """
+        url 的内容，缓存里没过期（拿到不到 ttl 秒）的直接给
+        :param sha1: 内容应有的 SHA1，缓存对得上就不过期，下下来也对不上的抛 MetadataHashMismatch，不进缓存
+        """
+        header, body = self._load(url)
+        if body is not None and sha1 is not None and hashlib.sha1(body).hexdigest() != sha1:
+            header, body = None, None  # 缓存里的是旧的那份
+        if body is not None and (self.offline or sha1 is not None or time.time() - header["fetched_at"] < ttl):
+            self._count("fresh")
+            return body
+        if self.offline:
+            raise MetadataUnavailable(f"{url} is not cached (offline mode)")
+
+        headers: dict[str, str] = {}
+        if body is not None and header.get("etag"):
+            headers["If-None-Match"] = header["etag"]
+        if body is not None and header.get("last_modified"):
+            headers["If-Modified-Since"] = header["last_modified"]
+        try:
+            response: requests.Response = self.transport.get(url, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            if body is None:
+                raise MetadataUnavailable(f"{url} is not cached and the request failed: {e}") from e
+            logging.error(f"[MetadataCache]: 请求 {url} 失败，先用缓存里过期的: {e}")
+            self._count("stale")
+            return body
+
+        if response.status_code == 304 and body is not None:
+            self._count("revalidated")
+        else:
+            body = response.content
+            self._count("downloaded")
+            if sha1 is not None and hashlib.sha1(body).hexdigest() != sha1:
+                raise MetadataHashMismatch(f"{url} does not match SHA1 {sha1}")
+        self._save(url, {
+            "url": url,
+            "etag": response.headers.get("ETag") or (header or {}).get("etag"),
+            "last_modified": response.headers.get("Last-Modified") or (header or {}).get("last_modified"),
+            "fetched_at": time.time()
+        }, body)
+        return body
+
+    def _load(self, url: str) -> tuple[dict | None, bytes | None]:
+        try:
+            with open(self.get_path(url), "rb") as f:
+                header: dict = json.loads(f.readline())
+                body: bytes = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if not isinstance(header, dict) or header.get("url") != url:
+            return None, None
+        return header, body
+
+    def _save(self, url: str, header: dict, body: bytes) -> None:
+        path: pathlib.Path = self.get_path(url)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path: pathlib.Path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(json.dumps(header, ensure_ascii=False).encode() + b"\n")
+            f.write(body)
+        os.replace(temp_path, path)
+
+    def _count(self, outcome: str) -> None:
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def invalidate(self, url: str | None = None) -> None:
+        """删掉一个地址的缓存，不给就全删"""
+        paths: list[pathlib.Path] = [self.get_path(url)] if url is not None else list(self.cache_dir.glob("*"))
+        for path in paths:
+            path.unlink(missing_ok=True)
@@ -1,3 +1,7 @@
+import asyncio
+import bisect
+import concurrent.futures
+import functools
 import hashlib
 import json
 import os
@@ -5,21 +9,396 @@ import pathlib
 import logging
 import threading
 import time
-import shutil
+import tempfile
 import typing
+import urllib.parse
 
-import requests.adapters
-import urllib3
+import requests
 
+from . import async_http
+from . import async_task_queue
 from . import granite_settings
+from . import http_transport
+from . import install_journal
+from . import metadata_cache
+from . import object_store
 from . import task_queue
+from . import verify_index
 
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s][%(levelname)s]%(message)s', encoding="utf-8")
 
 
+class FileHashMismatch(Exception):
+    """下下来的文件 SHA1 对不上，抛给队列重试"""
+
+
+class RangeNotSupported(Exception):
+    """要了一段，服务器却回了整个文件（200），这个域名以后不分段了"""
+
+
+class RemoteFileChanged(Exception):
+    """接着下 .part 的时候发现远端文件的 ETag / Last-Modified 和上次不一样了，.part 作废，抛给队列从头重试"""
+
+
+class VerifiedFileWriter:
+    """
+    边收边写边算 SHA1，一遍过：每块数据同时写进每个目标旁边的临时文件，commit() 时散列值对得上才原子地改名成正式文件，
+    对不上或者中途出错（with 块里抛异常）临时文件全删掉，正式文件不会出现写了一半的
+    sha1 给 None 就是不校验
+    """
+
+    def __init__(self, targets: typing.Sequence[pathlib.Path], sha1: str | None) -> None:
+        self.targets: typing.Sequence[pathlib.Path] = targets
+        self.sha1: str | None = sha1
+        self.hasher = hashlib.sha1()
+        self.temp_files: list[tuple[str, typing.BinaryIO]] = []
+        try:
+            for target in targets:
+                os.makedirs(target.parent, exist_ok=True)
+                # 同一个散列的资源可能有好几个任务在同时下，临时文件名不能撞
+                fd, temp_path = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=target.parent)
+                self.temp_files.append((temp_path, os.fdopen(fd, "wb")))
+        except BaseException:
+            self.abort()
+            raise
+
+    def __enter__(self) -> "VerifiedFileWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.abort()  # commit() 过了的话什么都不用删
+
+    def write(self, data: bytes) -> None:
+        self.hasher.update(data)
+        for _, f in self.temp_files:
+            f.write(data)
+
+    def commit(self) -> None:
+        for _, f in self.temp_files:
+            f.close()
+        if self.sha1 is not None and (digest := self.hasher.hexdigest()) != self.sha1:
+            self.abort()
+            raise FileHashMismatch(f"SHA1 mismatch for {self.targets[0]}: got {digest}, expected {self.sha1}")
+        for (temp_path, _), target in zip(self.temp_files, self.targets):
+            os.replace(temp_path, target)
+        self.temp_files = []
+
+    def abort(self) -> None:
+        for temp_path, f in self.temp_files:
+            f.close()
+            pathlib.Path(temp_path).unlink(missing_ok=True)
+        self.temp_files = []
+
+
+class RangedFileWriter:
+    """
+    分块下载直接写进一个预先分配好大小的文件：每块按偏移量用 pwrite 写到自己的位置，不用一块一个临时文件再拼起来
+    写在目标旁边的 .part 文件里，commit() 时散列值对得上才原子地改名成正式文件
+    哪块写完了 complete_range() 报一声，从头开始连续写完的部分马上接着算 SHA1（从页缓存里读回来，一次 1 MiB），
+    所以最后一块下完的时候整个文件差不多也算完了
+    .part 旁边还有个 .part.json：地址、大小、SHA1、服务器给的 ETag / Last-Modified 和写完了的块，
+    报块的时候最多 META_SAVE_INTERVAL 秒重写一次，close() 的时候补上最后的；进程挂了重启，大小和 SHA1 对得上的话接着用，
+    没写完的部分再去要，见 resumed；接着下之前先用 check_validator() 确认远端文件没换
+    没有 pwrite / pread 的平台（Windows）退回加锁 lseek 再读写
+    """
+    HASH_READ_SIZE: int = 1048576
+    META_SAVE_INTERVAL: float = 0.5
+
+    def __init__(self, target: pathlib.Path, size: int, sha1: str | None, url: str | None = None) -> None:
+        self.target: pathlib.Path = target
+        self.part_path: pathlib.Path = self.get_part_path(target)
+        self.meta_path: pathlib.Path = self.part_path.with_name(f"{self.part_path.name}.json")
+        self.size: int = size
+        self.sha1: str | None = sha1
+        self.url: str | None = url
+        self.validator: str | None = None  # 远端文件的 ETag（没有就 Last-Modified）
+        self.hasher = hashlib.sha1()
+        self.hashed: int = 0  # [0, hashed) 已经算进 SHA1 了
+        self.completed: dict[int, int] = {}  # 写完的块 start -> end
+        self.meta_saved_at: float = 0  # .part.json 上次写的时候，time.monotonic()
+        self.meta_dirty: bool = False
+        self.lock: threading.Lock = threading.Lock()
+        self.hash_lock: threading.Lock = threading.Lock()
+        self.seek_lock: threading.Lock = threading.Lock()  # 只有退回 lseek 的时候用
+
+        os.makedirs(target.parent, exist_ok=True)
+        meta: dict | None = self._load_meta()
+        self.resumed: bool = meta is not None and self.part_path.exists() and os.path.getsize(self.part_path) == size
+        self.validated: bool = not self.resumed  # 接着下的话第一个响应要先对一下 validator
+        self.fd: int = os.open(self.part_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        if self.resumed:
+            self.completed.update((start, end) for start, end in meta["ranges"] if 0 <= start <= end < size)
+            if meta.get("url") == url:  # 换了下载源的话 validator 是别的服务器给的，比不了，只能靠最后的 SHA1
+                self.validator = meta.get("validator")
+        else:
+            os.ftruncate(self.fd, 0)
+            self._preallocate()
+            self._save_meta()
+
+    @staticmethod
+    def get_part_path(target: pathlib.Path) -> pathlib.Path:
+        return target.parent / f".{target.name}.part"
+
+    def _load_meta(self) -> dict | None:
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta: dict = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(meta, dict) or meta.get("size") != self.size or meta.get("sha1") != self.sha1 or not meta.get("ranges"):
+            return None
+        return meta
+
+    def _save_meta(self) -> None:  # 需持有 self.lock（构造的时候除外）
+        ranges: list[list[int]] = []
+        for start, end in sorted(self.completed.items()):  # 连着的块并成一条，文件小一点
+            if ranges and ranges[-1][1] + 1 == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        temp_path: pathlib.Path = self.meta_path.with_name(f"{self.meta_path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"url": self.url, "size": self.size, "sha1": self.sha1, "validator": self.validator, "ranges": ranges}, f)
+        os.replace(temp_path, self.meta_path)
+        self.meta_saved_at, self.meta_dirty = time.monotonic(), False
+
+    def _preallocate(self) -> None:
+        """先把空间占上，写的时候不用一点点扩文件，也不会写到一半磁盘满了"""
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self.fd, 0, self.size)
+                return
+            except OSError:
+                pass  # 有的文件系统不支持，退回稀疏文件
+        os.ftruncate(self.fd, self.size)
+
+    def __enter__(self) -> "RangedFileWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def check_validator(self, validator: str | None) -> bool:
+        """
+        响应里的 ETag / Last-Modified；接着上次的 .part 下的话第一个响应得和上次记的一样，不一样就是远端文件换了，返回 False
+        之后的不再比：镜像后面好几台机器 ETag 各不相同也很正常，内容对不对最后还有 SHA1
+        """
+        with self.lock:
+            if not self.validated:
+                if self.validator is not None and validator is not None and validator != self.validator:
+                    return False
+                self.validated = True
+            if self.validator is None and validator is not None:
+                self.validator = validator
+                self._save_meta()
+            return True
+
+    def get_if_range(self) -> str | None:
+        """接着下的请求带上 If-Range，远端文件换了的话服务器直接回整个文件（200）；弱 ETag 不能用在 If-Range 里"""
+        if self.validated or self.validator is None or self.validator.startswith("W/"):
+            return None
+        return self.validator
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        view: memoryview = memoryview(data)
+        while view:
+            if hasattr(os, "pwrite"):
+                written: int = os.pwrite(self.fd, view, offset)
+            else:
+                with self.seek_lock:
+                    os.lseek(self.fd, offset, os.SEEK_SET)
+                    written = os.write(self.fd, view)
+            view, offset = view[written:], offset + written
+
+    def _read_at(self, offset: int, size: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, size, offset)
+        with self.seek_lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, size)
+
+    def complete_range(self, start: int, end: int) -> None:
+        """[start, end] 这块写完了，记进 .part.json，能接上的话顺便往后算 SHA1"""
+        with self.lock:
+            self.completed[start] = end
+            self.meta_dirty = True
+            if time.monotonic() - self.meta_saved_at >= self.META_SAVE_INTERVAL:
+                self._save_meta()
+        self._advance_hash()
+
+    def _advance_hash(self) -> None:
+        while self.hash_lock.acquire(blocking=False):  # 别的线程在算的话它会接着算到这块
+            try:
+                while (end := self.completed.get(self.hashed)) is not None:
+                    while self.hashed <= end:
+                        data: bytes = self._read_at(self.hashed, min(self.HASH_READ_SIZE, end + 1 - self.hashed))
+                        if not data:
+                            raise OSError(f"{self.part_path} is shorter than expected")
+                        self.hasher.update(data)
+                        self.hashed += len(data)
+            finally:
+                self.hash_lock.release()
+            if self.completed.get(self.hashed) is None:  # 放锁之前刚好有块写完的话再来一轮
+                return
+
+    def commit(self) -> None:
+        """所有块都写完了才能调；散列值对不上的话 .part 文件删掉，抛 FileHashMismatch"""
+        with self.hash_lock:
+            pass  # 等正在算的线程算完
+        self._advance_hash()
+        if self.hashed != self.size:
+            raise RuntimeError(f"{self.part_path} is incomplete: {self.hashed} / {self.size} bytes hashed")
+        if self.sha1 is not None and (digest := self.hasher.hexdigest()) != self.sha1:
+            self.discard()
+            raise FileHashMismatch(f"SHA1 mismatch for {self.target}: got {digest}, expected {self.sha1}")
+        self.meta_dirty = False  # 马上就删了，不用再写
+        self.close()
+        os.replace(self.part_path, self.target)
+        self.meta_path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        """.part 文件留着，下次接着下"""
+        with self.lock:
+            if self.meta_dirty:
+                self._save_meta()
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def discard(self) -> None:
+        """.part 不要了（散列值不对、远端文件换了、退回了整个文件下），连 .part.json 一起删"""
+        self.meta_dirty = False
+        self.close()
+        self.part_path.unlink(missing_ok=True)
+        self.meta_path.unlink(missing_ok=True)
+
+
+class SegmentedDownload:
+    """
+    一个大文件分段并行下：几条 lane（队列里的任务）轮流从 gaps 里领下一段，段多大按这个域名测出来的速度现算，
+    每段按偏移量写进同一个 RangedFileWriter，最后一段写完的那条 lane 负责 commit
+    服务器不认 Range 的话 fallback 置上，lane 不再领段，由其中一条退回整个文件一个流下
+    所有 lane 都出了最终结果之后调一次 on_settled(self)，finished 说明成没成
+    上次的 .part 已经写满了（写完最后一段还没 commit 进程就挂了）的话没段可领，第一条 lane 直接 commit，见 claim_commit()
+    """
+
+    def __init__(self, url: str, target: pathlib.Path, sha1: str | None, size: int, rate_key: str | None,
+                 on_settled: typing.Callable | None = None) -> None:
+        self.url: str = url
+        self.target: pathlib.Path = target
+        self.sha1: str | None = sha1
+        self.size: int = size
+        self.rate_key: str | None = rate_key
+        self.on_settled: typing.Callable | None = on_settled
+        self.writer: RangedFileWriter | None = None  # 第一条 lane 开跑的时候才建，不然排着队的大文件全占着文件描述符
+        self.gaps: list[list[int]] = [[0, size - 1]]  # 还没人领的段，按起点排好
+        self.completed_bytes: int = 0
+        self.lanes: int = 0
+        self.settled_lanes: int = 0
+        self.retries: int = 0
+        self.fallback: bool = False
+        self.fallback_claimed: bool = False
+        self.commit_pending: bool = False  # open() 的时候 .part 已经写满了，等一条 lane 来 commit
+        self.finished: bool = False
+        self.lock: threading.Lock = threading.Lock()
+
+    def open(self) -> None:
+        """建 writer，.part 文件接得上的话上次写完的部分不用再领"""
+        with self.lock:
+            if self.writer is not None:
+                return
+            self.writer = RangedFileWriter(self.target, self.size, self.sha1, self.url)
+            self.gaps, cursor = [], 0
+            for start, end in sorted(self.writer.completed.items()):
+                if start > cursor:
+                    self.gaps.append([cursor, start - 1])
+                cursor = max(cursor, end + 1)
+                self.completed_bytes += end - start + 1
+            if cursor < self.size:
+                self.gaps.append([cursor, self.size - 1])
+            self.commit_pending = self.completed_bytes == self.size
+
+    def claim_commit(self) -> bool:
+        """.part 一打开就是满的，commit 的活只给一条 lane"""
+        with self.lock:
+            if not self.commit_pending or self.finished:
+                return False
+            self.commit_pending = False
+            return True
+
+    def claim(self, segment_size: int) -> tuple[int, int] | None:
+        with self.lock:
+            if self.fallback or not self.gaps:
+                return None
+            gap: list[int] = self.gaps[0]
+            end: int = min(gap[0] + segment_size - 1, gap[1])
+            segment: tuple[int, int] = (gap[0], end)
+            if end == gap[1]:
+                self.gaps.pop(0)
+            else:
+                gap[0] = end + 1
+            return segment
+
+    def release(self, start: int, end: int, writer: RangedFileWriter) -> None:
+        """这段没下成，放回去给别的 lane（或者重试的自己）领；领的时候的 writer 已经被 reset 换掉了的话不用放"""
+        with self.lock:
+            if writer is self.writer:
+                bisect.insort(self.gaps, [start, end])
+
+    def complete(self, start: int, end: int, writer: RangedFileWriter) -> bool:
+        """这段写完了，返回是不是整个文件都写完了（先报给 writer 再记数，记满的那条 lane commit 的时候别的段肯定都报过了）"""
+        if writer is not self.writer:
+            return False
+        writer.complete_range(start, end)
+        with self.lock:
+            if writer is not self.writer:
+                return False
+            self.completed_bytes += end - start + 1
+            return self.completed_bytes == self.size
+
+    def start_fallback(self) -> None:
+        with self.lock:
+            self.fallback = True
+
+    def claim_fallback(self) -> bool:
+        """退回整个文件下的活只给一条 lane"""
+        with self.lock:
+            if not self.fallback or self.fallback_claimed or self.finished:
+                return False
+            self.fallback_claimed = True
+            return True
+
+    def reset(self) -> None:
+        """散列值不对、远端文件换了或者 commit 失败了，换个 writer 重来；.part 还在的话下次 open() 接着用"""
+        with self.lock:
+            self.writer = None
+            self.gaps = [[0, self.size - 1]]
+            self.completed_bytes = 0
+            self.commit_pending = False
+
+    def settle(self) -> bool:
+        """一条 lane 出了最终结果，返回是不是最后一条"""
+        with self.lock:
+            self.settled_lanes += 1
+            if self.settled_lanes != self.lanes:
+                return False
+        if self.writer is not None:
+            self.writer.close()  # 没下完的话 .part 留着下次接着下
+        return True
+
+
 class MinecraftInstaller:
+    ASYNC_BUFFER_SIZE: int = 1048576  # asyncio 引擎下，比这小的文件收完再写，见 _regular_download_async
+    VERIFY_BATCH_SIZE: int = 32  # verify() 一次丢给一个工作进程 / 线程的文件数
+    # 分段下载一段的大小：还没测过速度的域名先 4 MiB 一段，测过了按一条连接大概下 SEGMENT_TARGET_SECONDS 秒算
+    SEGMENT_INITIAL_SIZE: int = 4194304
+    SEGMENT_MIN_SIZE: int = 1048576
+    SEGMENT_MAX_SIZE: int = 16777216
+    SEGMENT_TARGET_SECONDS: float = 2.0
+    SEGMENT_MAX_TIME: float = 120  # 一段两分钟还没下完就是镜像卡住了，放回去重新领
+    RANGE_CHECKPOINT_SIZE: int = 4194304  # 一段里每收这么多报一次收到的部分，进程被杀了最多白下这么多（断线之类的异常不受这个限制，收到多少报多少）
+
     def __init__(self, settings: granite_settings.GraniteSettings, install_version: str, download_source: str) -> None:
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)  # 把 SSL 验证禁了，下载文件用不着，拖慢速度不说，报错率直线上涨
         self.install_running_flag: bool = True
         self.settings = settings
         self.install_version: str = install_version
@@ -35,21 +414,24 @@ class MinecraftInstaller:
         }
 
         # 下载中使用
-        # 连接池啊这个是
-        self.session = requests.Session()
-        retry_strategy = urllib3.util.Retry(
-            total=3,
-            backoff_factor=0.5,
-            status_forcelist=[403, 429, 500, 502, 503, 504, 567],
+        # 连接池啊这个是：清单、元数据、资源索引、分段和整个文件的下载全走它，连接复用得怎么样见 self.transport.get_stats()
+        self.transport: http_transport.HttpTransport = http_transport.HttpTransport(self.settings.max_workers)
+        # 版本清单、版本 JSON、资源索引先看缓存，见 MetadataCache
+        self.metadata_cache: metadata_cache.MetadataCache = metadata_cache.MetadataCache(
+            self.settings.temp_path / "metadata_cache", self.transport, offline=self.settings.offline)
+
+        # "asyncio" 引擎：资源和支持库在一个事件循环里用协程下，安装步骤和主文件分块还是普通函数，在几个线程里跑
+        self.async_engine: bool = self.settings.download_engine == "asyncio"
+        self.install_queue: task_queue.TaskQueue = (async_task_queue.AsyncTaskQueue if self.async_engine else task_queue.TaskQueue)(
+            self.settings.max_workers,
+            self.settings.result_retention,
+            rate_limits=self.settings.rate_limits,
+            adaptive_concurrency=task_queue.AdaptiveConcurrency(
+                self.settings.max_workers, congestion_classifier=self._is_congestion_error
+            ) if self.settings.adaptive_concurrency else None,
+            process_workers=self.settings.process_workers or None
         )
-        adapter = requests.adapters.HTTPAdapter(
-            pool_connections=self.settings.max_workers,  # 连接池大小
-            pool_maxsize=self.settings.max_workers,
-            max_retries=retry_strategy
-        )
-        self.session.mount("https://", adapter)
-
-        self.install_queue: task_queue.TaskQueue = task_queue.TaskQueue(self.settings.max_workers)
+        self.http_client: async_http.AsyncHttpClient | None = None  # asyncio 引擎用，第一次下载的时候在事件循环里从 self.transport 建
         self.version_manifest: dict = {}
         self.version_metadata: dict = {}
         self.total_assets: int = 0
@@ -60,34 +442,66 @@ class MinecraftInstaller:
         self.installed_libraries: int = 0
         self.failed_libraries: int = 0
         self.retried_libraries: int = 0
+        self.progress_lock: threading.Lock = threading.Lock()  # 上面这些计数在工作线程和回调里改，进度条等着它们
+        self.interned_paths: dict[tuple[str, ...], pathlib.Path] = {}  # 见 _intern_path
+        self.throughput: dict[str | None, float] = {}  # 限流键 -> 单条连接的下载速度（B/s，EWMA），分段大小按这个算
+        self.no_range_hosts: set[str | None] = set()  # 不认 Range 的域名，这些不再分段
+        # 资源对象库，默认就是 assets/objects；设了 asset_store_path 的话几个游戏目录共用一个库，assets/objects 里也是链接
+        self.object_store: object_store.ObjectStore = object_store.ObjectStore(
+            self.settings.asset_store_path or self.install_main_path / "assets" / "objects")
+        # 安装日志，进程挂了下次从这接着装，装完没失败的话删掉；install() 开始的时候才打开，只 verify() 的话不碰它
+        # 按版本加游戏目录区分，两个目录装同一个版本各用各的，一个装完删日志不会删到另一个的
+        self.journal_path: pathlib.Path = self.settings.temp_path / "journals" / \
+            f"{self.install_version}-{hashlib.sha1(os.path.abspath(self.install_main_path).encode()).hexdigest()[: 12]}.jsonl"
+        self.journal: install_journal.InstallJournal | None = None
+        # 校验索引，跨安装用：算过 SHA1 而且之后没动过的文件直接信；deep_verify 的话磁盘上的文件全部重新算
+        self.verify_index: verify_index.VerifyIndex = verify_index.VerifyIndex(self.settings.temp_path / "verify_index.json")
 
     def install(self) -> int:
         start_time: float = time.time()
+        self.journal = install_journal.InstallJournal(self.journal_path)
         self._install_tasks_init()
         logging.info("[Installer]: 下载任务初始化完成")
 
         self.install_queue.run()
         self.install_queue.shutdown()
+        self.verify_index.save()
+        self.transport.close()
+        self.journal.close(remove=self.install_running_flag and not self.failed_assets and not self.failed_libraries)
+        self.journal = None
         logging.info(f"[Installer]: 下载任务完成，用时 {time.time() - start_time:.3f}s，{self.failed_libraries=}，{self.failed_assets=}")
+        if self.settings.adaptive_concurrency:
+            logging.info(f"[Installer]: 自适应并发 {self.install_queue.get_concurrency_stats()["adaptive"]}")
+        for category, stats in self.install_queue.get_metrics()["categories"].items():  # 时间都花哪了
+            logging.info(f"[Installer]: {category}: {stats["outcomes"]}，重试 {stats["retries"]} 次，"
+                         f"排队共 {stats["queue_wait"]["sum"]:.3f}s，执行共 {stats["run_time"]["sum"]:.3f}s")
+        connection_stats: dict[str, any] = self.transport.get_stats()
+        logging.info(f"[Installer]: 发了 {connection_stats["requests"]} 个请求，新建 {connection_stats["connections"]} 条连接，"
+                     f"复用率 {connection_stats["reuse_ratio"]:.1%}，元数据缓存 {self.metadata_cache.stats}")
         # logging.info(self.install_queue.get_results())  # 测试用的
 
         return 0
 
     def download_manifest(self) -> int:
-        manifest: dict = json.loads(
-            requests.request("GET", self.minecraft_version_manifest_path[self.download_source]).text)
+        if self._load_journaled_version_metadata():
+            return 0  # 上次已经拿到元数据了，清单用不着
+
+        manifest: dict = json.loads(self.metadata_cache.get(self.minecraft_version_manifest_path[self.download_source],
+                                                            ttl=self.settings.metadata_cache_ttl))
         self.version_manifest = manifest
 
         return 0
 
     def download_version_metadata(self) -> int:
+        if self.version_metadata:  # 从安装日志恢复的
+            return 0
+
         version_metadata: dict = {}
         for version in self.version_manifest["versions"]:
             if version["id"] == self.install_version:
-                version_metadata: dict = json.loads(
-                    requests.request("GET",
-                                     version["url"].replace("piston-meta.mojang.com", "bmclapi2.bangbang93.com") if self.download_source == "BMCLAPI"
-                                     else version["url"]).text)
+                version_metadata: dict = json.loads(self.metadata_cache.get(
+                    version["url"].replace("piston-meta.mojang.com", "bmclapi2.bangbang93.com") if self.download_source == "BMCLAPI"
+                    else version["url"], ttl=self.settings.metadata_cache_ttl, sha1=version.get("sha1")))
                 break
         if not version_metadata:
             return -1
@@ -98,105 +512,82 @@ class MinecraftInstaller:
             json.dump(version_metadata, version_metadata_file, indent=2)
 
         self.version_metadata = version_metadata
+        if self.journal is not None:
+            self.journal.record_step("version_metadata")
         logging.info("[Installer]: 版本元数据下载完成")
 
         return 0
 
+    def _load_journaled_version_metadata(self) -> bool:
+        """安装日志说元数据已经存过了的话直接读本地那份"""
+        version_metadata_path: pathlib.Path = self.install_main_path / "versions" / self.install_version / f"{self.install_version}.json"
+        if self.journal is None or not self.journal.is_step_done("version_metadata") or not pathlib.Path.exists(version_metadata_path):
+            return False
+        with open(version_metadata_path, "r", encoding="utf-8") as version_metadata_file:
+            self.version_metadata = json.load(version_metadata_file)
+        logging.info("[Installer]: 从安装日志恢复版本元数据")
+        return True
+
     def download_game_main_file(self) -> int:
         if not self.version_metadata:
             logging.info(f"[Installer]: 未检测到游戏元数据，{self.version_metadata}")
             self.install_running_flag = False
             return -1
 
-        if pathlib.Path.exists(self.install_main_path / "versions" / self.install_version / f"{self.install_version}.jar"):
-                if (self._get_file_sha1(self.install_main_path / "versions" / self.install_version / f"{self.install_version}.jar")
-                        == self.version_metadata["downloads"]["client"]["sha1"]):
-                    logging.info("[Installer]: 已存在主文件")
-                    return 0
-
-        file_chunked: list[tuple[int, int]] = self._compute_download_file_chunked(
-            self.version_metadata["downloads"]["client"]["url"] if self.download_source == "Mojang"
-            else self.version_metadata["downloads"]["client"]["url"]
-            .replace("piston-meta.mojang.com", "bmclapi2.bangbang93.com"),
-            4194304
-        )
-        if not file_chunked:
-            return -1
+        if self._is_file_verified(self.install_main_path / "versions" / self.install_version / f"{self.install_version}.jar",
+                                  self.version_metadata["downloads"]["client"]["sha1"]):
+            logging.info("[Installer]: 已存在主文件")
+            return 0
 
-        for i in range(len(file_chunked)):
-            self.install_queue.add_task({
-                "id": f"main-file-worker-{i}",
-                "description": f"下载游戏主文件的 ({file_chunked[i]})",
-                "function": self._download_chunk,
-                "args": (
-                    f"main-file-worker-{i}",  # 给个 id，debug 用
-                    self.version_metadata["downloads"]["client"]["url"] if self.download_source == "Mojang"
-                    else self.version_metadata["downloads"]["client"]["url"]
-                    .replace("piston-meta.mojang.com", "bmclapi2.bangbang93.com"),  # 远端地址
-                    self.settings.temp_path / "downloads" /
-                    self.version_metadata["downloads"]["client"]["sha1"][: 2] /
-                    self.version_metadata["downloads"]["client"]["sha1"],  # 下载块路径
-                    f"{str(i)}.tmp",  # 下载块文件名
-                    file_chunked[i][0], file_chunked[i][1]  # 下载块起始
-                ),  # 好长一条参数
-                "max_retries": 5,
-                "priority": 11
-            })
-            time.sleep(1)  # 给点延迟防止太多 429 影响效率
-
-        if self._wait_main_file_downloading_completion(len(file_chunked)):
-            with open(self.install_main_path / "versions" / self.install_version / f"{self.install_version}.jar",
-                      "wb+") as f:
-                for downloaded_chunk in range(len(file_chunked)):
-                    with open(self.settings.temp_path / "downloads" /
-                              self.version_metadata["downloads"]["client"]["sha1"][: 2] /
-                              self.version_metadata["downloads"]["client"]["sha1"] /
-                              f"{str(downloaded_chunk)}.tmp", "rb") as tmp:
-                        f.write(tmp.read())
-            # 只是删个缓存，希望不要出什么 bug
-            shutil.rmtree(
-                self.settings.temp_path / "downloads" / self.version_metadata["downloads"]["client"]["sha1"][: 2])
-        else:
+        main_file_url: str = (self.version_metadata["downloads"]["client"]["url"] if self.download_source == "Mojang"
+                              else self.version_metadata["downloads"]["client"]["url"].replace("piston-meta.mojang.com", "bmclapi2.bangbang93.com"))
+        main_file_path: pathlib.Path = self.install_main_path / "versions" / self.install_version / f"{self.install_version}.jar"
+        main_file_size: int = self.version_metadata["downloads"]["client"].get("size", 0)
+        if not main_file_size:  # 元数据里没写大小，分不了段
+            try:
+                self._regular_download("main-file-worker", main_file_url, (main_file_path.parent,), (main_file_path.name,),
+                                       self.version_metadata["downloads"]["client"]["sha1"])
+            except Exception:
+                self.install_running_flag = False
+                return -1
+            logging.info("[Installer]: 版本主文件下载完成")
+            return 0
+
+        # 分段直接写进版本目录里预先分配好的 .part 文件，下完一段就接着算散列，最后改名成 .jar
+        download: SegmentedDownload = SegmentedDownload(main_file_url, main_file_path, self.version_metadata["downloads"]["client"]["sha1"],
+                                                        main_file_size, self._get_rate_key(main_file_url))
+        chunk_handles: list[task_queue.TaskFuture] = self.install_queue.add_tasks(
+            self._make_segmented_tasks("main-file-worker", download, "下载游戏主文件", "main_file"))
+        if not self._wait_main_file_downloading_completion(chunk_handles) or not download.finished:
             logging.info("[Installer]: 主文件下载失败，下载任务结束，等待其余线程完成执行，结果弃置")
             self.install_running_flag = False
-            self.install_queue.shutdown()
+            self.install_queue.shutdown(cancel_pending=True, timeout=0)  # 这是在任务里面调用的，别在这等
             return False
 
-        # 校验散列值
-        if (self._get_file_sha1(self.install_main_path / "versions" / self.install_version / f"{self.install_version}.jar")
-                != self.version_metadata["downloads"]["client"]["sha1"]):
-            logging.info(
-                f"[Installer]: 主文件散列值校验失败，已下载主文件散列值为 {hashlib.sha1(f.read()).hexdigest()}")
-            return -1
-
         logging.info("[Installer]: 版本主文件下载完成")
         return 0
 
     def download_game_asset_index(self) -> int:
+        index_path: pathlib.Path = self.install_main_path / "assets" / "indexes" / f"{self.version_metadata["assetIndex"]["id"]}.json"
         while True:
-            if pathlib.Path.exists(
-                    self.install_main_path / "assets" / "indexes" / f"{self.version_metadata["assetIndex"]["id"]}.json"
-            ):
-                    if (self._get_file_sha1(self.install_main_path / "assets" / "indexes" / f"{self.version_metadata["assetIndex"]["id"]}.json")
-                            == self.version_metadata["assetIndex"]["sha1"]):
-                        logging.info("[Installer]: 已有资源索引文件")
-                        break
+            if self._is_file_verified(index_path, self.version_metadata["assetIndex"]["sha1"]):
+                logging.info("[Installer]: 已有资源索引文件")
+                break
 
             try:
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                }
-                asset_index: dict = json.loads(requests.request(
-                    "GET",
+                body: bytes = self.metadata_cache.get(
                     self.version_metadata["assetIndex"]["url"] if self.download_source == "Mojang"
                     else self.version_metadata["assetIndex"]["url"].replace("piston-meta.mojang.com",
                                                                             "bmclapi2.bangbang93.com"),
-                    headers=headers, timeout=60).text)
-                os.makedirs(self.install_main_path / "assets" / "indexes", exist_ok=True)
-                with open(
-                        self.install_main_path / "assets" / "indexes" / f"{self.version_metadata["assetIndex"]["id"]}.json",
-                        'w') as f:
-                    json.dump(asset_index, f, indent=2)
+                    sha1=self.version_metadata["assetIndex"]["sha1"], timeout=60)
+                os.makedirs(index_path.parent, exist_ok=True)
+                with open(index_path, 'wb') as f:
+                    f.write(body)  # 原样存，散列值才对得上官方的
+                if hashlib.sha1(body).hexdigest() != self.version_metadata["assetIndex"]["sha1"]:
+                    self._forget_file(index_path)
+                    logging.error(f"[Installer]: 资源索引文件 {self.version_metadata["assetIndex"]["id"]} 的 SHA1 对不上")
+                    break
+                self._record_file(index_path, self.version_metadata["assetIndex"]["sha1"])
 
                 logging.info(f"[Installer]: 下载资源索引文件 {self.version_metadata["assetIndex"]["id"]} 成功")
 
@@ -210,62 +601,139 @@ class MinecraftInstaller:
     def download_game_assets(self) -> int:
         with open(self.install_main_path / "assets" / "indexes" / f"{self.version_metadata["assetIndex"]["id"]}.json") as f:
             asset_index: dict = json.load(f)
-        assets_info: tuple = tuple(asset_index["objects"].items())
         self.total_assets = len(asset_index["objects"])
-        assets_level: int = 0
-        assets_range: int = 0
+        # 同一个散列只下一份进对象库，virtual/legacy 和 pre-1.6 里的都是链接过去的
+        asset_names: dict[str, list[str]] = {}  # 散列 -> 用到它的资源名
+        asset_sizes: dict[str, int] = {}
+        for asset_name, asset_info in asset_index["objects"].items():
+            asset_names.setdefault(asset_info["hash"], []).append(asset_name)
+            asset_sizes[asset_info["hash"]] = asset_info.get("size", self.settings.asset_batch_threshold)
+        asset_tasks: list[task_queue.Task] = []
+        batch: list[tuple] = []  # 正在凑的一批小文件
+        batch_bytes: int = 0
+        asset_rate_key: str = self._get_rate_key(self.minecraft_assets_path[self.download_source])
         progress_updater: threading.Thread = threading.Thread(target=self._print_progress,
                                                               args=("资源文件下载进度", self.total_assets, self._get_assets_progress))  # 加个进度条
         progress_updater.start()
 
-        for i in range(len(asset_index["objects"])):
-            if (
-                    pathlib.Path.exists(self.install_main_path / "assets" / "objects" / assets_info[i][1]["hash"][: 2] / assets_info[i][1]["hash"])
-                and pathlib.Path.exists(self.install_main_path / "assets" / "virtual" / "legacy" / assets_info[i][0])
-                and pathlib.Path.exists(self.install_main_path / "assets" / "virtual" / "pre-1.6" / assets_info[i][0])
-            ):
-                if (
-                        self._get_file_sha1(self.install_main_path / "assets" / "objects" / assets_info[i][1]["hash"][: 2] / assets_info[i][1]["hash"]) == assets_info[i][1]["hash"]
-                    and self._get_file_sha1(self.install_main_path / "assets" / "virtual" / "legacy" / assets_info[i][0]) == assets_info[i][1]["hash"]
-                    and self._get_file_sha1(self.install_main_path / "assets" / "virtual" / "pre-1.6" / assets_info[i][0]) == assets_info[i][1]["hash"]
-                ):
-                    self.installed_assets += 1
+        # 只校验对象本身，链接和对象是同一个文件，用不着再算
+        self._verify_files([(self.object_store.object_path(asset_hash), asset_hash) for asset_hash in asset_names])
+        for i, (asset_hash, names) in enumerate(asset_names.items()):
+            links: tuple[tuple[pathlib.Path, str], ...] = self._get_asset_links(asset_hash, names)
+            if self._is_file_done(self.object_store.object_path(asset_hash), asset_hash):
+                try:
+                    self._link_asset(asset_hash, links)  # 对象已经有了，链接补齐就行
+                except OSError as e:
+                    logging.error(f"[Installer]: 链接资源文件 {asset_hash} 失败: {e}")
+                    with self.progress_lock:
+                        self.failed_assets += len(names)
                     continue
-
-            self.install_queue.add_task({
-                "id": f"asset-downloading-worker-{i}",
-                "description": f"下载游戏资源文件的 ({assets_info[i][0]}, {assets_info[i][1]["hash"]})",
-                "function": self._regular_download,
-                "args": (
-                    f"asset-downloading-worker-{i}",  # 给个 id，debug 用
-                    f"{self.minecraft_assets_path[self.download_source]}/"
-                    f"{assets_info[i][1]["hash"][: 2]}/{assets_info[i][1]["hash"]}",  # 远端地址
-                    [
-                        self.install_main_path / "assets" / "objects" / assets_info[i][1]["hash"][: 2],
-                        (self.install_main_path / "assets" / "virtual" / "legacy" / assets_info[i][0]).parent,
-                        (self.install_main_path / "assets" / "virtual" / "pre-1.6" / assets_info[i][0]).parent
-                    ],  # 下载资源文件路径
-                    [
-                        assets_info[i][1]["hash"],
-                        pathlib.Path(assets_info[i][0]).name,
-                        pathlib.Path(assets_info[i][0]).name
-                    ],  # 下载资源文件名
-                    assets_info[i][1]["hash"]  # 散列值
-                ),  # 又是好长一条参数
-                "callback": self._asset_downloading_callback,
-                "callback_args": (f"asset-downloading-worker-{i}", assets_info[i]),
-                "max_retries": 3,
-                "priority": 11
-            })
-            # time.sleep(0.01)  # 休息一下  # 啊，这里是后期的米米兔，这玩意好像没用，到时候再添加防止 429 的策略吧
-            assets_range += 1
-            if assets_range >= 100:
-                self._wait_for_batch_completion((assets_level * 100 + 100) * 0.7)  # 来了噢
-                assets_level += 1
-                assets_range -= 100
-
+                with self.progress_lock:
+                    self.installed_assets += len(names)
+                continue
+
+            asset_entry: tuple = (
+                f"{self.minecraft_assets_path[self.download_source]}/{asset_hash[: 2]}/{asset_hash}",  # 远端地址
+                asset_hash,  # 散列值
+                links,  # 要链接过去的 (目录, 文件名)
+                len(names)  # 算进度用
+            )
+            # 大的声音文件之类分段下（或者至少能断点续传），下完再链接
+            if (segmented := self._should_segment(asset_sizes[asset_hash], asset_rate_key)) \
+                    or self._should_resume(asset_sizes[asset_hash], asset_rate_key):
+                asset_tasks += self._make_segmented_tasks(f"asset-downloading-worker-{i}", SegmentedDownload(
+                    asset_entry[0], self.object_store.object_path(asset_hash), asset_hash, asset_sizes[asset_hash], asset_rate_key,
+                    functools.partial(self._asset_segmented_callback, asset_hash, links, len(names))
+                ), f"下载游戏资源文件的 ({names[0]}, {asset_hash})", "asset", segmented)
+                continue
+            if not self.async_engine and asset_sizes[asset_hash] < self.settings.asset_batch_threshold:
+                # 小文件攒起来，凑够一批再封成一个任务
+                batch.append(asset_entry)
+                batch_bytes += asset_sizes[asset_hash]
+                if batch_bytes >= self.settings.asset_batch_bytes or len(batch) >= self.settings.asset_batch_max_count:
+                    asset_tasks.append(self._make_asset_batch_task(f"asset-batch-worker-{len(asset_tasks)}", batch, batch_bytes, asset_rate_key))
+                    batch, batch_bytes = [], 0
+                continue
+
+            worker_id: str = f"asset-downloading-worker-{i}"
+            asset_tasks.append(task_queue.Task(
+                worker_id,
+                self._download_asset_async if self.async_engine else self._download_asset,
+                (worker_id, *asset_entry[: 3]),  # 又是好长一条参数，前面给个 id，debug 用
+                description=("下载游戏资源文件的 ({}, {})", names[0], asset_hash),  # 用到才拼
+                callback=self._asset_downloading_callback,
+                callback_args=(worker_id, len(names)),
+                max_time=60,
+                cancellable=True,
+                max_retries=3,
+                retry_delay=1,  # 退避重试，别对着已经在 429 的镜像猛敲
+                retry_max_delay=30,
+                adaptive=self.settings.adaptive_concurrency,
+                rate_key=asset_rate_key,  # 防 429 的策略在这，队列按域名限流
+                priority=11,
+                category="asset"
+            ))
+        if batch:
+            asset_tasks.append(self._make_asset_batch_task(f"asset-batch-worker-{len(asset_tasks)}", batch, batch_bytes, asset_rate_key))
+
+        # 一次性全塞进去，防 429 交给队列的限流，不用再 100 个一批地等
+        self.install_queue.add_tasks(asset_tasks)
         return 0
 
+    def _get_asset_links(self, asset_hash: str, names: list[str]) -> tuple[tuple[pathlib.Path, str], ...]:
+        """一个对象要放到哪些地方：每个资源名在 virtual/legacy 和 pre-1.6 各一份，对象库不在 assets/objects 的话那也要一份"""
+        links: list[tuple[pathlib.Path, str]] = []
+        if self.object_store.root != self.install_main_path / "assets" / "objects":
+            links.append((self._intern_path("assets", "objects", asset_hash[: 2]), asset_hash))
+        for asset_name in names:
+            asset_dir, _, asset_file_name = asset_name.rpartition("/")
+            links.append((self._intern_path("assets", "virtual", "legacy", asset_dir), asset_file_name))
+            links.append((self._intern_path("assets", "virtual", "pre-1.6", asset_dir), asset_file_name))
+        return tuple(links)
+
+    def _link_asset(self, asset_hash: str, links: typing.Sequence[tuple[pathlib.Path, str]]) -> None:
+        """对象链接到各个位置，已经是同一个文件的跳过；硬链接不了、复制出来的单独记进安装日志，下次不用再算散列"""
+        for path, file_name in links:
+            if self._is_file_done(path / file_name, asset_hash):
+                continue
+            if self.object_store.link(asset_hash, path / file_name) != "hardlink":
+                self._record_file(path / file_name, asset_hash)
+
+    def _download_asset(self, worker_id: str, url: str, asset_hash: str, links: typing.Sequence[tuple[pathlib.Path, str]],
+                        cancel_token: task_queue.CancellationToken | None = None) -> bool:
+        """资源只下一份进对象库，再链接到要用的地方；重试的时候对象可能已经下好了，只差链接"""
+        if not self._is_file_done(self.object_store.object_path(asset_hash), asset_hash):
+            self._regular_download(worker_id, url, (self.object_store.object_dir(asset_hash),), (asset_hash,), asset_hash,
+                                   cancel_token=cancel_token)
+        self._link_asset(asset_hash, links)
+        return True
+
+    async def _download_asset_async(self, worker_id: str, url: str, asset_hash: str, links: typing.Sequence[tuple[pathlib.Path, str]],
+                                    cancel_token: task_queue.CancellationToken | None = None) -> bool:
+        if not self._is_file_done(self.object_store.object_path(asset_hash), asset_hash):
+            await self._regular_download_async(worker_id, url, (self.object_store.object_dir(asset_hash),), (asset_hash,), asset_hash)
+        await asyncio.to_thread(self._link_asset, asset_hash, links)
+        return True
+
+    def _make_asset_batch_task(self, worker_id: str, batch: list[tuple], batch_bytes: int, rate_key: str) -> task_queue.Task:
+        return task_queue.Task(
+            worker_id,
+            self._download_asset_batch,
+            (worker_id, batch),
+            description=("批量下载 {} 个小资源文件（共 {} 字节）", len(batch), batch_bytes),
+            callback=self._asset_batch_callback,
+            callback_args=(worker_id, batch),
+            max_time=60 + len(batch),
+            cancellable=True,
+            max_retries=3,
+            retry_delay=1,
+            retry_max_delay=30,
+            adaptive=self.settings.adaptive_concurrency,
+            rate_key=rate_key,
+            priority=11,
+            category="asset_batch"
+        )
+
     def download_game_libraries(self) -> int:
         self.total_libraries = 0
         for lib in self.version_metadata["libraries"]:
@@ -273,87 +741,115 @@ class MinecraftInstaller:
                 self.total_libraries += len(lib["downloads"]["classifiers"])
             else:
                 self.total_libraries += 1
-        libraries_level: int = 0
-        libraries_range: int = 0
+        library_tasks: list[task_queue.Task] = []
         progress_updater: threading.Thread = threading.Thread(target=self._print_progress,
                                                               args=("支持库文件下载进度", self.total_libraries, self._get_libraries_progress))  # 加个进度条
         progress_updater.start()
 
+        self._verify_files([
+            (self.install_main_path / "libraries" / artifact["path"], artifact["sha1"])
+            for lib in self.version_metadata["libraries"]
+            for artifact in (lib["downloads"]["classifiers"].values() if "classifiers" in lib["downloads"] else (lib["downloads"]["artifact"],))
+        ])
         for i in range(len(self.version_metadata["libraries"])):
             if "classifiers" in self.version_metadata["libraries"][i]["downloads"]:
-                for classifier in self.version_metadata["libraries"][i]["downloads"]["classifiers"].values():
-                    if pathlib.Path.exists(self.install_main_path / "libraries" / classifier["path"]):
-                        if self._get_file_sha1(self.install_main_path / "libraries" / classifier["path"]) == classifier["sha1"]:
+                for classifier_name, classifier in self.version_metadata["libraries"][i]["downloads"]["classifiers"].items():
+                    if self._is_file_done(self.install_main_path / "libraries" / classifier["path"], classifier["sha1"]):
+                        with self.progress_lock:
                             self.installed_libraries += 1
-                            continue
-
-                    self.install_queue.add_task({
-                        "id": f"library-downloading-worker-{i}",
-                        "description": f"下载游戏支持库 ({self.version_metadata["libraries"][i]["name"]}) 的动态链接库文件 ({pathlib.Path(classifier['path']).name})",
-                        "function": self._regular_download,
-                        "args": (
-                            f"library-downloading-worker-{i}",  # 给个 id，debug 用
+                        continue
+
+                    worker_id: str = f"library-downloading-worker-{i}-{classifier_name}"
+                    library_path: pathlib.Path = pathlib.Path(classifier["path"])
+                    if (segmented := self._should_segment(classifier.get("size", 0), self._get_rate_key(classifier["url"]))) \
+                            or self._should_resume(classifier.get("size", 0), self._get_rate_key(classifier["url"])):  # 大文件分段下 / 断点续传
+                        library_tasks += self._make_segmented_tasks(worker_id, SegmentedDownload(
+                            classifier["url"] if self.download_source == "Mojang"
+                            else classifier["url"].replace("https://libraries.minecraft.net", "https://bmclapi2.bangbang93.com/maven"),
+                            self.install_main_path / "libraries" / library_path, classifier["sha1"], classifier["size"],
+                            self._get_rate_key(classifier["url"]), self._library_segmented_callback
+                        ), f"下载游戏支持库 ({self.version_metadata["libraries"][i]["name"]}) 的动态链接库文件 ({library_path.name})", "library",
+                            segmented)
+                        continue
+                    library_tasks.append(task_queue.Task(
+                        worker_id,
+                        self._get_download_function(),
+                        (
+                            worker_id,  # 给个 id，debug 用
                             # 远端地址
                             f"{classifier["url"] if self.download_source == "Mojang"
                             else classifier["url"].replace("https://libraries.minecraft.net", "https://bmclapi2.bangbang93.com/maven")}",
                             # 下载支持库文件路径
-                            [(self.install_main_path / "libraries" /
-                              classifier["path"]).parent],
+                            (self.install_main_path / "libraries" / library_path.parent,),
                             # 下载支持库文件名
-                            [pathlib.Path(classifier["path"]).name],
+                            (library_path.name,),
                             # 散列值
                             classifier["sha1"]
                         ),  # 仍然是好长一条参数
-                        "callback": self._library_downloading_callback,
-                        "callback_args": (f"library-downloading-worker-{i}", {**classifier, "name": self.version_metadata["libraries"][i]["name"]}, True),
-                        "max_retries": 3,
-                        "priority": 11
-                    })
-                    libraries_range += len(classifier)
+                        description=("下载游戏支持库 ({}) 的动态链接库文件 ({})", self.version_metadata["libraries"][i]["name"], library_path.name),
+                        callback=self._library_downloading_callback,
+                        callback_args=(worker_id,),
+                        max_time=60,
+                        cancellable=True,
+                        max_retries=3,
+                        retry_delay=1,
+                        retry_max_delay=30,
+                        adaptive=self.settings.adaptive_concurrency,
+                        rate_key=self._get_rate_key(classifier["url"]),
+                        priority=11,
+                        category="library"
+                    ))
             else:
-                if pathlib.Path.exists(self.install_main_path / "libraries" / self.version_metadata["libraries"][i]["downloads"]["artifact"]["path"]):
-                    if (self._get_file_sha1(self.install_main_path / "libraries" / self.version_metadata["libraries"][i]["downloads"]["artifact"]["path"])
-                            == self.version_metadata["libraries"][i]["downloads"]["artifact"]["sha1"]):
+                if self._is_file_done(self.install_main_path / "libraries" / self.version_metadata["libraries"][i]["downloads"]["artifact"]["path"],
+                                      self.version_metadata["libraries"][i]["downloads"]["artifact"]["sha1"]):
+                    with self.progress_lock:
                         self.installed_libraries += 1
-                        continue
+                    continue
 
-                self.install_queue.add_task({
-                    "id": f"library-downloading-worker-{i}",
-                    "description": f"下载游戏支持库文件的 ({self.version_metadata["libraries"][i]["name"]})",
-                    "function": self._regular_download,
-                    "args": (
-                        f"library-downloading-worker-{i}",  # 给个 id，debug 用
+                worker_id: str = f"library-downloading-worker-{i}"
+                artifact: dict = self.version_metadata["libraries"][i]["downloads"]["artifact"]
+                library_path: pathlib.Path = pathlib.Path(artifact["path"])
+                if (segmented := self._should_segment(artifact.get("size", 0), self._get_rate_key(artifact["url"]))) \
+                        or self._should_resume(artifact.get("size", 0), self._get_rate_key(artifact["url"])):  # 大文件分段下 / 断点续传
+                    library_tasks += self._make_segmented_tasks(worker_id, SegmentedDownload(
+                        artifact["url"] if self.download_source == "Mojang"
+                        else artifact["url"].replace("https://libraries.minecraft.net", "https://bmclapi2.bangbang93.com/maven"),
+                        self.install_main_path / "libraries" / library_path, artifact["sha1"], artifact["size"],
+                        self._get_rate_key(artifact["url"]), self._library_segmented_callback
+                    ), f"下载游戏支持库文件的 ({self.version_metadata["libraries"][i]["name"]})", "library", segmented)
+                    continue
+                library_tasks.append(task_queue.Task(
+                    worker_id,
+                    self._get_download_function(),
+                    (
+                        worker_id,  # 给个 id，debug 用
                         # 远端地址
-                        f"{self.version_metadata["libraries"][i]["downloads"]["artifact"]["url"] if self.download_source == "Mojang"
-                        else self.version_metadata["libraries"][i]["downloads"]["artifact"]["url"].replace("https://libraries.minecraft.net", "https://bmclapi2.bangbang93.com/maven")}",
+                        f"{artifact["url"] if self.download_source == "Mojang"
+                        else artifact["url"].replace("https://libraries.minecraft.net", "https://bmclapi2.bangbang93.com/maven")}",
                         # 下载支持库文件路径
-                        [(self.install_main_path / "libraries" / self.version_metadata["libraries"][i]["downloads"]["artifact"]["path"]).parent],
+                        (self.install_main_path / "libraries" / library_path.parent,),
                         # 下载支持库文件名
-                        [pathlib.Path(self.version_metadata["libraries"][i]["downloads"]["artifact"]["path"]).name],
+                        (library_path.name,),
                         # 散列值
-                        self.version_metadata["libraries"][i]["downloads"]["artifact"]["sha1"]
+                        artifact["sha1"]
                     ),  # 仍然是好长一条参数
-                    "callback": self._library_downloading_callback,
-                    "callback_args": (f"library-downloading-worker-{i}", self.version_metadata["libraries"][i]),
-                    "max_retries": 3,
-                    "priority": 11
-                })
-                libraries_range += 1
-
-            if libraries_range >= 100:
-                self._wait_for_batch_completion((libraries_level * 50 + 50) * 0.7)  # 来了噢
-                libraries_level += 1
-                libraries_range -= 100
-
+                    description=("下载游戏支持库文件的 ({})", self.version_metadata["libraries"][i]["name"]),
+                    callback=self._library_downloading_callback,
+                    callback_args=(worker_id,),
+                    max_time=60,
+                    cancellable=True,
+                    max_retries=3,
+                    retry_delay=1,
+                    retry_max_delay=30,
+                    adaptive=self.settings.adaptive_concurrency,
+                    rate_key=self._get_rate_key(artifact["url"]),
+                    priority=11,
+                    category="library"
+                ))
+
+        self.install_queue.add_tasks(library_tasks)
         return 0
 
-    def _retry_download_game_resources(self, task: dict[str, any]) -> int:
-        def retry() -> int:
-            self.install_queue.add_task(task)
-            return 0
-
-        return retry()
-
     def _install_tasks_init(self) -> int:
         # 要开始了哦
         self.install_queue.add_task({
@@ -361,7 +857,8 @@ class MinecraftInstaller:
             "description": "下载版本清单文件",
             "function": self.download_manifest,
             "args": (),
-            "priority": 10
+            "priority": 10,
+            "category": "install_step"
         })
         self.install_queue.add_task({
             "id": "1",
@@ -369,7 +866,8 @@ class MinecraftInstaller:
             "function": self.download_version_metadata,
             "args": (),
             "pre_tasks": ["0"],
-            "priority": 10
+            "priority": 10,
+            "category": "install_step"
         })
         self.install_queue.add_task({
             "id": "2",
@@ -377,7 +875,8 @@ class MinecraftInstaller:
             "function": self.download_game_main_file,
             "args": (),
             "pre_tasks": ["1"],
-            "priority": 10
+            "priority": 10,
+            "category": "install_step"
         })
         self.install_queue.add_task({
             "id": "3",
@@ -385,7 +884,8 @@ class MinecraftInstaller:
             "function": self.download_game_asset_index,
             "args": (),
             "pre_tasks": ["1"],
-            "priority": 10
+            "priority": 10,
+            "category": "install_step"
         })
         self.install_queue.add_task({
             "id": "4",
@@ -393,7 +893,8 @@ class MinecraftInstaller:
             "function": self.download_game_assets,
             "args": (),
             "pre_tasks": ["3"],
-            "priority": 10
+            "priority": 10,
+            "category": "install_step"
         })
         self.install_queue.add_task({
             "id": "5",
@@ -401,204 +902,374 @@ class MinecraftInstaller:
             "function": self.download_game_libraries,
             "args": (),
             "pre_tasks": ["1"],
-            "priority": 10
+            "priority": 10,
+            "category": "install_step"
         })
 
         return 0
 
     @staticmethod
-    def _compute_download_file_chunked(
-            url: str,  # 文件下载地址
-            chunk_size: int  # 单分块大小
-    ) -> list:
-        try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            response: requests.Response = requests.head(url, headers=headers, allow_redirects=True)
-
-            if 'Accept-Ranges' not in response.headers:
-                logging.info("[Installer]: 服务器不支持分块下载，使用普通下载")
-                return []
-
-            file_size: int = int(response.headers.get('Content-Length', 0))
-        except Exception as e:
-            logging.error(f"[Installer]:\n{e}")
-            return []
-
-        chunks: list = []
-        for start in range(0, file_size, chunk_size):
-            end = min(start + chunk_size - 1, file_size - 1)
-            chunks.append((start, end))
-
-        logging.debug(chunks)
-        return chunks
+    def _is_congestion_error(error: BaseException | None) -> bool:
+        """给自适应并发判断是不是被限流了：429 / 503，或者连接池自己的重试已经被 429 / 503 打满了"""
+        if task_queue.is_congestion_error(error):
+            return True
+        return isinstance(error, requests.exceptions.RetryError) and any(
+            f"too many {status_code} error responses" in str(error) for status_code in (429, 503))
+
+    def _intern_path(self, *parts: str) -> pathlib.Path:
+        """同一个目录只建一份 Path，几千个资源任务共用那几百个目录"""
+        if (path := self.interned_paths.get(parts)) is None:
+            path = self.interned_paths[parts] = self.install_main_path.joinpath(*parts)
+        return path
+
+    def _get_download_function(self) -> typing.Callable:
+        return self._regular_download_async if self.async_engine else self._regular_download
+
+    def _get_rate_key(self, url: str) -> str:
+        """限流按域名来，BMCLAPI 的话所有东西都是从它那下的，共用一个键"""
+        if self.download_source == "BMCLAPI":
+            return "bmclapi2.bangbang93.com"
+        return urllib.parse.urlsplit(url).netloc
+
+    def _should_segment(self, size: int, rate_key: str | None) -> bool:
+        return bool(self.settings.segment_threshold) and size >= self.settings.segment_threshold and rate_key not in self.no_range_hosts
+
+    def _should_resume(self, size: int, rate_key: str | None) -> bool:
+        """不分段但也不小的文件一条 lane 下进 .part，断了能接着下"""
+        return bool(self.settings.resume_threshold) and size >= self.settings.resume_threshold and rate_key not in self.no_range_hosts
+
+    def _get_segment_size(self, rate_key: str | None) -> int:
+        if (speed := self.throughput.get(rate_key)) is None:
+            return self.SEGMENT_INITIAL_SIZE
+        return min(max(int(speed * self.SEGMENT_TARGET_SECONDS), self.SEGMENT_MIN_SIZE), self.SEGMENT_MAX_SIZE)
+
+    def _observe_throughput(self, rate_key: str | None, size: int, seconds: float) -> None:
+        if size < 262144 or seconds <= 0:
+            return  # 太小的段时间主要花在握手和首字节上，测不出带宽
+        previous: float | None = self.throughput.get(rate_key)
+        self.throughput[rate_key] = size / seconds if previous is None else previous * 0.7 + size / seconds * 0.3
+
+    def _make_segmented_tasks(self, worker_id: str, download: SegmentedDownload, description: str, category: str,
+                              segmented: bool = True) -> list[task_queue.Task]:
+        """一个大文件开几条 lane，一条 lane 一个任务，每条连接最少分到 SEGMENT_MIN_SIZE；segmented=False 就只开一条"""
+        download.lanes = max(1, min(self.settings.segment_max_count, -(-download.size // self.SEGMENT_MIN_SIZE))) if segmented else 1
+        return [task_queue.Task(
+            f"{worker_id}-lane-{lane}",
+            self._download_segments,
+            (f"{worker_id}-lane-{lane}", download),
+            description=("{}（第 {} 条分段连接）", description, lane),
+            callback=self._segment_lane_callback,
+            callback_args=(f"{worker_id}-lane-{lane}", download),
+            cancellable=True,  # 不设 max_time，一条 lane 要下好几段，每段自己计时，见 SEGMENT_MAX_TIME
+            max_retries=5,
+            retry_delay=1,
+            retry_max_delay=30,
+            adaptive=self.settings.adaptive_concurrency,
+            rate_key=download.rate_key,
+            priority=11,
+            category=category
+        ) for lane in range(download.lanes)]
+
+    def _download_segments(self, worker_id: str, download: SegmentedDownload,
+                           cancel_token: task_queue.CancellationToken | None = None) -> bool:
+        """分段下载的一条 lane：领一段下一段，直到没段可领；整个文件是自己写完最后一段的话 commit"""
+        download.open()
+        if download.claim_commit():
+            self._commit_segments(download, download.writer)
+        while (segment := download.claim(self._get_segment_size(download.rate_key))) is not None:
+            writer: RangedFileWriter = download.writer
+            received: int = segment[0]  # 这段 [segment[0], received) 已经写进去、报给 writer 了
+            file_done: bool = False
+
+            def on_received(start: int, end: int) -> None:
+                nonlocal received, file_done
+                received = end + 1
+                file_done = download.complete(start, end, writer) or file_done
 
-    @staticmethod
-    def _download_chunk(worker_id: str, url: str, chunk_path: pathlib.Path, chunk_file: str,
-                       start: int, end: int) -> bool:
+            try:
+                self._download_range(worker_id, download.url, writer, *segment, rate_key=download.rate_key, cancel_token=cancel_token,
+                                     on_received=on_received)
+            except RangeNotSupported:
+                download.release(*segment, writer)
+                download.start_fallback()
+                self.no_range_hosts.add(download.rate_key)
+                logging.info(f"[Installer]: {download.url} 的服务器不支持分段下载，使用普通下载")
+                break
+            except RemoteFileChanged:
+                writer.discard()
+                download.reset()
+                raise  # 抛给队列，重试的时候从头下
+            except BaseException:
+                if received <= segment[1]:
+                    download.release(received, segment[1], writer)  # 收到的部分已经记下了，只放回没收到的
+                raise
+            if file_done:
+                self._commit_segments(download, writer)
+
+        if download.claim_fallback():
+            try:
+                self._regular_download(worker_id, download.url, (download.target.parent,), (download.target.name,), download.sha1,
+                                       cancel_token=cancel_token)
+            except BaseException:
+                download.fallback_claimed = False  # 重试的时候再来
+                raise
+            download.finished = True
+            download.writer.discard()
+        return True
+
+    def _commit_segments(self, download: SegmentedDownload, writer: RangedFileWriter) -> None:
+        """
+        散列值边下边算的，这里只差最后一点；不管因为什么失败都 reset 再抛给队列：
+        散列值不对的 .part 已经删了，从头下，别的错（改名失败之类）.part 还在，重试的时候 open() 发现是满的再 commit 一次
+        """
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                "Range": f"bytes={start}-{end}"
-            }
-
-            response: requests.Response = requests.get(url, headers=headers, stream=True, timeout=60)
-            response.raise_for_status()
-
-            os.makedirs(chunk_path, exist_ok=True)
-            with open(chunk_path / chunk_file, 'wb') as f:
-                for data in response.iter_content(chunk_size=8192):
-                    f.write(data)
-
-            logging.info(f"[Installer]: 下载块 ({start}-{end}) 成功，{chunk_path / chunk_file}")
+            writer.commit()
+        except BaseException:
+            writer.close()
+            download.reset()
+            raise
+        self._record_file(download.target, download.sha1)
+        download.finished = True
+
+    def _download_range(self, worker_id: str, url: str, writer: RangedFileWriter, start: int, end: int,
+                        rate_key: str | None = None, cancel_token: task_queue.CancellationToken | None = None,
+                        on_received: typing.Callable | None = None) -> bool:
+        """
+        下 [start, end] 这一段，收到多少按偏移量直接写进 writer 的文件多少；顺便测一下这条连接的速度
+        每收满 RANGE_CHECKPOINT_SIZE 报一次 on_received(起点, 终点)（默认 writer.complete_range），
+        中途断了的话收到的那部分也先报了再抛，重试只要剩下的
+        """
+        on_received = on_received or writer.complete_range
+        offset: int = start
+        checkpoint: int = start  # [start, checkpoint) 已经报过了
+        try:
+            headers = {"Range": f"bytes={start}-{end}"}
+            if (if_range := writer.get_if_range()) is not None:
+                headers["If-Range"] = if_range
+
+            start_time: float = time.monotonic()
+            with self.transport.get(url, headers=headers, timeout=60, stream=True) as response:
+                if not writer.check_validator(response.headers.get("ETag") or response.headers.get("Last-Modified")):
+                    raise RemoteFileChanged(f"{url} changed since {writer.part_path} was started")
+                if response.status_code != 206:
+                    raise RangeNotSupported(f"server ignored Range: HTTP {response.status_code}")
+                try:
+                    for data in response.iter_content(chunk_size=65536):
+                        if cancel_token:
+                            cancel_token.check()  # 超时或者停机了就别接着下了
+                        if offset + len(data) > end + 1:
+                            raise ConnectionError(f"range ({start}-{end}) overflowed at {offset + len(data)}")
+                        if time.monotonic() - start_time > self.SEGMENT_MAX_TIME:
+                            raise TimeoutError(f"range ({start}-{end}) took longer than {self.SEGMENT_MAX_TIME}s")
+                        writer.write_at(offset, data)
+                        offset += len(data)
+                        if offset - checkpoint >= self.RANGE_CHECKPOINT_SIZE:
+                            checkpoint, piece_start = offset, checkpoint
+                            on_received(piece_start, offset - 1)
+                finally:
+                    if offset > checkpoint:  # 断了也不白下
+                        checkpoint, piece_start = offset, checkpoint
+                        on_received(piece_start, offset - 1)
+            if offset != end + 1:
+                raise ConnectionError(f"range ({start}-{end}) truncated at {offset}")
+            self._observe_throughput(rate_key, end - start + 1, time.monotonic() - start_time)
+
+            logging.info(f"[Installer]: 下载块 ({start}-{end}) 成功，{writer.part_path}")
 
             return True
+        except (RangeNotSupported, RemoteFileChanged):
+            raise
         except Exception as e:
             logging.error(f"[Installer]: 下载块失败 ({start}-{end})，于 {worker_id}: {e}")
-            return False
+            raise  # 抛给 lane，段放回去，lane 按 max_retries 退避重试
 
-    def _regular_download(self, worker_id: str, url: str, store_path: list[pathlib.Path], store_file: list[str], sha1: str) -> bool:
+    def _regular_download(self, worker_id: str, url: str, store_path: typing.Sequence[pathlib.Path], store_file: typing.Sequence[str], sha1: str,
+                          cancel_token: task_queue.CancellationToken | None = None) -> bool:
+        """流式下载：每收一块同时喂给 SHA1 和临时文件，不在内存里攒整个文件，散列值对上了才改名成正式文件"""
         if len(store_path) != len(store_file):
-            return False
+            raise ValueError(f"store_path 和 store_file 数量对不上，于 {worker_id}")
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-
-            response = self.session.get(url, headers=headers, timeout=30, proxies={}, verify=False)
-            response.raise_for_status()
-
-            for i in range(len(store_path)):
-                os.makedirs(store_path[i], exist_ok=True)
-                with open(store_path[i] / store_file[i], 'wb') as f:
-                    f.write(response.content)
-                """if hashlib.sha1(response.content).hexdigest() != sha1:
-                    logging.info(
-                        f"[Installer]: 文件 {url} 散列值校验失败，于 {worker_id}，原文件散列值 {hashlib.sha1(response.content).hexdigest()}，但期望 {sha1}")
-                    return False"""  # 看看不校验的话速度会不会快很多，果真，快了十几秒
+            with self.transport.get(url, stream=True) as response:
+                # 以前整个 response.content 拿到手再校验，慢了十几秒就干脆不校验了；边收边算的话基本不花时间
+                with VerifiedFileWriter([path / file_name for path, file_name in zip(store_path, store_file)], sha1) as writer:
+                    for data in response.iter_content(chunk_size=65536):
+                        if cancel_token:
+                            cancel_token.check()  # 超时或者停机了就别接着下了，临时文件会删掉
+                        writer.write(data)
+                    writer.commit()
+            self._record_downloaded_file(store_path, store_file, sha1)
 
             return True
         except Exception as e:
             logging.error(f"[Installer]: 下载文件 {url} 失败，于 {worker_id}: {e}")
-            return False
+            raise  # 抛给队列，按 max_retries 退避重试
+
+    def _record_downloaded_file(self, store_path: typing.Sequence[pathlib.Path], store_file: typing.Sequence[str], sha1: str) -> None:
+        for i in range(len(store_path)):
+            self._record_file(store_path[i] / store_file[i], sha1)
+
+    def _finish_async_download(self, store_path: typing.Sequence[pathlib.Path], store_file: typing.Sequence[str], sha1: str,
+                               writer: "VerifiedFileWriter | None", content: bytes) -> None:
+        """asyncio 引擎下载完的收尾，会卡住，在线程里调：小文件这时才整个写进去，散列值对上了改名，再记进安装日志"""
+        if writer is None:
+            writer = VerifiedFileWriter([path / file_name for path, file_name in zip(store_path, store_file)], sha1)
+            writer.write(content)
+        with writer:
+            writer.commit()
+        self._record_downloaded_file(store_path, store_file, sha1)
+
+    async def _regular_download_async(self, worker_id: str, url: str, store_path: typing.Sequence[pathlib.Path], store_file: typing.Sequence[str],
+                                      sha1: str, cancel_token: task_queue.CancellationToken | None = None) -> bool:
+        """
+        _regular_download 的协程版，asyncio 引擎用；超时的话队列直接取消这个协程，cancel_token 只是和线程版参数对齐
+        小文件收完再一次写，建文件、写文件、记日志这些会卡住的活扔到线程里，别挡着事件循环；
+        超过 ASYNC_BUFFER_SIZE 的大文件不在内存里攒，边收边写进临时文件、边算 SHA1
+        """
+        if len(store_path) != len(store_file):
+            raise ValueError(f"store_path 和 store_file 数量对不上，于 {worker_id}")
+        if self.http_client is None:
+            self.http_client = self.transport.create_async_client()
+            self.install_queue.add_loop_cleanup(self.http_client.close)
+
+        buffer: bytearray = bytearray()
+        writer: VerifiedFileWriter | None = None
+
+        def write(data: bytes) -> None:
+            nonlocal writer
+            if writer is None and len(buffer) + len(data) <= self.ASYNC_BUFFER_SIZE:
+                buffer.extend(data)
+                return
+            if writer is None:  # 大文件，开始落盘
+                writer = VerifiedFileWriter([path / file_name for path, file_name in zip(store_path, store_file)], sha1)
+                writer.write(bytes(buffer))
+                buffer.clear()
+            writer.write(data)
 
-    def _wait_main_file_downloading_completion(self, chunks: int) -> bool:
-        chunk_result: dict[str, bool] = {}
-        while True:
-            for result_key, result_value in self.install_queue.get_results().items():
-                if "main-file-worker-" in result_key:
-                    chunk_result[result_key] = result_value
-            if len(chunk_result) == chunks:
-                break
-            time.sleep(1)
+        try:
+            try:
+                await self.http_client.get(url, sink=write)
+            except BaseException:
+                if writer is not None:
+                    writer.abort()
+                raise
+            await asyncio.to_thread(self._finish_async_download, store_path, store_file, sha1, writer, bytes(buffer))
 
+            return True
+        except Exception as e:
+            logging.error(f"[Installer]: 下载文件 {url} 失败，于 {worker_id}: {e}")
+            raise  # 抛给队列，按 max_retries 退避重试
+
+    def _download_asset_batch(self, worker_id: str, batch: list[tuple],
+                              cancel_token: task_queue.CancellationToken | None = None) -> int:
+        """
+        一个任务顺序下一批小资源文件，都走 self.transport，连接一直复用，省掉每个文件一轮调度
+        batch 里是 (远端地址, 散列值, 链接位置, 资源个数)，是这批还没下好的，几次尝试共用；
+        每次尝试开头拿一份自己的，下好一个从 batch 里删一个、记一个，有失败的就整批抛给队列重试，重试只下剩下的
+        超时被丢下的那次可能还在跑，它下好的已经不在 batch 里的话不再记，免得记两遍
+        """
+        with self.progress_lock:
+            attempt: tuple[tuple, ...] = tuple(batch)
+        failed: int = 0
+        for asset_entry in attempt:
+            if cancel_token:
+                cancel_token.check()
+            try:
+                self._download_asset(worker_id, *asset_entry[: 3], cancel_token=cancel_token)  # 失败了它自己会打日志
+            except task_queue.TaskCancelled:
+                raise
+            except Exception:
+                failed += 1
+                continue
+            with self.progress_lock:
+                if asset_entry in batch:
+                    batch.remove(asset_entry)
+                    self.installed_assets += asset_entry[3]
+
+        if failed:
+            raise RuntimeError(f"{failed} 个资源文件下载失败，于 {worker_id}")
+        return 0
+
+    def _wait_main_file_downloading_completion(self, chunk_handles: list[task_queue.TaskFuture]) -> bool:
         finish_install: bool = True
-        for _, result in chunk_result.items():
-            if not result:
+        for handle in self.install_queue.as_completed(chunk_handles):  # 有一块失败就不用等了
+            if handle.cancelled() or handle.exception() is not None or not handle.result():
                 finish_install = False
                 break
 
         return finish_install
 
-    def _asset_downloading_callback(self, worker_id: str, asset_data: dict) -> int:
-        if self.install_queue.get_results()[worker_id]:
-            self.installed_assets += 1
-        else:
-            if not asset_data:
-                self.failed_libraries += 1
+    def _asset_downloading_callback(self, worker_id: str, asset_count: int = 1) -> int:
+        # 重试交给队列（带退避），这里只管记账；一个对象可能对应好几个资源名
+        task_info: task_queue.TaskInfo | None = self.install_queue.get_task_info(worker_id)
+        with self.progress_lock:
+            self.retried_assets += task_info.retries if task_info else 0
+            if task_info and task_info.state == "succeeded":
+                self.installed_assets += asset_count
+            else:
+                self.failed_assets += asset_count
                 return -1
-
-            self._retry_download_game_resources({
-                "id": f"asset-downloading-worker-{self.retried_assets}",
-                "description": f"下载游戏资源文件的 ({asset_data[0]}, {asset_data[1]["hash"]})",
-                "function": self._regular_download,
-                "args": (
-                    f"asset-downloading-worker-{self.retried_assets}",  # 给个 id，debug 用
-                    f"{self.minecraft_assets_path[self.download_source]}/"
-                    f"{asset_data[1]["hash"][: 2]}/{asset_data[1]["hash"]}",  # 远端地址
-                    [
-                        self.install_main_path / "assets" / "objects" / asset_data[1]["hash"][: 2],
-                        (self.install_main_path / "assets" / "virtual" / "legacy" / asset_data[0]).parent,
-                        (self.install_main_path / "assets" / "virtual" / "pre-1.6" / asset_data[0]).parent
-                    ],  # 下载资源文件路径
-                    [
-                        asset_data[1]["hash"],
-                        pathlib.Path(asset_data[0]).name,
-                        pathlib.Path(asset_data[0]).name
-                    ],  # 下载资源文件名
-                    asset_data[1]["hash"]  # 散列值
-                ),  # 又是好长一条参数
-                "callback": self._asset_downloading_callback,
-                "callback_args": (f"asset-downloading-worker-{self.retried_assets}", asset_data),
-                "max_retries": 3,
-                "priority": 12
-            })
-            self.retried_assets += 1
         return 0
 
+    def _asset_batch_callback(self, worker_id: str, batch: list[tuple]) -> int:
+        # 成功的在下载的时候已经记过了，batch 里剩下的就是最后也没下成的；清掉，被丢下的那次再下好也不记了
+        task_info: task_queue.TaskInfo | None = self.install_queue.get_task_info(worker_id)
+        with self.progress_lock:
+            self.retried_assets += task_info.retries if task_info else 0
+            failed: int = sum(asset_entry[3] for asset_entry in batch)
+            self.failed_assets += failed
+            batch.clear()
+        return -1 if failed else 0
+
     def _get_assets_progress(self) -> int:
         return self.installed_assets + self.failed_assets
 
-    def _library_downloading_callback(self, worker_id: str, library_data: dict | None = None, is_classifier: bool = False) -> int:
-        if self.install_queue.get_results()[worker_id]:
-            self.installed_libraries += 1
-        else:
-            if not library_data:
+    def _library_downloading_callback(self, worker_id: str) -> int:
+        task_info: task_queue.TaskInfo | None = self.install_queue.get_task_info(worker_id)
+        with self.progress_lock:
+            self.retried_libraries += task_info.retries if task_info else 0
+            if task_info and task_info.state == "succeeded":
+                self.installed_libraries += 1
+            else:
                 self.failed_libraries += 1
                 return -1
+        return 0
 
-            if is_classifier:
-                self._retry_download_game_resources({
-                    "id": f"library-downloading-worker-retry-{self.retried_libraries}",
-                    "description": f"重试下载游戏支持库 ({library_data["name"]}) 的动态链接库文件 ({pathlib.Path(library_data['path']).name})",
-                    "function": self._regular_download,
-                    "args": (
-                        f"library-downloading-worker-{self.retried_libraries}",  # 给个 id，debug 用
-                        f"{library_data["url"] if self.download_source == "BMCLAPI"
-                        else library_data["url"].replace("https://libraries.minecraft.net", "https://bmclapi2.bangbang93.com/maven")}",
-                        # 远端地址
-                        [(self.install_main_path / "libraries" / library_data["path"]).parent],
-                        # 下载资源文件路径
-                        [pathlib.Path(library_data["path"]).name],  # 下载资源文件名
-                        library_data["sha1"]  # 散列值
-                    ),  # 好长一参数
-                    "callback": self._library_downloading_callback,
-                    "callback_args": (f"library-downloading-worker-retry-{self.retried_libraries}",),
-                    "max_retries": 3,
-                    "priority": 12
-                })
-            else:
-                self._retry_download_game_resources({
-                    "id": f"library-downloading-worker-retry-{self.retried_libraries}",
-                    "description": f"重试下载游戏支持库文件的 ({library_data["name"]})",
-                    "function": self._regular_download,
-                    "args": (
-                        f"library-downloading-worker-{self.retried_libraries}",  # 给个 id，debug 用
-                        f"{library_data["downloads"]["artifact"]["url"] if self.download_source == "BMCLAPI"
-                        else library_data["downloads"]["artifact"]["url"].replace("https://libraries.minecraft.net", "https://bmclapi2.bangbang93.com/maven")}",  # 远端地址
-                        [(self.install_main_path / "libraries" / library_data["downloads"]["artifact"]["path"]).parent],  # 下载资源文件路径
-                        [pathlib.Path(library_data["downloads"]["artifact"]["path"]).name],  # 下载资源文件名
-                        library_data["downloads"]["artifact"]["sha1"]  # 散列值
-                    ),  # 好长一参数
-                    "callback": self._library_downloading_callback,
-                    "callback_args": (f"library-downloading-worker-retry-{self.retried_libraries}",),
-                    "max_retries": 3,
-                    "priority": 12
-                })
-            self.retried_libraries += 1
+    def _segment_lane_callback(self, worker_id: str, download: SegmentedDownload) -> int:
+        task_info: task_queue.TaskInfo | None = self.install_queue.get_task_info(worker_id)
+        with download.lock:
+            download.retries += task_info.retries if task_info else 0
+        if download.settle() and download.on_settled is not None:  # 最后一条 lane，整个文件的账在这记
+            return download.on_settled(download)
         return 0
 
+    def _library_segmented_callback(self, download: SegmentedDownload) -> int:
+        with self.progress_lock:
+            self.retried_libraries += download.retries
+            if download.finished:
+                self.installed_libraries += 1
+                return 0
+            self.failed_libraries += 1
+        return -1
+
+    def _asset_segmented_callback(self, asset_hash: str, links: typing.Sequence[tuple[pathlib.Path, str]], asset_count: int,
+                                  download: SegmentedDownload) -> int:
+        with self.progress_lock:
+            self.retried_assets += download.retries
+        if download.finished:
+            try:
+                self._link_asset(asset_hash, links)
+                with self.progress_lock:
+                    self.installed_assets += asset_count
+                return 0
+            except OSError as e:
+                logging.error(f"[Installer]: 链接资源文件 {asset_hash} 失败: {e}")
+        with self.progress_lock:
+            self.failed_assets += asset_count
+        return -1
+
     def _get_libraries_progress(self) -> int:
         return self.installed_libraries + self.failed_libraries
 
-    def _wait_for_batch_completion(self, min_completed: float) -> None:
-        start_time: float = time.time()
-        while time.time() - start_time < 30:
-            if self.installed_assets + self.failed_assets >= min_completed:
-                break
-            time.sleep(0.5)
-
     @staticmethod
     def _print_progress(description: str, total_progress: int, lazy_progress_getter: typing.Callable) -> None:
         if total_progress == 0:
@@ -622,5 +1293,161 @@ class MinecraftInstaller:
 
     @staticmethod
     def _get_file_sha1(file_path: pathlib.Path) -> str:
-        with open(file_path, 'rb') as f:
-            return hashlib.sha1(f.read()).hexdigest()
+        return verify_index.file_sha1(file_path)
+
+    def _is_file_done(self, path: pathlib.Path, sha1: str) -> bool:
+        """这次安装里下载 / 校验过（安装日志），或者以前校验过、之后没动过（校验索引）"""
+        return (self.journal is not None and self.journal.is_file_done(path, sha1)) or self.verify_index.lookup(path, sha1)
+
+    def _record_file(self, path: pathlib.Path, sha1: str) -> None:
+        stat: os.stat_result = self.journal.record_file(path, sha1) if self.journal is not None else os.stat(path)
+        if sha1 is not None:
+            self.verify_index.record(path, sha1, stat)
+
+    def _forget_file(self, path: pathlib.Path) -> None:
+        """内容不对了，安装日志和校验索引里之前的记录都不算数"""
+        if self.journal is not None:
+            self.journal.forget_file(path)
+        self.verify_index.invalidate((path,))
+
+    def _verify_files(self, files: list[tuple[pathlib.Path, str]]) -> None:
+        """
+        一批 (路径, 散列值) 先统一校验：安装日志和校验索引里都没有（deep_verify 的话不管有没有）、但磁盘上有的才算 SHA1，
+        对的记下来，之后直接问 _is_file_done 就行；开了进程池的话丢进去并行算，只传路径，不传文件内容
+        """
+        unverified: list[tuple[pathlib.Path, str]] = [
+            (path, sha1) for path, sha1 in files
+            if (self.settings.deep_verify or not self._is_file_done(path, sha1)) and pathlib.Path.exists(path)
+        ]
+        if self.settings.process_workers and len(unverified) > 1:
+            digests: typing.Iterable[str] = self.install_queue.get_process_pool().map(
+                self._get_file_sha1, [path for path, _ in unverified], chunksize=32)
+        else:
+            digests = map(self._get_file_sha1, (path for path, _ in unverified))
+        for (path, sha1), digest in zip(unverified, digests):
+            if digest == sha1:
+                self._record_file(path, sha1)
+            else:
+                self._forget_file(path)
+
+    def _is_file_verified(self, file_path: pathlib.Path, sha1: str) -> bool:
+        """文件在且散列值对：记过而且没动过就直接信（deep_verify 除外），不然算一遍 SHA1，对的话记下来"""
+        if not self.settings.deep_verify and self._is_file_done(file_path, sha1):
+            return True
+        if not pathlib.Path.exists(file_path) or self._get_file_sha1(file_path) != sha1:
+            self._forget_file(file_path)
+            return False
+        self._record_file(file_path, sha1)
+        return True
+
+    def rebuild_verify_index(self) -> int:
+        """校验索引里的文件全部重新算一遍，开了进程池的话并行；返回内容变了的文件数"""
+        if self.settings.process_workers:
+            pool = self.install_queue.get_process_pool()
+            changed: int = self.verify_index.rebuild(lambda function, paths: pool.map(function, paths, chunksize=32))
+        else:
+            changed = self.verify_index.rebuild()
+        self.verify_index.save()
+        return changed
+
+    def verify(self, deep: bool = True, callback: typing.Callable | None = None) -> dict[str, any]:
+        """
+        校验已经装好的这个版本，不下载任何东西，见 iter_verify
+        :param callback: 每出一条结果调一次，边算边报
+        :return: {"ok": [...], "missing": [...], "corrupt": [...], "elapsed": 秒}，列表里是 iter_verify 的结果
+        """
+        start_time: float = time.perf_counter()
+        report: dict[str, any] = {"ok": [], "missing": [], "corrupt": []}
+        for result in self.iter_verify(deep):
+            report[result["status"]].append(result)
+            if callback is not None:
+                callback(result)
+        report["elapsed"] = time.perf_counter() - start_time
+        logging.info(f"[Installer]: 校验 {self.install_version} 完成，用时 {report["elapsed"]:.3f}s，"
+                     f"正常 {len(report["ok"])}，缺失 {len(report["missing"])}，损坏 {len(report["corrupt"])}")
+        return report
+
+    def iter_verify(self, deep: bool = True) -> typing.Iterator[dict[str, any]]:
+        """
+        主文件、支持库、资源对象（还有不是硬链接、单独一份的资源文件）全部算一遍 SHA1，算完一批吐一批，不按顺序
+        每条结果 {"status": "ok" / "missing" / "corrupt", "category": "main_file" / "library" / "asset" / "asset_index",
+        "path": ..., "sha1": 应该是的, "actual_sha1": 算出来的}
+        开了进程池（process_workers）就丢进队列的进程池（spawn 启动的，见 TaskQueue.get_process_pool）算，
+        不然开 CPU 核数个线程，hashlib 算的时候放开 GIL，一样吃满几个核
+        结果顺手更新校验索引；deep=False 的话校验索引里记着、没动过的文件直接算 ok
+        """
+        executor: concurrent.futures.Executor = (
+            self.install_queue.get_process_pool() if self.settings.process_workers
+            else concurrent.futures.ThreadPoolExecutor(os.cpu_count() or 1, thread_name_prefix="Verifier"))
+        batches: dict[concurrent.futures.Future, list[tuple[str, pathlib.Path, str]]] = {}
+        try:
+            batch: list[tuple[str, pathlib.Path, str]] = []
+            for category, path, sha1 in self._collect_installed_files():
+                if sha1 is None:
+                    yield {"status": "missing", "category": category, "path": path, "sha1": None, "actual_sha1": None}
+                elif not deep and self._is_file_done(path, sha1):
+                    yield {"status": "ok", "category": category, "path": path, "sha1": sha1, "actual_sha1": sha1}
+                else:
+                    batch.append((category, path, sha1))
+                if len(batch) >= self.VERIFY_BATCH_SIZE:
+                    batches[executor.submit(verify_index.hash_files, [path for _, path, _ in batch])] = batch  # 边列边算
+                    batch = []
+                    for future in [future for future in batches if future.done()]:
+                        yield from self._verify_results(batches.pop(future), future.result())
+            if batch:
+                batches[executor.submit(verify_index.hash_files, [path for _, path, _ in batch])] = batch
+            for future in concurrent.futures.as_completed(batches):
+                yield from self._verify_results(batches[future], future.result())
+        finally:
+            for future in batches:
+                future.cancel()  # 调用方中途不要了的话剩下的别算了；进程池是队列的，不能关
+            if not self.settings.process_workers:
+                executor.shutdown()
+            self.verify_index.save()
+
+    def _verify_results(self, batch: list[tuple[str, pathlib.Path, str]], digests: list[str | None]) -> typing.Iterator[dict[str, any]]:
+        for (category, path, sha1), digest in zip(batch, digests):
+            if digest == sha1:
+                self.verify_index.record(path, sha1)
+            else:
+                self.verify_index.invalidate((path,))
+            yield {"status": "missing" if digest is None else "ok" if digest == sha1 else "corrupt",
+                   "category": category, "path": path, "sha1": sha1, "actual_sha1": digest}
+
+    def _collect_installed_files(self) -> typing.Iterator[tuple[str, pathlib.Path, str | None]]:
+        """这个版本装好以后应该有的文件，(类别, 路径, 散列值)；资源索引都没有的话给一条散列值为 None 的，资源就没法查了"""
+        if not self.version_metadata:
+            with open(self.install_main_path / "versions" / self.install_version / f"{self.install_version}.json",
+                      "r", encoding="utf-8") as version_metadata_file:
+                self.version_metadata = json.load(version_metadata_file)
+
+        yield ("main_file", self.install_main_path / "versions" / self.install_version / f"{self.install_version}.jar",
+               self.version_metadata["downloads"]["client"]["sha1"])
+        for lib in self.version_metadata["libraries"]:
+            for artifact in (lib["downloads"]["classifiers"].values() if "classifiers" in lib["downloads"] else (lib["downloads"]["artifact"],)):
+                yield "library", self.install_main_path / "libraries" / artifact["path"], artifact["sha1"]
+
+        asset_index_path: pathlib.Path = self.install_main_path / "assets" / "indexes" / f"{self.version_metadata["assetIndex"]["id"]}.json"
+        if not pathlib.Path.exists(asset_index_path):
+            yield "asset_index", asset_index_path, None
+            return
+        yield "asset_index", asset_index_path, self.version_metadata["assetIndex"]["sha1"]  # 原样存的，能对官方的散列值
+        with open(asset_index_path) as f:
+            asset_index: dict = json.load(f)
+        asset_names: dict[str, list[str]] = {}
+        for asset_name, asset_info in asset_index["objects"].items():
+            asset_names.setdefault(asset_info["hash"], []).append(asset_name)
+        for asset_hash, names in asset_names.items():
+            object_path: pathlib.Path = self.object_store.object_path(asset_hash)
+            yield "asset", object_path, asset_hash
+            try:
+                object_stat: os.stat_result | None = os.stat(object_path)
+            except OSError:
+                object_stat = None
+            for path, file_name in self._get_asset_links(asset_hash, names):
+                try:
+                    if object_stat is not None and os.path.samestat(object_stat, os.stat(path / file_name)):
+                        continue  # 硬链接就是对象本身，上面算过了
+                except OSError:
+                    pass
+                yield "asset", path / file_name, asset_hash
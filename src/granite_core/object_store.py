@@ -0,0 +1,87 @@
+"""
+    内容寻址的资源对象库：一个对象按 SHA1 只存一份，要用它的地方全是硬链接，几个游戏目录可以共用一个库
+"""
+
+import errno
+import os
+import pathlib
+import shutil
+import threading
+import uuid
+
+try:
+    import fcntl  # reflink 用，Windows 上没有
+except ImportError:
+    fcntl = None
+
+FICLONE: int = 0x40049409  # Linux 的 ioctl，btrfs / XFS 之类能写时复制的文件系统支持
+
+
+class ObjectStore:
+    """
+    对象放在 root/<散列前两位>/<散列>，和 Minecraft 的 assets/objects 一个布局，所以默认 root 就是 assets/objects
+    link() 把对象放到别的位置（virtual/legacy、pre-1.6、别的 working_path 的 assets/objects）：
+    先试硬链接，跨盘或者文件系统不让的话 Linux 上试 reflink，再不行才老老实实复制一份
+    每个目标目录所在的设备用哪种方式记下来，失败过的方式不会每个文件再试一遍
+    """
+    LINK_MODES: tuple[str, ...] = ("hardlink", "reflink", "copy")
+
+    def __init__(self, root: pathlib.Path) -> None:
+        self.root: pathlib.Path = root
+        self.prefix_dirs: dict[str, pathlib.Path] = {}  # 就 256 个目录，几千个对象共用
+        self.link_modes: dict[int, str] = {}  # 目标目录的 st_dev -> 能用的最好的方式
+        self.lock: threading.Lock = threading.Lock()
+
+    def object_dir(self, sha1: str) -> pathlib.Path:
+        if (path := self.prefix_dirs.get(sha1[: 2])) is None:
+            path = self.prefix_dirs[sha1[: 2]] = self.root / sha1[: 2]
+        return path
+
+    def object_path(self, sha1: str) -> pathlib.Path:
+        return self.object_dir(sha1) / sha1
+
+    def is_linked(self, sha1: str, target: pathlib.Path) -> bool:
+        """target 就是对象本身（同一个 inode），不用再校验"""
+        try:
+            return os.path.samefile(self.object_path(sha1), target)
+        except OSError:
+            return False
+
+    def link(self, sha1: str, target: pathlib.Path) -> str:
+        """
+        把对象放到 target，先弄到同目录的临时文件再原子地改名过去，target 原来有东西的话直接替换
+        :return: 用的是 "hardlink" / "reflink" / "copy" 哪种，不是 hardlink 的话 target 是单独一个文件
+        """
+        if self.is_linked(sha1, target):
+            return "hardlink"
+        source: pathlib.Path = self.object_path(sha1)
+        os.makedirs(target.parent, exist_ok=True)
+        device: int = os.stat(target.parent).st_dev
+        with self.lock:
+            mode: str = self.link_modes.get(device, self.LINK_MODES[0])
+
+        for mode in self.LINK_MODES[self.LINK_MODES.index(mode):]:
+            temp_path: pathlib.Path = target.parent / f".{target.name}.{uuid.uuid4().hex[: 12]}.tmp"
+            try:
+                if mode == "hardlink":
+                    os.link(source, temp_path)
+                elif mode == "reflink":
+                    self._reflink(source, temp_path)
+                else:
+                    shutil.copyfile(source, temp_path)
+                os.replace(temp_path, target)
+            except OSError as e:
+                temp_path.unlink(missing_ok=True)
+                if mode == "copy" or e.errno == errno.ENOENT:  # 对象本身没了就不是方式的问题
+                    raise
+                continue
+            with self.lock:
+                self.link_modes[device] = mode
+            return mode
+
+    @staticmethod
+    def _reflink(source: pathlib.Path, target: pathlib.Path) -> None:
+        if fcntl is None:
+            raise OSError(errno.EOPNOTSUPP, "reflink is not supported on this platform")
+        with open(source, "rb") as source_file, open(target, "xb") as target_file:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
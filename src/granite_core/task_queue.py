@@ -2,170 +2,1106 @@
     这个任务队列太好用了你知道吗
 """
 
+import bisect
+import concurrent.futures
 import threading
+import collections
 import heapq
+import itertools
+import json
+import multiprocessing
+import queue
+import random
 import time
 import traceback
+import typing
+
+
+class TaskCancelled(Exception):
+    """任务被取消了（shutdown 之类的）"""
+
+
+class TaskTimedOut(TaskCancelled):
+    """任务跑超了 max_time"""
+
+
+class CancellationToken:
+    """
+    协作式取消令牌，任务带上 "cancellable": True 就会以 cancel_token 关键字参数传进去，
+    长时间跑的函数自己隔一会儿 check() 一下就行
+    """
+
+    def __init__(self, deadline: float | None = None) -> None:
+        self.deadline: float | None = deadline  # time.monotonic() 的时间点
+        self.reason: str | None = None  # "timeout" / "shutdown" / ...
+        self._event: threading.Event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def remaining(self) -> float | None:  # 离超时还有多久
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise TaskTimedOut(self.reason) if self.reason == "timeout" else TaskCancelled(self.reason)
+
+    def wait(self, timeout: float | None = None) -> bool:  # 能被取消打断的 sleep，被取消了返回 True
+        return self._event.wait(timeout)
+
+
+class TaskFuture(concurrent.futures.Future):
+    """add_task 返回的句柄，就是带了个 task_id 的 Future，result / done / add_done_callback 都有"""
+
+    def __init__(self, task_id: str) -> None:
+        super().__init__()
+        self.task_id: str = task_id
+
+
+def _format_description(description: str | tuple) -> str:
+    """描述可以是 (格式串, 参数...)，用到的时候才 format，几千个任务不用先拼几千个字符串"""
+    return description if isinstance(description, str) else description[0].format(*description[1:])
+
+
+class Task:
+    """
+    一个任务，字段和 add_task 的 dict 格式一一对应（"id" 在这里叫 task_id），
+    用 __slots__ 存，比一个十几个键的 dict 省内存，没给的字段全是默认值，不另外占 dict
+    """
+    __slots__ = ("task_id", "_description", "function", "args", "kwargs", "callback", "callback_args", "callback_kwargs",
+                 "max_time", "max_retries", "retry_delay", "retry_backoff", "retry_max_delay", "retry_jitter",
+                 "cancellable", "pre_tasks", "rate_key", "adaptive", "priority", "category", "executor", "retries", "info")
+    EXECUTORS: tuple[str, ...] = ("thread", "process")
+
+    def __init__(self, task_id: any, function: typing.Callable, args: tuple = (), kwargs: dict[str, any] | None = None,
+                 description: str | tuple = "", callback: typing.Callable | None = None, callback_args: tuple = (),
+                 callback_kwargs: dict[str, any] | None = None, max_time: float | None = None, max_retries: int = 0,
+                 retry_delay: float = 0, retry_backoff: float = 2, retry_max_delay: float = 60, retry_jitter: float = 0.5,
+                 cancellable: bool = False, pre_tasks: typing.Iterable = (), rate_key: str | None = None,
+                 adaptive: bool = False, priority: int = 0, category: str = "other", executor: str = "thread") -> None:
+        if executor not in self.EXECUTORS:
+            raise ValueError(f"Unknown executor: {executor}")
+        if executor == "process" and cancellable:
+            raise ValueError("Process tasks can't take a cancel_token")
+        self.task_id: str = str(task_id)
+        self._description: str | tuple = description
+        self.function: typing.Callable = function
+        self.args: tuple = args
+        self.kwargs: dict[str, any] | None = kwargs
+        self.callback: typing.Callable | None = callback
+        self.callback_args: tuple = callback_args
+        self.callback_kwargs: dict[str, any] | None = callback_kwargs
+        self.max_time: float | None = max_time
+        self.max_retries: int = max_retries
+        self.retry_delay: float = retry_delay
+        self.retry_backoff: float = retry_backoff
+        self.retry_max_delay: float = retry_max_delay
+        self.retry_jitter: float = retry_jitter
+        self.cancellable: bool = cancellable
+        self.pre_tasks: tuple[str, ...] = tuple(str(t) for t in pre_tasks)
+        self.rate_key: str | None = rate_key
+        self.adaptive: bool = adaptive
+        self.priority: int = priority
+        self.category: str = category  # 统计按这个分组，见 TaskMetrics
+        self.executor: str = executor  # "process" 的话 function 在进程池里跑，见 TaskQueue.get_process_pool
+        self.retries: int = 0  # 队列填，已经重试了几次
+        self.info: TaskInfo | None = None  # 队列填，登记表里对应的那条
+
+    @classmethod
+    def from_dict(cls, task: dict[str, any]) -> "Task":
+        """兼容老的 dict 格式"""
+        task = task.copy()
+        return cls(task.pop("id"), **task)
+
+    @property
+    def description(self) -> str:
+        return _format_description(self._description)
+
+    def __repr__(self) -> str:
+        return f"Task({self.task_id!r}, {self.description!r}, priority={self.priority})"
+
+
+class TaskInfo:
+    """
+    任务登记表里的一条，只留 id / 描述 / 优先级 / 状态和计时，不抓着 function 和 args 不放
+    时间都是 time.monotonic()，queue_wait / run_time 是所有尝试加起来的秒数
+    """
+    __slots__ = ("task_id", "_description", "priority", "state", "retries", "category", "worker",
+                 "enqueue_time", "ready_time", "queue_wait", "run_time")
+
+    def __init__(self, task_id: str, description: str | tuple, priority: int, state: str,
+                 category: str = "other", enqueue_time: float = 0.0) -> None:
+        self.task_id: str = task_id
+        self._description: str | tuple = description
+        self.priority: int = priority
+        self.state: str = state  # pending / queued / throttled / running / retry_wait / succeeded / failed / timed_out / cancelled
+        self.retries: int = 0
+        self.category: str = category
+        self.worker: int | None = None  # 最后一次是哪个工人线程跑的
+        self.enqueue_time: float = enqueue_time  # add_task 的时间
+        self.ready_time: float = enqueue_time  # 最近一次进堆（前置完成、重试）的时间
+        self.queue_wait: float = 0.0  # 在堆里（含被限流暂存）等了多久
+        self.run_time: float = 0.0
+
+    @property
+    def description(self) -> str:
+        return _format_description(self._description)
+
+    def __repr__(self) -> str:
+        return f"TaskInfo({self.task_id!r}, {self.description!r}, {self.priority}, {self.state!r}, retries={self.retries})"
+
+    def to_dict(self) -> dict[str, any]:
+        return {
+            "task_id": self.task_id, "description": self.description, "category": self.category, "priority": self.priority,
+            "state": self.state, "retries": self.retries, "worker": self.worker,
+            "queue_wait": self.queue_wait, "run_time": self.run_time,
+        }
+
+
+class _RunningTask:
+    """正在跑的一次执行，超时被 watchdog 接管后 abandoned = True，原来的线程跑完就退出"""
+    __slots__ = ("task", "future", "token", "abandoned", "start_time")
+
+    def __init__(self, task: Task, future: TaskFuture, token: CancellationToken | None, start_time: float) -> None:
+        self.task: Task = task
+        self.future: TaskFuture = future
+        self.token: CancellationToken | None = token  # 只有 cancellable 或者带 max_time 的才有
+        self.abandoned: bool = False
+        self.start_time: float = start_time
+
+
+class RateLimit:
+    """
+    一个限流键（一般是域名）的令牌桶 + 并发上限
+    rate: 每秒放几个令牌，None 不限速；burst: 桶容量；max_in_flight: 同时在跑的最大任务数，None 不限
+    """
+
+    def __init__(self, rate: float | None = None, burst: float | None = None, max_in_flight: int | None = None) -> None:
+        self.rate: float | None = rate
+        self.burst: float = burst if burst is not None else max(1.0, rate or 1.0)
+        self.max_in_flight: int | None = max_in_flight
+        self.tokens: float = self.burst
+        self.last_refill: float = time.monotonic()
+        self.in_flight: int = 0
+        self.parked: list = []  # 被限流暂存的堆条目，也是最小堆，出来的时候保持优先级
+        self.wakeup_scheduled: bool = False  # 是否已经挂了等令牌的定时器
+
+    def _refill(self, now: float) -> None:
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def available(self, now: float) -> int:
+        """现在还能放几个任务出去"""
+        self._refill(now)
+        slots: int | None = None
+        if self.max_in_flight is not None:
+            slots = self.max_in_flight - self.in_flight
+        if self.rate:
+            slots = int(self.tokens) if slots is None else min(slots, int(self.tokens))
+        return len(self.parked) + 1 if slots is None else max(0, slots)  # 不限的话，暂存的全放出来还能再多一个
+
+    def acquire(self, now: float) -> bool:
+        if not self.available(now):
+            return False
+        if self.rate:
+            self.tokens -= 1
+        self.in_flight += 1
+        return True
+
+    def release(self, refund: bool = False) -> None:
+        self.in_flight -= 1
+        if refund and self.rate:  # 拿到了令牌但最后没跑（被别的限制卡住 / 句柄取消了），还回去
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    def next_token_time(self, now: float) -> float | None:
+        """令牌不够的话，下一个令牌什么时候到；卡在并发上限的话返回 None（等有任务跑完）"""
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            return None
+        return now + max(0.0, 1 - self.tokens) / self.rate if self.rate else None
+
+
+def is_congestion_error(error: BaseException | None) -> bool:
+    """默认的拥塞判断：异常上挂着 HTTP 429 / 503 的响应（requests.HTTPError 这种）"""
+    status_code: int | None = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code in (429, 503)
+
+
+class AdaptiveConcurrency(RateLimit):
+    """
+    AIMD 自适应并发：带 "adaptive": True 的任务共用一个动态的并发上限
+    成功一次加 1 / limit（大概每跑满一轮 +1），遇到拥塞（429 / 503）、窗口内错误率过高、
+    或者延迟涨到基线的 latency_tolerance 倍时乘 decrease_factor，上下限 [min_limit, max_limit]
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial_limit: int | None = None,
+                 decrease_factor: float = 0.5, error_rate_threshold: float = 0.5, latency_tolerance: float | None = 4.0,
+                 window: int = 20, congestion_classifier: typing.Callable[[BaseException | None], bool] = is_congestion_error) -> None:
+        self.max_limit: int = max_limit
+        self.min_limit: int = min_limit
+        self.limit: float = float(initial_limit if initial_limit is not None else max(min_limit, max_limit // 4))
+        super().__init__(max_in_flight=int(self.limit))
+        self.decrease_factor: float = decrease_factor
+        self.error_rate_threshold: float = error_rate_threshold
+        self.latency_tolerance: float | None = latency_tolerance
+        self.congestion_classifier: typing.Callable[[BaseException | None], bool] = congestion_classifier
+        self.outcomes: collections.deque = collections.deque(maxlen=window)  # 最近几次是否失败
+        self.latency_ewma: float | None = None
+        self.latency_baseline: float | None = None  # 见过的最低的平滑延迟，慢慢往上漂，跟着网络变化
+        self.last_decrease: float = 0.0
+        self.congestion_events: int = 0
+        self.decreases: int = 0
+
+    def on_result(self, latency: float, error: BaseException | None, now: float) -> None:
+        """一次执行结束后喂进来（需持有队列的锁）"""
+        self.outcomes.append(error is not None)
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        self.latency_baseline = (self.latency_ewma if self.latency_baseline is None
+                                 else min(self.latency_ewma, self.latency_baseline * 1.01))
+
+        congested: bool = self.congestion_classifier(error)
+        self.congestion_events += congested
+        overloaded: bool = (
+            congested
+            or (len(self.outcomes) == self.outcomes.maxlen
+                and sum(self.outcomes) / len(self.outcomes) > self.error_rate_threshold)
+            or (self.latency_tolerance is not None and self.latency_ewma > self.latency_baseline * self.latency_tolerance)
+        )
+        if overloaded:
+            # 一波 429 往往是一起回来的，一个平滑延迟内只减一次，免得一下减到底
+            if now - self.last_decrease >= (self.latency_ewma or 0):
+                self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                self.last_decrease = now
+                self.decreases += 1
+                self.outcomes.clear()
+        elif error is None:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        self.max_in_flight = int(self.limit)
+
+    def snapshot(self) -> dict[str, any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "waiting": len(self.parked),
+            "latency_ewma": self.latency_ewma,
+            "latency_baseline": self.latency_baseline,
+            "error_rate": sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0,
+            "congestion_events": self.congestion_events,
+            "decreases": self.decreases,
+        }
+
+
+_STREAM_END = object()  # 结果流的结束标记
+
+
+class Histogram:
+    """固定桶的直方图（秒），只存每个桶自己的计数，导出的时候再累加成 Prometheus 那种 le 桶"""
+    __slots__ = ("buckets", "counts", "count", "sum")
+    BUCKETS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict[str, any]:
+        cumulative: list[int] = list(itertools.accumulate(self.counts))
+        return {
+            "buckets": dict(zip([*(str(bucket) for bucket in self.buckets), "+Inf"], cumulative)),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+class TaskMetrics:
+    """
+    按任务类别（Task.category）聚合的统计：排队等待 / 执行时间直方图、各种结局的计数、重试次数，
+    外加 on_enqueue / on_start / on_finish 钩子，钩子拿到的是 TaskInfo，在锁外调
+    更新都在队列的锁里做，只是几次加法和一次 bisect，常开没问题
+    """
+    HOOKS: tuple[str, ...] = ("on_enqueue", "on_start", "on_finish")
+
+    def __init__(self) -> None:
+        self.categories: dict[str, dict[str, any]] = {}
+        self.hooks: dict[str, list[typing.Callable[[TaskInfo], any]]] = {hook: [] for hook in self.HOOKS}
+
+    def _get_category(self, category: str) -> dict[str, any]:
+        if (stats := self.categories.get(category)) is None:
+            stats = self.categories[category] = {
+                "queue_wait": Histogram(), "run_time": Histogram(), "outcomes": collections.Counter(), "retries": 0,
+            }
+        return stats
+
+    def observe_start(self, category: str, queue_wait: float) -> None:
+        self._get_category(category)["queue_wait"].observe(queue_wait)
+
+    def observe_attempt(self, category: str, run_time: float) -> None:
+        self._get_category(category)["run_time"].observe(run_time)
+
+    def observe_retry(self, category: str) -> None:
+        self._get_category(category)["retries"] += 1
+
+    def observe_outcome(self, category: str, outcome: str) -> None:
+        self._get_category(category)["outcomes"][outcome] += 1
+
+    def snapshot(self) -> dict[str, any]:
+        return {
+            category: {
+                "queue_wait": stats["queue_wait"].snapshot(),
+                "run_time": stats["run_time"].snapshot(),
+                "outcomes": dict(stats["outcomes"]),
+                "retries": stats["retries"],
+            } for category, stats in self.categories.items()
+        }
+
+    def fire(self, hook: str, info: TaskInfo) -> None:
+        for function in self.hooks[hook]:
+            try:
+                function(info)
+            except Exception:  # 钩子炸了也别影响任务
+                traceback.print_exc()
+
+    @staticmethod
+    def to_prometheus(snapshot: dict[str, any], prefix: str = "granite_task_queue") -> str:
+        """TaskQueue.get_metrics() 的结果转成 Prometheus 文本格式"""
+        lines: list[str] = []
+        for gauge, value in snapshot["gauges"].items():
+            lines += [f"# TYPE {prefix}_{gauge} gauge", f"{prefix}_{gauge} {value}"]
+        for histogram in ("queue_wait", "run_time"):
+            lines.append(f"# TYPE {prefix}_{histogram}_seconds histogram")
+            for category, stats in snapshot["categories"].items():
+                for bucket, count in stats[histogram]["buckets"].items():
+                    lines.append(f'{prefix}_{histogram}_seconds_bucket{{category="{category}",le="{bucket}"}} {count}')
+                lines.append(f'{prefix}_{histogram}_seconds_sum{{category="{category}"}} {stats[histogram]["sum"]}')
+                lines.append(f'{prefix}_{histogram}_seconds_count{{category="{category}"}} {stats[histogram]["count"]}')
+        lines.append(f"# TYPE {prefix}_tasks_total counter")
+        for category, stats in snapshot["categories"].items():
+            for outcome, count in stats["outcomes"].items():
+                lines.append(f'{prefix}_tasks_total{{category="{category}",outcome="{outcome}"}} {count}')
+        lines.append(f"# TYPE {prefix}_retries_total counter")
+        for category, stats in snapshot["categories"].items():
+            lines.append(f'{prefix}_retries_total{{category="{category}"}} {stats["retries"]}')
+        return "\n".join(lines) + "\n"
 
 
 class TaskQueue:
-    def __init__(self, max_workers: int) -> None:
+    # 结果保留策略
+    RETENTION_ALL = "all"  # 全都留着（老行为）
+    RETENTION_CONSUMED = "consumed"  # get_result / get_results 读过一次就扔
+    RETENTION_CALLBACK = "callback"  # 任务回调跑完就扔（没回调的出结果就扔，结果在句柄里）
+    RETENTION_FAILURES = "failures"  # 只留失败的 traceback
+    RETENTION_STREAM = "stream"  # 不留，(task_id, result) 直接塞进结果流，用 iter_results() 消费
+    RETENTION_POLICIES = (RETENTION_ALL, RETENTION_CONSUMED, RETENTION_CALLBACK, RETENTION_FAILURES, RETENTION_STREAM)
+
+    def __init__(self, max_workers: int, retention: str = RETENTION_ALL, result_stream: queue.Queue | None = None,
+                 rate_limits: dict[str, dict[str, float]] | None = None,
+                 adaptive_concurrency: AdaptiveConcurrency | None = None,
+                 min_workers: int = 0, idle_timeout: float = 30.0, process_workers: int | None = None) -> None:
+        if retention not in self.RETENTION_POLICIES:
+            raise ValueError(f"Unknown retention policy: {retention}")
         self.max_workers: int = max_workers
-        self.original_tasks = []
-        self.tasks = []  # 最小堆，存储 (-priority, task_id, task)
-        self.pending_tasks = []  # 也是一堆
+        # 弹性线程池：有活且闲着的线程不够才起新线程，闲超过 idle_timeout 秒的线程回收，最少留 min_workers 个
+        self.min_workers: int = min(min_workers, max_workers)
+        self.idle_timeout: float = idle_timeout
+        self.retention: str = retention
+        self.result_stream: queue.Queue | None = (result_stream if result_stream is not None else queue.Queue()) \
+            if retention == self.RETENTION_STREAM else None
+        # 任务登记表，任务跑完后除了 RETENTION_ALL 都会被删掉，队列跑多少任务内存都不涨
+        self.task_registry: dict[str, TaskInfo] = {}
+        self.tasks = []  # 最小堆，存储 (-priority, task_id, task, future)，future 为 None 的是只跑回调的活
+        # 前置任务调度（DAG）：反向边 + 入度计数，前置完成时直接把依赖方推进 tasks，不用再轮询
+        self.pending_tasks: dict[int, list] = {}  # task_counter -> [剩余前置数, (-priority, task_counter, task, future)]
+        self.dependents: dict[str, list[int]] = {}  # 前置 id -> 依赖它的 task_counter 列表
+        # 已经出结果的 id（成功失败都算）；RETENTION_ALL 以外登记表放掉的时候一起删，见 _is_pre_task_finished
+        self.finished_tasks: set[str] = set()
         self.task_counter = 0
-        self.runnable_tasks: dict[int, dict] = {}
-        self.thread_pool = [threading.Thread(target=self.run_runnable_task, args=(i,)) for i in range(max_workers)]
+        self.running_tasks: set[_RunningTask] = set()
+        # 定时器最小堆，存储 (time.monotonic() 时间点, 序号, 类型, 内容)
+        # "deadline": max_time 超时点，内容是 _RunningTask；"retry": 退避结束重新入堆，内容是堆条目
+        # "rate": 限流键的令牌到了，内容是 RateLimit
+        self.timers: list = []
+        self.delayed_tasks: int = 0  # 不在堆里但之后会回来的任务数（在 timers 里等重试的 + 被限流暂存的）
+        # 限流键 -> RateLimit，带 "rate_key" 的任务出堆时检查，超了就暂存起来去跑别的任务
+        self.rate_limits: dict[str, RateLimit] = {key: RateLimit(**limit) for key, limit in (rate_limits or {}).items()}
+        # 带 "adaptive": True 的任务再过一道 AIMD 的动态并发上限，None 就是不开
+        self.adaptive_concurrency: AdaptiveConcurrency | None = adaptive_concurrency
+        self.timer_thread: threading.Thread | None = None  # 第一次用到定时器时才启动
+        self.thread_pool: set[threading.Thread] = set()  # 活着的工人线程（包括超时被顶替、还没退出的）
+        self.live_workers: int = 0  # 还在干活或者等活的工人线程数，不算被顶替的
+        self.idle_workers: int = 0  # 正在等活的工人线程数
+        self.worker_counter: int = 0
         self.stop_flag: bool = False
+        self.running_flag: bool = False  # run() 之前只收任务不执行，保证第一批任务按优先级开跑
+        self.active_tasks: int = 0  # 正在执行（含回调）的任务数
         self.lock: threading.Lock = threading.Lock()  # This is a lock
-        self.free_threads: list[int] = list(range(max_workers))
         self.results: dict[str, any] = {}
-        self.condition = threading.Condition(self.lock)  # And this is a condition
-        for t in self.thread_pool:
-            t.start()
+        self.condition = threading.Condition(self.lock)  # And this is a condition，工人线程等活用
+        self.idle_condition = threading.Condition(self.lock)  # 这个是 run() 等队列跑空用的
+        self.timer_condition = threading.Condition(self.lock)  # watchdog 等下一个超时点用的
+        self.metrics: TaskMetrics = TaskMetrics()  # 按类别的计时统计和钩子，见 get_metrics / add_hook
+        # "executor": "process" 的任务用的进程池，第一次用到才建，None 就是 CPU 核数个进程
+        self.process_workers: int | None = process_workers
+        self.process_pool: concurrent.futures.ProcessPoolExecutor | None = None
+        with self.lock:
+            for _ in range(self.min_workers):
+                self._start_worker()
+
+    def _start_worker(self) -> None:  # 需持有锁
+        # daemon：被超时卡死、已经被顶替的线程不能拖着进程不让退出
+        thread = threading.Thread(target=self.run_runnable_task, args=(self.worker_counter,), daemon=True)
+        self.worker_counter += 1
+        self.live_workers += 1
+        self.thread_pool.add(thread)
+        thread.start()
+
+    def _task_ready(self, count: int = 1) -> None:
+        """堆里多了 count 个任务（需持有锁）：叫醒等活的线程，不够的话在 max_workers 以内补新线程"""
+        if not self.running_flag or self.stop_flag:
+            return
+        self.condition.notify(count)
+        # 被叫醒还没来拿任务的线程仍然算在 idle_workers 里，任务也还在堆里，两边对得上
+        for _ in range(min(len(self.tasks) - self.idle_workers, self.max_workers - self.live_workers)):
+            self._start_worker()
 
-    def add_task(self, task: dict[str, any]) -> None:
+    def get_worker_count(self) -> int:
+        with self.lock:
+            return self.live_workers
+
+    def add_task(self, task: Task | dict[str, any]) -> TaskFuture:
         """
-        Task format:
+        Task format (dict form, kept for compatibility; a Task takes the same fields as keyword arguments):
         {
             "id": id,
-            "description": description,
+            "description": description, or (format string, *args) formatted only when read,
             "function": function to be executed,
             "args": args,
             "kwargs": kwargs,
             "callback": callback function,
             "callback_args": callback args,
             "callback_kwargs": callback kwargs,
-            "max_time": max time (seconds),
+            "max_time": max time of one attempt (seconds), timed-out attempts are retried or failed with TaskTimedOut,
             "max_retries": max retries, -1 = infinite,
-            "pre_tasks": pre-task list (task ids),
-            "priority": priority (higher number = higher priority)
+            "retry_delay": base delay before a retry (seconds), 0 = retry at once,
+            "retry_backoff": exponential backoff factor (default 2),
+            "retry_max_delay": upper bound of the retry delay (seconds, default 60),
+            "retry_jitter": fraction of the delay randomly taken off (default 0.5),
+            "cancellable": pass a CancellationToken to function as the cancel_token keyword argument,
+            "pre_tasks": pre-task list (task ids); unless retention is "all", add pre-tasks before their dependents,
+                         an id the queue no longer knows counts as finished,
+            "rate_key": rate limit key (e.g. the host), see set_rate_limit,
+            "adaptive": count against the adaptive (AIMD) concurrency limit and feed it latency / errors,
+            "priority": priority (higher number = higher priority),
+            "category": metrics group (e.g. "asset"), see get_metrics,
+            "executor": "thread" (default) or "process" to run function in the process pool, see get_process_pool
         }
+        The number of retries used so far is in get_task_info(task_id).retries.
         :param task: Task to be added
-        :return: None
+        :return: Future-like handle of the task (result(timeout), done(), add_done_callback(fn))
         """
-        # task 也要初始化
-        task["id"] = str(task["id"])
-        if "pre_tasks" in task:
-            task["pre_tasks"] = [str(t) for t in task["pre_tasks"]]
+        task = self._prepare_task(task)
+        future: TaskFuture = TaskFuture(task.task_id)
+        with self.lock:
+            now: float = time.monotonic()
+            if (entry := self._register_task(task, future, now)) is not None:
+                self._push_ready([entry])
+        if self.metrics.hooks["on_enqueue"]:
+            self.metrics.fire("on_enqueue", task.info)
+        return future
 
+    def add_tasks(self, tasks: typing.Iterable[Task | dict[str, any]]) -> list[TaskFuture]:
+        """
+        批量 add_task：整批在锁外初始化好，一次拿锁全部登记，能跑的一次性合进堆里，按新任务数叫醒线程
+        同一批里的任务可以互为前置（顺序无所谓）
+        :param tasks: Tasks to be added, same format as add_task
+        :return: Handles of the tasks, in the same order
+        """
+        task_list: list[Task] = [self._prepare_task(task) for task in tasks]
+        futures: list[TaskFuture] = [TaskFuture(task.task_id) for task in task_list]
         with self.lock:
-            if task.get("pre_tasks"):  # Check if this task includes pre-tasks，然后什么什么 blabla 的
-                priority = task.get("priority", 0)
-                heapq.heappush(self.pending_tasks, (-priority, self.task_counter, task))
-                self.task_counter += 1
-                self.condition.notify()
-            else:
-                # 优先级默认为 0
-                priority = task.get("priority", 0)
-                heapq.heappush(self.tasks, (-priority, self.task_counter, task))
-                heapq.heappush(self.original_tasks, (-priority, self.task_counter, task))
-                self.task_counter += 1
-                self.condition.notify()
+            now: float = time.monotonic()
+            ready: list[tuple] = [entry for task, future in zip(task_list, futures)
+                                  if (entry := self._register_task(task, future, now)) is not None]
+            self._push_ready(ready)
+        if self.metrics.hooks["on_enqueue"]:
+            for task in task_list:
+                self.metrics.fire("on_enqueue", task.info)
+        return futures
+
+    @staticmethod
+    def _prepare_task(task: Task | dict[str, any]) -> Task:
+        return Task.from_dict(task) if isinstance(task, dict) else task
+
+    def _register_task(self, task: Task, future: TaskFuture, now: float) -> tuple | None:
+        """登记任务（需持有锁），前置都完成了的返回堆条目，交给 _push_ready 入堆"""
+        entry = (-task.priority, self.task_counter, task, future)
+        self.task_counter += 1
+        task.info = TaskInfo(task.task_id, task._description, task.priority, "queued", task.category, now)
+        self.task_registry[task.task_id] = task.info
+
+        # 只记还没完成的前置，已经完成的直接不算入度
+        unfinished_pre_tasks = [t for t in dict.fromkeys(task.pre_tasks) if not self._is_pre_task_finished(t)]
+        if unfinished_pre_tasks:  # Check if this task includes pre-tasks，然后什么什么 blabla 的
+            task.info.state = "pending"
+            self.pending_tasks[entry[1]] = [len(unfinished_pre_tasks), entry]
+            for pre_task in unfinished_pre_tasks:
+                self.dependents.setdefault(pre_task, []).append(entry[1])
+            return None
+        return entry
+
+    def _is_pre_task_finished(self, task_id: str) -> bool:  # 需持有锁
+        """
+        RETENTION_ALL 什么都留着，看 finished_tasks 就行；别的策略跑完放掉的 id 不留，内存才不涨：
+        登记表里没有、也没有别的任务在等它的 id 就当是早跑完放掉了（所以前置任务得先加，同一次 add_tasks 里排在前面也行）
+        """
+        if task_id in self.finished_tasks:
+            return True
+        if self.retention == self.RETENTION_ALL:
+            return False
+        return task_id not in self.task_registry and task_id not in self.dependents
+
+    def _push_ready(self, entries: list[tuple]) -> None:
+        """一批能跑的条目入堆（需持有锁）：少的逐个 push，多的直接拼上去整体 heapify（O(n) 比 n 次 O(log n) 划算）"""
+        if not entries:
+            return
+        if len(entries) * 4 < len(self.tasks):
+            for entry in entries:
+                heapq.heappush(self.tasks, entry)
+        else:
+            self.tasks.extend(entries)
+            heapq.heapify(self.tasks)
+        self._task_ready(len(entries))
 
     def run(self) -> None:
-        """主运行循环，将任务分配给空闲线程"""
-        pre_task_thread: threading.Thread = threading.Thread(target=self.check_pre_tasks)
-        pre_task_thread.start()
+        """主运行循环：工人线程自己从堆里拿任务，这里只负责等到队列跑空"""
+        self._wait_idle(None)
 
-        while not self.stop_flag:
-            with self.lock:
-                if not self.free_threads or not self.tasks:
-                    if (not self.tasks and
-                            not self.runnable_tasks and
-                            not self.pending_tasks and
-                            len(self.free_threads) == len(self.thread_pool)
-                    ):  # 究极 shutdown 条件
-                        break
-                    self.condition.wait(1)
-                    continue
+        if self.result_stream is not None:
+            self.result_stream.put(_STREAM_END)
+
+    def _wait_idle(self, timeout: float | None) -> bool:
+        """放工人线程开工，等到堆空且没有任务在跑，超时返回 False"""
+        deadline: float | None = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            self.running_flag = True
+            self._task_ready(len(self.tasks))  # 有几个活叫醒几个
+            # 究极 shutdown 条件（没有任务在跑的话，pending_tasks 里剩下的前置永远不会完成了）
+            while not self.stop_flag and (self.tasks or self.active_tasks or self.delayed_tasks):
+                if deadline is None:
+                    self.idle_condition.wait()
+                elif (remaining := deadline - time.monotonic()) <= 0 or not self.idle_condition.wait(remaining):
+                    return not (self.tasks or self.active_tasks or self.delayed_tasks)
+        return True
 
-                # 获取优先级最高的任务
-                if self.tasks:
-                    _, _, task = heapq.heappop(self.tasks)
-                    if self.free_threads:
-                        thread_id = self.free_threads.pop(0)
-                        self.runnable_tasks[thread_id] = task
-                        self.condition.notify_all()
+    def _finish_task(self, task_id: str) -> None:
+        """任务出结果后调用（需持有锁），沿反向边把入度减到 0 的依赖任务放进 tasks"""
+        self.finished_tasks.add(task_id)
+        ready: list[tuple] = []
+        now: float = time.monotonic()
+        for task_counter in self.dependents.pop(task_id, ()):
+            pending = self.pending_tasks[task_counter]
+            pending[0] -= 1
+            if not pending[0]:
+                del self.pending_tasks[task_counter]
+                pending[1][2].info.state = "queued"
+                pending[1][2].info.ready_time = now
+                ready.append(pending[1])
+        self._push_ready(ready)
 
-            # print(self.free_threads)  # 测试用的这玩意
+    def _set_task_state(self, task_id: str, state: str) -> None:  # 需持有锁
+        if task_id in self.task_registry:
+            self.task_registry[task_id].state = state
 
-    def check_pre_tasks(self) -> None:
-        ready_tasks = []
-        while not self.stop_flag:
+    def _store_result(self, task_id: str, result: any, failed: bool) -> None:
+        """按保留策略存结果（需持有锁）"""
+        self._set_task_state(task_id, "failed" if failed else "succeeded")
+        if self.retention == self.RETENTION_STREAM:
+            self.result_stream.put((task_id, result))
+        elif failed or self.retention != self.RETENTION_FAILURES:
+            self.results[task_id] = result
+
+    def _release_task(self, task_id: str) -> None:
+        """任务连回调都跑完了（需持有锁），按保留策略清理登记表和结果"""
+        if self.retention == self.RETENTION_ALL:
+            return
+        self.task_registry.pop(task_id, None)
+        self.finished_tasks.discard(task_id)
+        if self.retention == self.RETENTION_CALLBACK:
+            self.results.pop(task_id, None)
+
+    def _notify_if_idle(self) -> None:  # 需持有锁
+        if not self.active_tasks and not self.tasks and not self.delayed_tasks:
+            self.idle_condition.notify_all()
+
+    def run_runnable_task(self, thread_id: int) -> None:
+        """线程执行任务的函数，直接从共享的堆里拿优先级最高的任务"""
+        while True:
             with self.lock:
-                if ready_tasks:
-                    for task in ready_tasks:
-                        heapq.heappush(self.tasks, task)
+                while not self.stop_flag and (not self.running_flag or not self.tasks):
+                    self.idle_workers += 1
+                    notified: bool = self.condition.wait(self.idle_timeout if self.live_workers > self.min_workers else None)
+                    self.idle_workers -= 1
+                    if not notified and not self.tasks and self.live_workers > self.min_workers:
+                        break  # 闲太久了，回收
+                if self.stop_flag or not self.tasks or not self.running_flag:
+                    self.live_workers -= 1
+                    self.thread_pool.discard(threading.current_thread())
+                    return
 
-                    ready_tasks = []
+                entry: tuple = heapq.heappop(self.tasks)
+                _, _, task, future = entry
+                running: _RunningTask | None = None
+                if future is not None:
+                    if not self._acquire_gates(entry):
+                        continue  # 限流了，已经先放一边，接着看堆里下一个
+                    # 重试的时候句柄已经是 running 了；没开跑就被取消的跳过，但依赖它的任务还是要放出来
+                    if not future.running() and not future.set_running_or_notify_cancel():
+                        self._release_gates(task, refund=True)
+                        self._set_task_state(task.task_id, "cancelled")
+                        self.metrics.observe_outcome(task.category, "cancelled")
+                        self._finish_task(task.task_id)
+                        self._release_task(task.task_id)
+                        self._notify_if_idle()
+                        continue
+                    self._set_task_state(task.task_id, "running")
+                    running = self._start_attempt(task, future, thread_id)
+                self.active_tasks += 1
 
-                if not self.pending_tasks:
-                    break
+            if running is None:  # 超时任务的回调，watchdog 扔回来给工人线程跑的
+                try:
+                    self._run_callback(task)
+                finally:
+                    with self.lock:
+                        self._release_task(task.task_id)
+                        self.active_tasks -= 1
+                        self._notify_if_idle()
+                continue
 
-                # 遍历等待任务，看看 if 任务的前置执行完毕（看起来思路很 l，实则实现也是）
-                for i in range(len(self.pending_tasks)):
-                    priority, task_counter, task = self.pending_tasks[i]
+            if self.metrics.hooks["on_start"]:
+                self.metrics.fire("on_start", task.info)
+            if not self._execute_task(running):
+                with self.lock:  # 超时被 watchdog 接管了，已经有新线程顶上，这个线程退休
+                    self.thread_pool.discard(threading.current_thread())
+                return
 
-                    pre_tasks_set = set(task["pre_tasks"])
-                    results_keys = set(self.results.keys())
-                    if pre_tasks_set.issubset(results_keys):
-                        ready_tasks.append((priority, task_counter, task))
-                        self.pending_tasks.pop(i)
-                        break
+    def set_rate_limit(self, key: str, rate: float | None = None, burst: float | None = None,
+                       max_in_flight: int | None = None) -> None:
+        """给一个限流键设置令牌桶（rate 个每秒，容量 burst）和并发上限，任务用 "rate_key" 指定键"""
+        with self.lock:
+            rate_limit: RateLimit = RateLimit(rate, burst, max_in_flight)
+            # 换配置的话之前暂存的任务要接着管；旧桶挂着的定时器到点了什么也不做，见 _fire_due_timers
+            if old_rate_limit := self.rate_limits.get(key):
+                rate_limit.parked, rate_limit.in_flight = old_rate_limit.parked, old_rate_limit.in_flight
+            self.rate_limits[key] = rate_limit
+            self._unpark(rate_limit)
 
-    def run_runnable_task(self, thread_id: int) -> None:
-        """线程执行任务的函数"""
-        while not self.stop_flag:
+    def _park(self, rate_limit: RateLimit, entry: tuple) -> None:
+        """暂存被限流的任务（需持有锁），缺令牌的话挂个定时器，到点放出来"""
+        heapq.heappush(rate_limit.parked, entry)
+        self.delayed_tasks += 1
+        self._set_task_state(entry[2].task_id, "throttled")
+        self._schedule_unpark(rate_limit)
+
+    def _schedule_unpark(self, rate_limit: RateLimit) -> None:  # 需持有锁
+        if rate_limit.parked and not rate_limit.wakeup_scheduled:
+            if (wakeup_time := rate_limit.next_token_time(time.monotonic())) is not None:
+                rate_limit.wakeup_scheduled = True
+                self._add_timer(wakeup_time, "rate", rate_limit)
+
+    def _unpark(self, rate_limit: RateLimit) -> None:
+        """令牌或者并发名额回来了（需持有锁），放能放的数量回堆里"""
+        for _ in range(min(rate_limit.available(time.monotonic()), len(rate_limit.parked))):
+            entry: tuple = heapq.heappop(rate_limit.parked)
+            self.delayed_tasks -= 1
+            self._set_task_state(entry[2].task_id, "queued")
+            heapq.heappush(self.tasks, entry)
+            self._task_ready()
+        self._schedule_unpark(rate_limit)
+
+    def _get_gates(self, task: Task) -> list[RateLimit]:
+        gates: list[RateLimit] = []
+        if task.rate_key is not None and (rate_limit := self.rate_limits.get(task.rate_key)) is not None:
+            gates.append(rate_limit)
+        if self.adaptive_concurrency is not None and task.adaptive:
+            gates.append(self.adaptive_concurrency)
+        return gates
+
+    def _acquire_gates(self, entry: tuple) -> bool:
+        """过限流键和自适应并发这几道关（需持有锁），哪道过不去就退还前面拿到的，暂存在那道关里"""
+        gates: list[RateLimit] = self._get_gates(entry[2])
+        now: float = time.monotonic()
+        for i, gate in enumerate(gates):
+            if not gate.acquire(now):
+                for acquired_gate in gates[: i]:
+                    acquired_gate.release(refund=True)
+                self._park(gate, entry)
+                return False
+        return True
+
+    def _release_gates(self, task: Task, refund: bool = False) -> None:  # 一次执行结束（需持有锁）
+        for gate in self._get_gates(task):
+            gate.release(refund)
+            if gate.parked:
+                self._unpark(gate)
+
+    def _start_attempt(self, task: Task, future: TaskFuture, thread_id: int) -> _RunningTask:
+        """登记一次执行，带 max_time 的给 watchdog 挂个超时点（需持有锁），用不上令牌的任务就不建 Event 了"""
+        now: float = time.monotonic()
+        task.info.worker = thread_id
+        task.info.queue_wait += now - task.info.ready_time
+        self.metrics.observe_start(task.category, now - task.info.ready_time)
+        deadline: float | None = now + task.max_time if task.max_time else None
+        token: CancellationToken | None = CancellationToken(deadline) if task.cancellable or deadline is not None else None
+        running: _RunningTask = _RunningTask(task, future, token, now)
+        self.running_tasks.add(running)
+        if deadline is not None:
+            self._add_timer(deadline, "deadline", running)
+        return running
+
+    def get_process_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        """
+        进程池，第一次用到才建，用 spawn 启动（带着一堆线程 fork 不安全，Windows 上也只有 spawn）
+        function / args / 返回值都要 pickle 过去，所以 function 得是模块级函数或者静态方法，
+        参数传文件路径、让子进程自己读，别把文件内容塞进 args；也可以直接 map 一批路径进来
+        """
+        with self.lock:
+            if self.process_pool is None:
+                self.process_pool = concurrent.futures.ProcessPoolExecutor(
+                    self.process_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.process_pool
+
+    def _add_timer(self, when: float, kind: str, payload: any) -> None:  # 需持有锁
+        if self.timer_thread is None:
+            self.timer_thread = threading.Thread(target=self._run_timers, daemon=True)
+            self.timer_thread.start()
+        heapq.heappush(self.timers, (when, self.task_counter, kind, payload))
+        self.task_counter += 1
+        if self.timers[0][3] is payload:  # 新的最早的点，叫醒定时器线程重新算等待时间
+            self.timer_condition.notify()
+
+    @staticmethod
+    def _retry_delay(task: Task) -> float:
+        """第 n 次重试等 retry_delay * retry_backoff ** (n - 1) 秒，封顶 retry_max_delay，再乘上 (1 - retry_jitter * random())"""
+        if task.retry_delay <= 0:
+            return 0
+        delay: float = min(task.retry_max_delay, task.retry_delay * task.retry_backoff ** (task.retries - 1))
+        return delay * (1 - task.retry_jitter * random.random())
+
+    def _execute_task(self, running: _RunningTask) -> bool:
+        """跑一次任务本体，失败了按 max_retries 放回堆里重试，出最终结果了再跑回调；被 watchdog 接管了返回 False"""
+        task: Task = running.task
+        kwargs: dict[str, any] = task.kwargs or {}
+        if task.cancellable:
+            kwargs = {**kwargs, "cancel_token": running.token}
+
+        result: any = None
+        error: BaseException | None = None
+        try:
+            if task.executor == "process":
+                # 工人线程只是在这等子进程，不占 GIL；回调、重试、统计还是在这边做
+                result = self.get_process_pool().submit(task.function, *task.args, **kwargs).result()
+            else:
+                result = task.function(*task.args, **kwargs)
+        except Exception as e:
+            error = e
+            result = traceback.format_exc()
+
+        with self.lock:
+            if running.abandoned:
+                return False  # 结果作废，watchdog 那边已经记过超时了
+            finished: bool = self._complete_attempt(running, result, error)
+
+        try:
+            if finished:
+                self._resolve_future(running.future, result, error)
+                if self.metrics.hooks["on_finish"]:
+                    self.metrics.fire("on_finish", task.info)
+                self._run_callback(task)
+        finally:
             with self.lock:
-                if thread_id not in self.runnable_tasks:
-                    if thread_id not in self.free_threads:
-                        self.free_threads.append(thread_id)
-                    self.condition.wait()
-                    continue
+                if finished:  # 还要重试的话登记表里留着，重试次数、回调都要查
+                    self._release_task(task.task_id)
+                self.active_tasks -= 1
+                self._notify_if_idle()
+        return True
 
-                task = self.runnable_tasks[thread_id]
-                del self.runnable_tasks[thread_id]
+    def _complete_attempt(self, running: _RunningTask, result: any, error: BaseException | None) -> bool:
+        """
+        一次执行出结果后调用（需持有锁）
+        还能重试的话重新放回堆里，返回 False；否则记结果、放出依赖任务，返回 True（之后在锁外 resolve 句柄、跑回调）
+        """
+        task: Task = running.task
+        now: float = time.monotonic()
+        self.running_tasks.discard(running)
+        task.info.run_time += now - running.start_time
+        self.metrics.observe_attempt(task.category, now - running.start_time)
+        if self.adaptive_concurrency is not None and task.adaptive:
+            self.adaptive_concurrency.on_result(now - running.start_time, error, now)
+        self._release_gates(task)
+        if error is not None:
+            if not self.stop_flag and (task.max_retries == -1 or task.retries < task.max_retries):
+                task.retries += 1
+                task.info.retries = task.retries
+                self.metrics.observe_retry(task.category)
+                entry: tuple = (-task.priority, self.task_counter, task, running.future)
+                self.task_counter += 1
+                if delay := self._retry_delay(task):  # 退避期间不占线程，到点了定时器线程再放回堆里
+                    self._set_task_state(task.task_id, "retry_wait")
+                    self.delayed_tasks += 1
+                    self._add_timer(now + delay, "retry", entry)
+                else:
+                    self._set_task_state(task.task_id, "queued")
+                    task.info.ready_time = now
+                    heapq.heappush(self.tasks, entry)
+                    self._task_ready()
+                return False
 
-            while True:
-                for _ in range(task.get("max_retries", 0) + 1):
-                    try:
-                        result = task["function"](*task.get("args", ()), **task.get("kwargs", {}))
-                        with self.lock:
-                            self.results[task["id"]] = result
-                        break
-                    except Exception:
-                        if _ == task.get("max_retries", 0):
-                            with self.lock:
-                                self.results[task["id"]] = traceback.format_exc()
+        self._store_result(task.task_id, result, error is not None)
+        if isinstance(error, TaskTimedOut):
+            self._set_task_state(task.task_id, "timed_out")
+        self.metrics.observe_outcome(task.category, task.info.state)
+        self._finish_task(task.task_id)
+        return True
 
-                if task.get("max_retries", 0) != -1:  # 这个地方添柴（sb）设计有没有
-                    break  # 不想动了
+    @staticmethod
+    def _resolve_future(future: TaskFuture, result: any, error: BaseException | None) -> None:
+        if future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
 
-            if task.get("callback", 0):
-                task["callback"](*task.get("callback_args", ()), **task.get("callback_kwargs", {}))
+    @staticmethod
+    def _run_callback(task: Task) -> None:
+        if task.callback:
+            try:
+                task.callback(*task.callback_args, **(task.callback_kwargs or {}))
+            except Exception:  # 回调炸了也别把工人线程带走
+                traceback.print_exc()
 
+    def _run_timers(self) -> None:
+        """
+        定时器线程
+        "retry"：退避时间到了，任务放回堆里
+        "deadline"：到点了还没跑完的执行，取消令牌、按失败处理（重试或者记 TaskTimedOut），
+        卡住的线程让它自己跑完退休，另起一个新线程顶上，免得慢镜像把线程池占满
+        """
+        while True:
             with self.lock:
-                self.free_threads.append(thread_id)
-                self.condition.notify()
+                while not self.stop_flag and (not self.timers or self.timers[0][0] > time.monotonic()):
+                    self.timer_condition.wait(self.timers[0][0] - time.monotonic() if self.timers else None)
+                if self.stop_flag:
+                    return
+                timed_out: list[tuple[_RunningTask, bool, TaskTimedOut]] = self._fire_due_timers(time.monotonic())
+
+            for running, finished, error in timed_out:
+                if not finished:
+                    continue
+                self._resolve_future(running.future, None, error)
+                if self.metrics.hooks["on_finish"]:
+                    self.metrics.fire("on_finish", running.task.info)
+                if running.task.callback:
+                    with self.lock:  # 回调扔回堆里给工人线程跑
+                        heapq.heappush(self.tasks, (-running.task.priority, self.task_counter, running.task, None))
+                        self.task_counter += 1
+                        self._task_ready()
+                else:
+                    with self.lock:
+                        self._release_task(running.task.task_id)
+
+    def _fire_due_timers(self, now: float) -> list[tuple[_RunningTask, bool, TaskTimedOut]]:
+        """处理到点的定时器（需持有锁），返回超时了的执行 [(执行, 是否出了最终结果, 异常)]，句柄和回调交给调用方在锁外处理"""
+        timed_out: list[tuple[_RunningTask, bool, TaskTimedOut]] = []
+        while self.timers and self.timers[0][0] <= now:
+            _, _, kind, payload = heapq.heappop(self.timers)
+            if kind == "rate":
+                if payload is not self.adaptive_concurrency and not any(payload is limit for limit in self.rate_limits.values()):
+                    continue  # set_rate_limit 换掉了的旧桶，暂存的任务归新桶管，新桶自己挂了定时器
+                payload.wakeup_scheduled = False
+                self._unpark(payload)
+                continue
+            if kind == "retry":
+                self.delayed_tasks -= 1
+                self._set_task_state(payload[2].task_id, "queued")
+                payload[2].info.ready_time = now
+                heapq.heappush(self.tasks, payload)
+                self._task_ready()
+                continue
+
+            running: _RunningTask = payload
+            if running not in self.running_tasks:
+                continue  # 早跑完了
+            running.token.cancel("timeout")
+            running.abandoned = True
+            self.active_tasks -= 1
+            self._abandon_attempt(running)
+            error: TaskTimedOut = TaskTimedOut(f"Task {running.task.task_id} exceeded max_time of {running.task.max_time}s")
+            finished: bool = self._complete_attempt(running, f"TaskTimedOut: {error}", error)
+            timed_out.append((running, finished, error))
+        self._notify_if_idle()
+        return timed_out
 
-    def shutdown(self) -> None:  # 停机
-        self.stop_flag = True
+    def _abandon_attempt(self, running: _RunningTask) -> None:  # 需持有锁
+        self.live_workers -= 1  # 卡住的线程不算数了，有活的话 _task_ready 会补
+        self._task_ready(0)
+
+    def shutdown(self, cancel_pending: bool = True, timeout: float | None = None) -> bool:  # 停机
+        """
+        停机
+        :param cancel_pending: True 的话没跑的任务直接丢掉（句柄取消），正在跑的取消令牌；False 的话先等队列跑完
+        :param timeout: 最多等多久（秒），None 就一直等
+        :return: 所有线程都退出了就返回 True
+        """
+        deadline: float | None = None if timeout is None else time.monotonic() + timeout
+        if not cancel_pending:
+            self._wait_idle(timeout)
+
+        interrupted: list[TaskFuture] = []  # 等重试的任务句柄已经是 running 了，cancel() 不掉，锁外给个 TaskCancelled
         with self.lock:
+            self.stop_flag = True
+            # 没跑的任务直接丢掉，句柄也取消掉，免得有人一直等
+            delayed_entries: list[tuple] = [timer[3] for timer in self.timers if timer[2] == "retry"]
+            for rate_limit in list(self.rate_limits.values()) + ([self.adaptive_concurrency] if self.adaptive_concurrency else []):
+                delayed_entries += rate_limit.parked
+                rate_limit.parked = []
+            for entry in self.tasks + delayed_entries + [pending[1] for pending in self.pending_tasks.values()]:
+                if entry[3] is not None:
+                    if not entry[3].cancel():
+                        interrupted.append(entry[3])
+                    self._set_task_state(entry[2].task_id, "cancelled")
+                    self.metrics.observe_outcome(entry[2].category, "cancelled")
+                self._release_task(entry[2].task_id)
+            for running in self.running_tasks:
+                if running.token is not None:
+                    running.token.cancel("shutdown")
             self.tasks = []
-            self.runnable_tasks = {}
+            self.timers = [timer for timer in self.timers if timer[2] == "deadline"]
+            heapq.heapify(self.timers)
+            self.delayed_tasks = 0
+            self.pending_tasks = {}
+            self.dependents = {}
             self.condition.notify_all()
-        for thread in self.thread_pool:
-            thread.join()
+            self.idle_condition.notify_all()
+            self.timer_condition.notify_all()
+            threads: list[threading.Thread] = list(self.thread_pool) + ([self.timer_thread] if self.timer_thread else [])
+            process_pool, self.process_pool = self.process_pool, None
+
+        if process_pool is not None:  # 还没开跑的子进程任务直接取消，等着的工人线程会拿到 CancelledError
+            process_pool.shutdown(wait=timeout is None, cancel_futures=True)
+        for future in interrupted:
+            self._resolve_future(future, None, TaskCancelled("shutdown"))
+
+        for thread in threads:
+            if thread is threading.current_thread():  # 在任务里面停机的话不能 join 自己
+                continue
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in threads if thread is not threading.current_thread())
 
     def get_results(self) -> dict[str, any]:  # 拿结果
         with self.lock:
-            return self.results.copy()
+            results = self.results.copy()
+            if self.retention == self.RETENTION_CONSUMED:
+                self.results.clear()
+            return results
+
+    def get_result(self, task_id: str, default: any = None) -> any:  # 只拿一个，不用整个 copy
+        with self.lock:
+            if self.retention == self.RETENTION_CONSUMED:
+                return self.results.pop(str(task_id), default)
+            return self.results.get(str(task_id), default)
+
+    def iter_results(self, timeout: float | None = None) -> typing.Iterator[tuple[str, any]]:
+        """RETENTION_STREAM 下边跑边拿 (task_id, result)，run() 结束后迭代结束"""
+        if self.result_stream is None:
+            raise RuntimeError("iter_results() needs retention=\"stream\"")
+        while (item := self.result_stream.get(timeout=timeout)) is not _STREAM_END:
+            yield item
+
+    @staticmethod
+    def wait(handles: typing.Iterable[TaskFuture], timeout: float | None = None,
+             return_when: str = concurrent.futures.ALL_COMPLETED) -> tuple[set[TaskFuture], set[TaskFuture]]:
+        """阻塞等待一批句柄，返回 (done, not_done)，不用再 sleep 轮询 get_results()"""
+        return concurrent.futures.wait(handles, timeout, return_when)
+
+    @staticmethod
+    def as_completed(handles: typing.Iterable[TaskFuture], timeout: float | None = None) -> typing.Iterator[TaskFuture]:
+        """谁先完成先 yield 谁"""
+        return concurrent.futures.as_completed(handles, timeout)
+
+    def get_concurrency(self) -> int:
+        """当前有效并发：开了自适应就是 AIMD 的上限，否则就是 max_workers"""
+        with self.lock:
+            return int(self.adaptive_concurrency.limit) if self.adaptive_concurrency else self.max_workers
+
+    def get_concurrency_stats(self) -> dict[str, any]:
+        with self.lock:
+            stats: dict[str, any] = {"max_workers": self.max_workers, "active_tasks": self.active_tasks}
+            if self.adaptive_concurrency is not None:
+                stats["adaptive"] = self.adaptive_concurrency.snapshot()
+            return stats
+
+    def add_hook(self, hook: str, function: typing.Callable[[TaskInfo], any]) -> None:
+        """
+        挂钩子，hook 是 on_enqueue（入队）/ on_start（每次开跑）/ on_finish（出最终结果，成功失败超时都算），
+        function 拿到任务的 TaskInfo，在锁外、在跑任务的线程里调，别太慢
+        """
+        if hook not in TaskMetrics.HOOKS:
+            raise ValueError(f"Unknown hook: {hook}")
+        with self.lock:
+            self.metrics.hooks[hook] = self.metrics.hooks[hook] + [function]  # 换新列表，锁外遍历的不受影响
+
+    def get_metrics(self) -> dict[str, any]:
+        """统计快照：gauges 是当前的队列深度 / 忙碌线程数之类，categories 是按任务类别的直方图和计数"""
+        with self.lock:
+            return {
+                "gauges": {
+                    "queued_tasks": len(self.tasks),
+                    "pending_tasks": len(self.pending_tasks),
+                    "delayed_tasks": self.delayed_tasks,
+                    "busy_workers": self.active_tasks,
+                    "live_workers": self.live_workers,
+                },
+                "categories": self.metrics.snapshot(),
+            }
+
+    def export_metrics(self, fmt: str = "json") -> str:
+        """get_metrics() 导出成 "json" 或者 "prometheus" 文本格式"""
+        if fmt == "json":
+            return json.dumps(self.get_metrics(), ensure_ascii=False)
+        if fmt == "prometheus":
+            return TaskMetrics.to_prometheus(self.get_metrics())
+        raise ValueError(f"Unknown metrics format: {fmt}")
+
+    def get_task_state(self, task_id: str) -> str | None:
+        with self.lock:
+            info = self.task_registry.get(str(task_id))
+            return info.state if info else None
+
+    def get_task_info(self, task_id: str) -> TaskInfo | None:
+        with self.lock:
+            return self.task_registry.get(str(task_id))
+
+    def get_task_registry(self) -> dict[str, TaskInfo]:
+        with self.lock:
+            return self.task_registry.copy()
 
     def get_original_tasks(self) -> list:
+        """兼容老接口，返回 [(-priority, 序号, {"id": ..., "description": ...}), ...]，数据来自任务登记表"""
         with self.lock:
-            return self.original_tasks.copy()
+            return sorted((-info.priority, i, {"id": info.task_id, "description": info.description})
+                          for i, info in enumerate(self.task_registry.values()))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+"""
+    校验索引：算过 SHA1 的文件记下 (大小, 修改时间, inode, SHA1)，存在磁盘上跨安装用，
+    下次装的时候这几样都没变就直接信，不用把整个 .minecraft 再读一遍
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import threading
+import typing
+
+
+MMAP_THRESHOLD: int = 1048576  # 比这大的文件映射进来直接算，不经过读缓冲；小文件建映射反而慢，一次读完
+
+
+def file_sha1(file_path: pathlib.Path) -> str:
+    """大文件 mmap 着算，不整个读进内存；hashlib 算的时候会放开 GIL，几个线程一起算也能吃满几个核"""
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+            return hashlib.sha1(f.read()).hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha1(mapped).hexdigest()
+
+
+def try_file_sha1(file_path: pathlib.Path) -> str | None:
+    """没有、没权限读、是个目录之类读不了的文件给 None，一个文件出错别把整批带崩"""
+    try:
+        return file_sha1(file_path)
+    except OSError:
+        return None
+
+
+def hash_files(file_paths: typing.Sequence[pathlib.Path]) -> list[str | None]:
+    """一批文件的 SHA1，读不了的给 None；一批一起丢进进程池，省得一个小文件来回传一次"""
+    return [try_file_sha1(file_path) for file_path in file_paths]
+
+
+class VerifyIndex:
+    """
+    路径 -> (size, mtime_ns, inode, sha1)，整个存成一个 JSON，save() 先写临时文件再原子地替换
+    修改时间不早于索引上次保存时间的条目读的时候直接扔掉：那种文件可能在记完之后、同一个时间刻度里又被改过，
+    光看修改时间看不出来（git 的 racy clean 是一个道理）
+    只是个缓存，坏了、删了大不了重新算一遍，所以读不出来就当空的
+    """
+    VERSION: int = 1
+
+    def __init__(self, index_path: pathlib.Path) -> None:
+        self.index_path: pathlib.Path = index_path
+        self.lock: threading.Lock = threading.Lock()
+        self.entries: dict[str, tuple[int, int, int, str]] = {}
+        self.dirty: bool = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            saved_ns: int = os.stat(self.index_path).st_mtime_ns
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index: dict = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(index, dict) or index.get("version") != self.VERSION:
+            return
+        for path, entry in index.get("files", {}).items():
+            if entry[1] < saved_ns:
+                self.entries[path] = tuple(entry)
+            else:
+                self.dirty = True
+
+    def lookup(self, path: pathlib.Path, sha1: str) -> bool:
+        """索引里有这个文件、散列值对得上，大小、修改时间和 inode 都没变"""
+        if (entry := self.entries.get(str(path))) is None or entry[3] != sha1:
+            return False
+        try:
+            stat: os.stat_result = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino) == entry[: 3]
+
+    def record(self, path: pathlib.Path, sha1: str, stat: os.stat_result | None = None) -> None:
+        """path 的内容刚确认过就是 sha1"""
+        stat = stat or os.stat(path)
+        with self.lock:
+            self.entries[str(path)] = (stat.st_size, stat.st_mtime_ns, stat.st_ino, sha1)
+            self.dirty = True
+
+    def invalidate(self, paths: typing.Iterable[pathlib.Path] | None = None) -> int:
+        """
+        把这些路径（是目录的话连带下面所有文件）从索引里删掉，下次一定重新算；不给就整个清空
+        :return: 删了几条
+        """
+        with self.lock:
+            if paths is None:
+                removed: list[str] = list(self.entries)
+            else:
+                paths = [str(path) for path in paths]
+                removed = [path for path in paths if path in self.entries]
+                prefixes: tuple[str, ...] = tuple(path + os.sep for path in paths if os.path.isdir(path))
+                if prefixes:  # 单个文件的话不用把整个索引扫一遍
+                    removed += [path for path in self.entries if path.startswith(prefixes)]
+            for path in removed:
+                del self.entries[path]
+            self.dirty = self.dirty or bool(removed)
+        return len(removed)
+
+    def rebuild(self, hash_map: typing.Callable = map) -> int:
+        """
+        索引里所有文件重新算一遍 SHA1，文件没了或者读不了的删掉；hash_map 可以给进程池的 map 并行算
+        :return: 内容和记的不一样的文件数
+        """
+        with self.lock:
+            entries: list[tuple[str, tuple[int, int, int, str]]] = list(self.entries.items())
+        existing: list[tuple[str, str]] = [(path, entry[3]) for path, entry in entries if os.path.isfile(path)]
+        changed: int = 0
+        with self.lock:
+            self.entries.clear()
+            self.dirty = True
+        for (path, sha1), digest in zip(existing, hash_map(try_file_sha1, [pathlib.Path(path) for path, _ in existing])):
+            if digest != sha1:
+                changed += 1
+            if digest is None:
+                continue
+            try:
+                self.record(pathlib.Path(path), digest)
+            except OSError:
+                pass  # 算完之后被删了
+        return changed
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            files: dict[str, tuple[int, int, int, str]] = dict(self.entries)
+            self.dirty = False
+        os.makedirs(self.index_path.parent, exist_ok=True)
+        temp_path: pathlib.Path = self.index_path.with_name(f".{self.index_path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "files": files}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, self.index_path)
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import http.server
+import threading
+import unittest
+
+import granite_core
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 长连接
+
+    def do_GET(self) -> None:
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/file/redirected")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/chunked":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for part in (b"chunked ", b"body"):
+                self.wfile.write(f"{len(part):x}\r\n".encode() + part + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        elif self.path.startswith("/file/"):
+            body: bytes = hashlib.sha1(self.path.encode()).hexdigest().encode() * 100
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(429)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class AsyncTaskQueueTest(unittest.TestCase):
+    def test_priority_and_pre_tasks(self) -> None:
+        order: list[str] = []
+
+        async def record(name: str) -> str:
+            await asyncio.sleep(0)
+            order.append(name)
+            return name
+
+        queue: granite_core.async_task_queue.AsyncTaskQueue = granite_core.async_task_queue.AsyncTaskQueue(1)
+        queue.add_task({"id": "low", "function": record, "args": ("low",), "priority": 1})
+        queue.add_task({"id": "high", "function": record, "args": ("high",), "priority": 10})
+        queue.add_task({"id": "after-low", "function": order.append, "args": ("after-low",), "pre_tasks": ["low"], "priority": 20})
+        # 普通函数在线程池里跑，里面再加的任务也能被事件循环接着跑
+        queue.add_task({"id": "adder", "function": queue.add_task, "args": ({"id": "added", "function": record, "args": ("added",)},)})
+        queue.run()
+        queue.shutdown()
+
+        self.assertEqual(order[: 3], ["high", "low", "after-low"])
+        self.assertIn("added", order)
+        self.assertEqual(queue.get_result("high"), "high")
+
+    def test_max_time_and_retries(self) -> None:
+        attempts: list[int] = []
+
+        async def flaky() -> str:
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RuntimeError("boom")
+            return "ok"
+
+        queue: granite_core.async_task_queue.AsyncTaskQueue = granite_core.async_task_queue.AsyncTaskQueue(4)
+        slow = queue.add_task({"id": "slow", "function": asyncio.sleep, "args": (10,), "max_time": 0.1})
+        retried = queue.add_task({"id": "flaky", "function": flaky, "max_retries": 3, "retry_delay": 0.01})
+        queue.run()
+        queue.shutdown()
+
+        self.assertIsInstance(slow.exception(), granite_core.task_queue.TaskTimedOut)
+        self.assertEqual(queue.get_task_state("slow"), "timed_out")
+        self.assertEqual(retried.result(), "ok")
+        self.assertEqual(queue.get_task_info("flaky").retries, 2)
+
+    def test_concurrency_limit(self) -> None:
+        running: list[int] = [0, 0]  # 现在在跑的，最多同时跑过的
+
+        async def task() -> None:
+            running[0] += 1
+            running[1] = max(running)
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+
+        queue: granite_core.async_task_queue.AsyncTaskQueue = granite_core.async_task_queue.AsyncTaskQueue(
+            16, rate_limits={"host": {"max_in_flight": 4}})
+        queue.add_tasks({"id": i, "function": task, "rate_key": "host" if i % 2 else None} for i in range(64))
+        queue.add_tasks({"id": f"limited-{i}", "function": task, "rate_key": "host"} for i in range(64))
+        queue.run()
+        queue.shutdown()
+
+        self.assertLessEqual(running[1], 16)
+        self.assertEqual(len(queue.get_results()), 128)
+
+
+class AsyncHttpClientTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url: str = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get(self) -> None:
+        async def main() -> dict[str, any]:
+            client: granite_core.async_http.AsyncHttpClient = granite_core.async_http.AsyncHttpClient(4)
+            streamed: bytearray = bytearray()
+            try:
+                files = await asyncio.gather(*(client.get(f"{self.base_url}/file/{i}") for i in range(20)))
+                await client.get(f"{self.base_url}/file/streamed", sink=streamed.extend)
+                with self.assertRaises(granite_core.async_http.HttpError) as error:
+                    await client.get(f"{self.base_url}/missing")
+                return {
+                    "files": files,
+                    "streamed": bytes(streamed),
+                    "redirected": await client.get(f"{self.base_url}/redirect"),
+                    "chunked": await client.get(f"{self.base_url}/chunked"),
+                    "connections": len(client.idle_connections[("http", "127.0.0.1", self.server.server_address[1])]),
+                    "congested": granite_core.task_queue.is_congestion_error(error.exception),
+                }
+            finally:
+                await client.close()
+
+        results: dict[str, any] = asyncio.run(main())
+        self.assertEqual(results["files"][3].content, hashlib.sha1(b"/file/3").hexdigest().encode() * 100)
+        self.assertEqual(results["streamed"], hashlib.sha1(b"/file/streamed").hexdigest().encode() * 100)
+        self.assertEqual(results["redirected"].content, hashlib.sha1(b"/file/redirected").hexdigest().encode() * 100)
+        self.assertEqual(results["chunked"].content, b"chunked body")
+        self.assertLessEqual(results["connections"], 4)  # 连接复用，没有一个请求开一条
+        self.assertTrue(results["congested"])
+
+
+if __name__ == "__main__":
+    unittest.main()
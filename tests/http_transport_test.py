@@ -0,0 +1,105 @@
+import asyncio
+import http.server
+import threading
+import unittest
+
+import requests
+
+import granite_core
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    user_agents: list[str] = []
+    failures: dict[str, int] = {}  # 路径 -> 还要回几次 503
+
+    def do_GET(self) -> None:
+        self.user_agents.append(self.headers.get("User-Agent"))
+        body: bytes = self.path.encode()
+        if self.failures.get(self.path):
+            self.failures[self.path] -= 1
+            self.send_response(503)
+        else:
+            self.send_response(404 if self.path == "/missing" else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class HttpTransportTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host: str = f"127.0.0.1:{self.server.server_address[1]}"
+        self.transport: granite_core.http_transport.HttpTransport = granite_core.http_transport.HttpTransport(4, retries=0)
+        _Handler.user_agents = []
+        _Handler.failures = {}
+
+    def tearDown(self) -> None:
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self) -> None:
+        for i in range(10):
+            self.assertEqual(self.transport.get(f"http://{self.host}/file/{i}").text, f"/file/{i}")
+        with self.transport.get(f"http://{self.host}/streamed", stream=True) as response:
+            self.assertEqual(b"".join(response.iter_content(4)), b"/streamed")
+        with self.assertRaises(requests.HTTPError):
+            self.transport.get(f"http://{self.host}/missing")
+        self.transport.get(f"http://{self.host}/after-error")  # 出错的响应关掉了，连接照样回池子
+
+        stats: dict[str, any] = self.transport.get_stats()
+        self.assertEqual(stats["requests"], 13)
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["hosts"][self.host]["reused"], 12)
+        self.assertEqual(set(_Handler.user_agents), {granite_core.http_transport.HttpTransport.USER_AGENT})
+
+    def test_async_client(self) -> None:
+        async def main() -> None:
+            client: granite_core.async_http.AsyncHttpClient = self.transport.create_async_client()
+            try:
+                for i in range(5):
+                    await client.get(f"http://{self.host}/file/{i}")
+            finally:
+                await client.close()
+
+        self.transport.get(f"http://{self.host}/sync")
+        asyncio.run(main())
+        stats: dict[str, any] = self.transport.get_stats()
+        self.assertEqual((stats["requests"], stats["connections"]), (6, 2))  # 同步和异步各一条连接，记在一起
+        self.assertEqual(set(_Handler.user_agents), {granite_core.http_transport.HttpTransport.USER_AGENT})
+
+    def test_async_retries(self) -> None:
+        transport: granite_core.http_transport.HttpTransport = granite_core.http_transport.HttpTransport(4, retries=2)
+        _Handler.failures = {"/flaky": 2, "/down": 5}
+
+        async def main() -> None:
+            client: granite_core.async_http.AsyncHttpClient = transport.create_async_client()
+            client.backoff_factor = 0.01  # 测试别真等
+            try:
+                self.assertEqual((await client.get(f"http://{self.host}/flaky")).content, b"/flaky")  # 503 两次，第三次成了
+                with self.assertRaises(granite_core.async_http.HttpError) as context:
+                    await client.get(f"http://{self.host}/down")  # 重试用完了还是 503
+                self.assertEqual(context.exception.response.status_code, 503)
+            finally:
+                await client.close()
+
+        asyncio.run(main())
+        transport.close()
+        self.assertEqual(transport.get_stats()["requests"], 6)
+        self.assertEqual(_Handler.failures, {"/flaky": 0, "/down": 2})
+
+        _Handler.failures["/down"] = 5
+        transport = granite_core.http_transport.HttpTransport(4, retries=2)
+        with self.assertRaises(requests.exceptions.RetryError):  # 同步的一样重试 2 次
+            transport.get(f"http://{self.host}/down")
+        transport.close()
+        self.assertEqual(_Handler.failures["/down"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
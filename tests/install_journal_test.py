@@ -0,0 +1,57 @@
+import os
+import pathlib
+import tempfile
+import unittest
+
+import granite_core
+
+
+class InstallJournalTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.root: pathlib.Path = pathlib.Path(self.temp_dir.name)
+        self.journal_path: pathlib.Path = self.root / "journals" / "1.0.jsonl"
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_resume(self) -> None:
+        asset: pathlib.Path = self.root / "asset"
+        asset.write_bytes(b"asset")
+
+        journal: granite_core.install_journal.InstallJournal = granite_core.install_journal.InstallJournal(self.journal_path)
+        journal.record_step("version_metadata")
+        journal.record_file(asset, "sha1")
+        journal.close()
+
+        journal = granite_core.install_journal.InstallJournal(self.journal_path)
+        self.assertTrue(journal.is_step_done("version_metadata"))
+        self.assertTrue(journal.is_file_done(asset, "sha1"))
+        self.assertFalse(journal.is_file_done(asset, "other-sha1"))
+
+        asset.write_bytes(b"changed asset")  # 被动过的文件不能再信
+        self.assertFalse(journal.is_file_done(asset, "sha1"))
+
+        journal.close(remove=True)
+        self.assertFalse(self.journal_path.exists())
+
+    def test_torn_last_line(self) -> None:
+        journal: granite_core.install_journal.InstallJournal = granite_core.install_journal.InstallJournal(self.journal_path)
+        journal.record_step("version_metadata")
+        journal.close()
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write('{"type": "step", "na')  # 进程在这挂了
+
+        journal = granite_core.install_journal.InstallJournal(self.journal_path)
+        journal.record_step("asset_index")
+        journal.close()
+
+        journal = granite_core.install_journal.InstallJournal(self.journal_path)
+        self.assertEqual(journal.steps, {"version_metadata", "asset_index"})
+        journal.close()
+        self.assertTrue(all(line.startswith("{") for line in self.journal_path.read_text(encoding="utf-8").splitlines()))
+        self.assertGreater(os.path.getsize(self.journal_path), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,8 +6,10 @@ import granite_core
 
 class Test(unittest.TestCase):
     def test(self) -> None:
+        settings: granite_core.granite_settings.GraniteSettings = granite_core.granite_settings.GraniteSettings()
+        settings.set("result_retention", "all")  # 要把所有任务和结果都导出来
         installer: granite_core.minecraft_installer.MinecraftInstaller = granite_core.minecraft_installer.MinecraftInstaller(
-            granite_core.granite_settings.GraniteSettings(),
+            settings,
             "rd-132211",
             "Mojang"
         )
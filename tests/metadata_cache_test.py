@@ -0,0 +1,106 @@
+import hashlib
+import http.server
+import pathlib
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+import requests
+
+import granite_core
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body: bytes = b'{"versions": []}'
+    requests_seen: list[tuple[str, str | None, str | None]] = []  # (路径, If-None-Match, If-Modified-Since)
+
+    def do_GET(self) -> None:
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+        etag: str = f'"{hashlib.sha1(self.body).hexdigest()}"'
+        if self.path == "/etag" and self.headers.get("If-None-Match") == etag or \
+                self.path == "/last-modified" and self.headers.get("If-Modified-Since") == "Sat, 01 Jan 2000 00:00:00 GMT":
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.path == "/etag":
+            self.send_header("ETag", etag)
+        else:
+            self.send_header("Last-Modified", "Sat, 01 Jan 2000 00:00:00 GMT")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.cache_dir: pathlib.Path = pathlib.Path(self.temp_dir.name) / "metadata_cache"
+        self.server: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url: str = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.transport: granite_core.http_transport.HttpTransport = granite_core.http_transport.HttpTransport(4, retries=0)
+        _Handler.body = b'{"versions": []}'
+        _Handler.requests_seen = []
+
+    def tearDown(self) -> None:
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def _cache(self, offline: bool = False) -> granite_core.metadata_cache.MetadataCache:
+        return granite_core.metadata_cache.MetadataCache(self.cache_dir, self.transport, offline)
+
+    def test_revalidate(self) -> None:
+        for path, condition in (("/etag", 1), ("/last-modified", 2)):
+            self.assertEqual(self._cache().get(self.base_url + path, ttl=600), _Handler.body)
+            self.assertEqual(self._cache().get(self.base_url + path, ttl=600), _Handler.body)  # 没过期，别的实例也不用问
+            self.assertEqual(len(_Handler.requests_seen), 1)
+
+            cache: granite_core.metadata_cache.MetadataCache = self._cache()
+            self.assertEqual(cache.get(self.base_url + path, ttl=0), _Handler.body)  # 过期了，问一下，304
+            self.assertIsNotNone(_Handler.requests_seen[-1][condition])
+            self.assertEqual(cache.stats, {"fresh": 0, "revalidated": 1, "downloaded": 0, "stale": 0})
+            _Handler.requests_seen = []
+
+        _Handler.body = b'{"versions": ["new"]}'  # 服务器上的变了
+        self.assertEqual(self._cache().get(self.base_url + "/etag", ttl=0), _Handler.body)
+        self.assertEqual(self._cache().get(self.base_url + "/etag", ttl=600), _Handler.body)
+
+    def test_sha1_and_offline(self) -> None:
+        sha1: str = hashlib.sha1(_Handler.body).hexdigest()
+        with self.assertRaises(granite_core.metadata_cache.MetadataUnavailable):
+            self._cache(offline=True).get(self.base_url + "/etag", sha1=sha1)
+        self.assertEqual(_Handler.requests_seen, [])  # 离线模式一个请求都不发
+
+        self._cache().get(self.base_url + "/etag", sha1=sha1)
+        self.assertEqual(self._cache().get(self.base_url + "/etag", sha1=sha1), _Handler.body)  # 散列值对得上就不过期
+        self.assertEqual(self._cache(offline=True).get(self.base_url + "/etag", ttl=0), _Handler.body)
+        self.assertEqual(len(_Handler.requests_seen), 1)
+
+        with self.assertRaises(granite_core.metadata_cache.MetadataHashMismatch):
+            self._cache().get(self.base_url + "/etag", sha1=hashlib.sha1(b"other").hexdigest())  # 对不上：重新下，还对不上就不给
+        self.assertEqual(len(_Handler.requests_seen), 2)
+        self.assertEqual(_Handler.requests_seen[-1][1], None)
+        self.assertEqual(self._cache().get(self.base_url + "/etag", sha1=sha1), _Handler.body)  # 缓存里对的那份没被顶掉
+        self.assertEqual(len(_Handler.requests_seen), 2)
+
+    def test_stale_if_error(self) -> None:
+        self._cache().get(self.base_url + "/etag")
+        cache: granite_core.metadata_cache.MetadataCache = self._cache()
+        with unittest.mock.patch.object(self.transport.session, "get", side_effect=requests.ConnectionError("offline")):
+            self.assertEqual(cache.get(self.base_url + "/etag", ttl=0), _Handler.body)
+            with self.assertRaises(granite_core.metadata_cache.MetadataUnavailable):
+                cache.get(self.base_url + "/missing")
+        self.assertEqual(cache.stats["stale"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,454 @@
+import hashlib
+import http.server
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+import granite_core
+
+JAR: bytes = bytes(range(256)) * 4000  # 1 MB 左右
+
+
+class _RangeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    etag: str = '"v1"'
+    range_requests: list[str] = []
+    if_range_headers: list[str] = []
+    truncate_next: bool = False  # 下一个分段请求只给一半就断开
+
+    def do_GET(self) -> None:
+        body: bytes = JAR
+        if_range: str | None = self.headers.get("If-Range")
+        if if_range is not None:
+            self.if_range_headers.append(if_range)
+        if self.path == "/ranged" and (range_header := self.headers.get("Range")) and if_range in (None, self.etag):
+            start, end = (int(value) for value in range_header.removeprefix("bytes=").split("-"))
+            body = JAR[start: end + 1]
+            self.range_requests.append(range_header)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(JAR)}")
+        else:
+            self.send_response(200)  # /plain 不认 Range，If-Range 对不上也整个给
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body is not JAR and _RangeHandler.truncate_next:
+            _RangeHandler.truncate_next = False
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class _AssetHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    objects: dict[str, bytes] = {}  # /ab/abcd... -> 内容
+    fail_once: set[str] = set()  # 第一次请求给 404 的
+    requests_seen: list[str] = []
+
+    def do_GET(self) -> None:
+        self.requests_seen.append(self.path)
+        if self.path in self.fail_once or self.path not in self.objects:
+            self.fail_once.discard(self.path)
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.objects[self.path])))
+        self.end_headers()
+        self.wfile.write(self.objects[self.path])
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class VerifiedFileWriterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.root: pathlib.Path = pathlib.Path(self.temp_dir.name)
+        self.targets: list[pathlib.Path] = [self.root / "objects" / "ab" / "abcd", self.root / "virtual" / "legacy" / "a.ogg"]
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_commit(self) -> None:
+        with granite_core.minecraft_installer.VerifiedFileWriter(self.targets, hashlib.sha1(b"hello world").hexdigest()) as writer:
+            writer.write(b"hello ")
+            self.assertFalse(self.targets[0].exists())  # 校验之前正式文件不出现
+            writer.write(b"world")
+            writer.commit()
+
+        self.assertTrue(all(target.read_bytes() == b"hello world" for target in self.targets))
+        self.assertEqual(len(list(self.root.rglob("*.tmp"))), 0)
+
+    def test_hash_mismatch(self) -> None:
+        self.targets[1].parent.mkdir(parents=True)
+        self.targets[1].write_bytes(b"old")
+        with granite_core.minecraft_installer.VerifiedFileWriter(self.targets, hashlib.sha1(b"expected").hexdigest()) as writer:
+            writer.write(b"corrupted")
+            with self.assertRaises(granite_core.minecraft_installer.FileHashMismatch):
+                writer.commit()
+
+        self.assertFalse(self.targets[0].exists())
+        self.assertEqual(self.targets[1].read_bytes(), b"old")  # 原来的文件没被动
+        self.assertEqual(len(list(self.root.rglob("*.tmp"))), 0)
+
+    def test_error_midway(self) -> None:
+        with self.assertRaises(ConnectionError):
+            with granite_core.minecraft_installer.VerifiedFileWriter(self.targets, None) as writer:
+                writer.write(b"half")
+                raise ConnectionError("connection reset")
+
+        self.assertFalse(any(path.is_file() for path in self.root.rglob("*")))
+
+
+class RangedFileWriterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.target: pathlib.Path = pathlib.Path(self.temp_dir.name) / "versions" / "1.0" / "1.0.jar"
+        self.data: bytes = bytes(range(256)) * 40
+        self.ranges: list[tuple[int, int]] = [(start, min(start + 4095, len(self.data) - 1)) for start in range(0, len(self.data), 4096)]
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _write_range(self, writer: granite_core.minecraft_installer.RangedFileWriter, start: int, end: int) -> None:
+        for offset in range(start, end + 1, 1000):  # 一块分几次收到
+            writer.write_at(offset, self.data[offset: min(offset + 1000, end + 1)])
+        writer.complete_range(start, end)
+
+    def test_out_of_order(self) -> None:
+        with granite_core.minecraft_installer.RangedFileWriter(self.target, len(self.data), hashlib.sha1(self.data).hexdigest()) as writer:
+            self.assertEqual(os.path.getsize(writer.part_path), len(self.data))  # 预先分配好了
+            self._write_range(writer, *self.ranges[1])
+            self.assertEqual(writer.hashed, 0)  # 前面还没接上
+            self._write_range(writer, *self.ranges[0])
+            self.assertEqual(writer.hashed, 8192)  # 接上了就接着算
+            self._write_range(writer, *self.ranges[2])
+            writer.commit()
+        self.assertEqual(self.target.read_bytes(), self.data)
+        self.assertFalse(writer.part_path.exists())
+
+    def test_resume_and_mismatch(self) -> None:
+        writer: granite_core.minecraft_installer.RangedFileWriter = granite_core.minecraft_installer.RangedFileWriter(
+            self.target, len(self.data), hashlib.sha1(b"expected").hexdigest(), "https://example.com/1.0.jar")
+        self._write_range(writer, *self.ranges[0])
+        self.assertTrue(writer.check_validator('"v1"'))
+        writer.close()
+
+        # 进程重启，照着 .part.json 接着下
+        writer = granite_core.minecraft_installer.RangedFileWriter(self.target, len(self.data), hashlib.sha1(b"expected").hexdigest(),
+                                                                   "https://example.com/1.0.jar")
+        self.assertTrue(writer.resumed)
+        self.assertEqual(writer.completed, {0: 4095})
+        self.assertEqual(writer.get_if_range(), '"v1"')
+        self.assertFalse(writer.check_validator('"v2"'))  # 远端文件换了
+        self.assertTrue(writer.check_validator('"v1"'))
+        self.assertIsNone(writer.get_if_range())  # 对过一次就不再比了
+        for chunk in self.ranges[1:]:
+            self._write_range(writer, *chunk)
+        with self.assertRaises(granite_core.minecraft_installer.FileHashMismatch):
+            writer.commit()
+        self.assertFalse(writer.part_path.exists())
+        self.assertFalse(writer.meta_path.exists())
+        self.assertFalse(self.target.exists())
+
+        # .part 没了的话 .part.json 不算数
+        writer = granite_core.minecraft_installer.RangedFileWriter(self.target, len(self.data), None)
+        self._write_range(writer, *self.ranges[0])
+        writer.close()
+        writer.part_path.unlink()
+        writer = granite_core.minecraft_installer.RangedFileWriter(self.target, len(self.data), None)
+        self.assertFalse(writer.resumed)
+        self.assertEqual(writer.completed, {})
+        writer.close()
+
+
+class SegmentedDownloadTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.root: pathlib.Path = pathlib.Path(self.temp_dir.name)
+        self.server: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        _RangeHandler.range_requests = []
+        _RangeHandler.if_range_headers = []
+        _RangeHandler.truncate_next = False
+
+        settings: granite_core.granite_settings.GraniteSettings = granite_core.granite_settings.GraniteSettings()
+        settings.set("working_path", self.root / ".minecraft")
+        settings.set("temp_path", self.root / "temp")
+        settings.set("process_workers", 0)
+        settings.set("rate_limits", {})
+        settings.set("max_workers", 8)
+        self.installer: granite_core.minecraft_installer.MinecraftInstaller = granite_core.minecraft_installer.MinecraftInstaller(
+            settings, "1.0", "Mojang")
+        # 1 MB 分成四段；最大的也钉死，不然测过速度以后段会变大，请求数就不一定了
+        self.installer.SEGMENT_INITIAL_SIZE = self.installer.SEGMENT_MIN_SIZE = self.installer.SEGMENT_MAX_SIZE = 262144
+        self.jar_path: pathlib.Path = self.root / ".minecraft" / "versions" / "1.0" / "1.0.jar"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def _get_url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def _interrupt(self, received: int, validator: str) -> None:
+        """假装上次下了前 received 字节进程就挂了"""
+        writer: granite_core.minecraft_installer.RangedFileWriter = granite_core.minecraft_installer.RangedFileWriter(
+            self.jar_path, len(JAR), hashlib.sha1(JAR).hexdigest(), self._get_url("/ranged"))
+        writer.write_at(0, JAR[: received])
+        writer.complete_range(0, received - 1)
+        writer.check_validator(validator)
+        writer.close()
+
+    def _download_main_file(self, path: str) -> list:
+        self.installer.version_metadata = {"downloads": {"client": {
+            "url": self._get_url(path), "sha1": hashlib.sha1(JAR).hexdigest(), "size": len(JAR)}}}
+        results: list = []
+        self.installer.install_queue.add_task({"id": "main", "function": lambda: results.append(self.installer.download_game_main_file())})
+        self.installer.install_queue.run()
+        self.installer.install_queue.shutdown()
+        return results
+
+    def test_segmented(self) -> None:
+        self.assertEqual(self._download_main_file("/ranged"), [0])
+        self.assertEqual(self.jar_path.read_bytes(), JAR)
+        self.assertEqual(len(_RangeHandler.range_requests), 4)
+        ranges: list[tuple[int, int]] = sorted(tuple(int(value) for value in header[6:].split("-"))
+                                               for header in _RangeHandler.range_requests)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertTrue(all(ranges[i][1] + 1 == ranges[i + 1][0] for i in range(len(ranges) - 1)))  # 不漏也不重
+        self.assertEqual(ranges[-1][1], len(JAR) - 1)
+        self.assertFalse(granite_core.minecraft_installer.RangedFileWriter.get_part_path(self.jar_path).exists())
+        self.assertIn(f"127.0.0.1:{self.server.server_address[1]}", self.installer.throughput)
+
+    def test_resume(self) -> None:
+        self._interrupt(600000, '"v1"')
+        self.assertEqual(self._download_main_file("/ranged"), [0])
+        self.assertEqual(self.jar_path.read_bytes(), JAR)
+        self.assertTrue(all(int(header[6:].split("-")[0]) >= 600000 for header in _RangeHandler.range_requests))  # 只要没下的部分
+        self.assertIn('"v1"', _RangeHandler.if_range_headers)
+        self.assertEqual(list(self.jar_path.parent.iterdir()), [self.jar_path])  # .part 和 .part.json 都没了
+
+    def test_resume_complete_part(self) -> None:
+        self._interrupt(len(JAR), '"v1"')  # 最后一段写完了，还没 commit 进程就挂了
+        self.assertEqual(self._download_main_file("/ranged"), [0])
+        self.assertEqual(self.jar_path.read_bytes(), JAR)
+        self.assertEqual(_RangeHandler.range_requests, [])  # 一个字节都不用再要
+        self.assertEqual(list(self.jar_path.parent.iterdir()), [self.jar_path])
+
+    def test_commit_error(self) -> None:
+        commit = granite_core.minecraft_installer.RangedFileWriter.commit
+        calls: list[int] = []
+
+        def flaky_commit(writer: granite_core.minecraft_installer.RangedFileWriter) -> None:
+            calls.append(1)
+            if len(calls) == 1:
+                raise PermissionError("target is locked")  # 改名失败之类，.part 还在
+            commit(writer)
+
+        with unittest.mock.patch.object(granite_core.minecraft_installer.RangedFileWriter, "commit", autospec=True,
+                                        side_effect=flaky_commit):
+            self.assertEqual(self._download_main_file("/ranged"), [0])
+        self.assertEqual(self.jar_path.read_bytes(), JAR)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(list(self.jar_path.parent.iterdir()), [self.jar_path])
+
+    def test_remote_changed(self) -> None:
+        self._interrupt(600000, '"v0"')
+        self.assertEqual(self._download_main_file("/ranged"), [0])
+        self.assertEqual(self.jar_path.read_bytes(), JAR)
+        self.assertIn("bytes=0-262143", _RangeHandler.range_requests)  # .part 作废，从头下
+        self.assertEqual(list(self.jar_path.parent.iterdir()), [self.jar_path])
+
+    def test_interrupted_range(self) -> None:
+        _RangeHandler.truncate_next = True
+        self.assertEqual(self._download_main_file("/ranged"), [0])
+        self.assertEqual(self.jar_path.read_bytes(), JAR)
+        self.assertEqual(len(_RangeHandler.range_requests), 5)
+        self.assertTrue(any(int(header[6:].split("-")[0]) % 262144 for header in _RangeHandler.range_requests))  # 断的那段接着收到的往后要
+
+    def test_range_not_supported(self) -> None:
+        self.assertEqual(self._download_main_file("/plain"), [0])
+        self.assertEqual(self.jar_path.read_bytes(), JAR)  # 退回整个文件下
+        self.assertEqual(self.installer.no_range_hosts, {f"127.0.0.1:{self.server.server_address[1]}"})
+        self.assertFalse(granite_core.minecraft_installer.RangedFileWriter.get_part_path(self.jar_path).exists())
+
+
+class AssetIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.root: pathlib.Path = pathlib.Path(self.temp_dir.name)
+        settings: granite_core.granite_settings.GraniteSettings = granite_core.granite_settings.GraniteSettings()
+        settings.set("working_path", self.root / ".minecraft")
+        settings.set("temp_path", self.root / "temp")
+        settings.set("process_workers", 0)
+        self.installer: granite_core.minecraft_installer.MinecraftInstaller = granite_core.minecraft_installer.MinecraftInstaller(
+            settings, "1.0", "Mojang")
+        self.body: bytes = b'{"objects": {"a.ogg": {"hash": "ab", "size": 1}}}'
+        self.index_path: pathlib.Path = self.root / ".minecraft" / "assets" / "indexes" / "1.0.json"
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _download(self, sha1: str) -> None:
+        self.installer.version_metadata = {"assetIndex": {"id": "1.0", "url": "https://piston-meta.mojang.com/1.0.json", "sha1": sha1}}
+        with unittest.mock.patch.object(self.installer.metadata_cache, "get", return_value=self.body):
+            self.installer.download_game_asset_index()
+
+    def test_raw_body(self) -> None:
+        self._download(hashlib.sha1(self.body).hexdigest())
+        self.assertEqual(self.index_path.read_bytes(), self.body)  # 原样存，不重新格式化
+        self.assertTrue(self.installer.verify_index.lookup(self.index_path, hashlib.sha1(self.body).hexdigest()))
+        self.assertEqual(self.installer.verify_index.rebuild(), 0)
+
+    def test_hash_mismatch(self) -> None:
+        self._download(hashlib.sha1(b"other").hexdigest())
+        self.assertFalse(self.installer.verify_index.lookup(self.index_path, hashlib.sha1(b"other").hexdigest()))
+
+
+class AssetBatchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.root: pathlib.Path = pathlib.Path(self.temp_dir.name)
+        self.server: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _AssetHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        contents: list[bytes] = [f"asset {i}".encode() for i in range(5)]
+        self.hashes: list[str] = [hashlib.sha1(data).hexdigest() for data in contents]
+        _AssetHandler.objects = {f"/{asset_hash[: 2]}/{asset_hash}": data for asset_hash, data in zip(self.hashes, contents)}
+        _AssetHandler.fail_once = {f"/{self.hashes[1][: 2]}/{self.hashes[1]}"}
+        _AssetHandler.requests_seen = []
+
+        settings: granite_core.granite_settings.GraniteSettings = granite_core.granite_settings.GraniteSettings()
+        settings.set("working_path", self.root / ".minecraft")
+        settings.set("temp_path", self.root / "temp")
+        settings.set("process_workers", 0)
+        settings.set("rate_limits", {})
+        settings.set("asset_batch_max_count", 3)  # 5 个对象分成 3 + 2 两批
+        self.installer: granite_core.minecraft_installer.MinecraftInstaller = granite_core.minecraft_installer.MinecraftInstaller(
+            settings, "1.0", "Mojang")
+        self.installer.minecraft_assets_path["Mojang"] = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.installer.version_metadata = {"assetIndex": {"id": "1.0"}}
+        index_path: pathlib.Path = self.root / ".minecraft" / "assets" / "indexes" / "1.0.json"
+        index_path.parent.mkdir(parents=True)
+        # 0 号对象两个资源名共用
+        index_path.write_text(json.dumps({"objects": {
+            "a/0.ogg": {"hash": self.hashes[0], "size": 7}, "b/0.ogg": {"hash": self.hashes[0], "size": 7},
+            **{f"a/{i}.ogg": {"hash": self.hashes[i], "size": 7} for i in range(1, 5)}
+        }}))
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def test_batch_retry(self) -> None:
+        batches: list[list[str]] = []
+        make_batch_task = self.installer._make_asset_batch_task
+
+        def record_batch(worker_id: str, batch: list[tuple], *args) -> granite_core.task_queue.Task:
+            batches.append([asset_entry[1] for asset_entry in batch])
+            return make_batch_task(worker_id, batch, *args)
+
+        with unittest.mock.patch.object(self.installer, "_make_asset_batch_task", side_effect=record_batch):
+            self.installer.install_queue.add_task({"id": "assets", "function": self.installer.download_game_assets})
+            self.installer.install_queue.run()
+            self.installer.install_queue.shutdown()
+
+        self.assertEqual(batches, [self.hashes[: 3], self.hashes[3:]])
+        # 一个对象按资源名记：0 号两个名字；1 号失败一次，那批重试了一回
+        self.assertEqual((self.installer.installed_assets, self.installer.failed_assets, self.installer.retried_assets), (6, 0, 1))
+        # 重试的时候只要了没下成的那个
+        self.assertEqual(sorted(_AssetHandler.requests_seen), sorted([*_AssetHandler.objects, f"/{self.hashes[1][: 2]}/{self.hashes[1]}"]))
+        for asset_name in ("a/0.ogg", "b/0.ogg", "a/4.ogg"):
+            self.assertTrue((self.root / ".minecraft" / "assets" / "virtual" / "legacy" / asset_name).is_file())
+
+
+class VerifyTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.root: pathlib.Path = pathlib.Path(self.temp_dir.name)
+        self.working_path: pathlib.Path = self.root / ".minecraft"
+        files: dict[str, bytes] = {"client": b"client", "lib": b"library", "native": b"native", "sound": b"sound", "music": b"music"}
+        self.sha1: dict[str, str] = {name: hashlib.sha1(data).hexdigest() for name, data in files.items()}
+        asset_index: bytes = json.dumps({"objects": {
+            "minecraft/sounds/a.ogg": {"hash": self.sha1["sound"], "size": 5},
+            "minecraft/sounds/b.ogg": {"hash": self.sha1["music"], "size": 5}
+        }}).encode()
+        self._write("versions/1.0/1.0.json", json.dumps({
+            "downloads": {"client": {"sha1": self.sha1["client"]}},
+            "assetIndex": {"id": "1.0", "sha1": hashlib.sha1(asset_index).hexdigest()},
+            "libraries": [
+                {"downloads": {"artifact": {"path": "a/lib.jar", "sha1": self.sha1["lib"]}}},
+                {"downloads": {"classifiers": {"natives-linux": {"path": "a/native.jar", "sha1": self.sha1["native"]}}}}
+            ]
+        }).encode())
+        self._write("assets/indexes/1.0.json", asset_index)
+        self._write("versions/1.0/1.0.jar", b"client")
+        self._write("libraries/a/lib.jar", b"corrupted")
+        # native.jar 缺了
+        self._write(f"assets/objects/{self.sha1["sound"][: 2]}/{self.sha1["sound"]}", b"sound")
+        self._write(f"assets/objects/{self.sha1["music"][: 2]}/{self.sha1["music"]}", b"music")
+
+        settings: granite_core.granite_settings.GraniteSettings = granite_core.granite_settings.GraniteSettings()
+        settings.set("working_path", self.working_path)
+        settings.set("temp_path", self.root / "temp")
+        settings.set("process_workers", 0)
+        self.installer: granite_core.minecraft_installer.MinecraftInstaller = granite_core.minecraft_installer.MinecraftInstaller(
+            settings, "1.0", "Mojang")
+        store: granite_core.object_store.ObjectStore = self.installer.object_store
+        store.link(self.sha1["sound"], self.working_path / "assets" / "virtual" / "legacy" / "minecraft" / "sounds" / "a.ogg")
+        store.link(self.sha1["sound"], self.working_path / "assets" / "virtual" / "pre-1.6" / "minecraft" / "sounds" / "a.ogg")
+        self._write("assets/virtual/legacy/minecraft/sounds/b.ogg", b"music")  # 复制出来的一份
+        # b.ogg 的 pre-1.6 那份缺了
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _write(self, path: str, data: bytes) -> None:
+        (self.working_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (self.working_path / path).write_bytes(data)
+
+    def test_verify(self) -> None:
+        streamed: list[dict[str, any]] = []
+        report: dict[str, any] = self.installer.verify(callback=streamed.append)
+        self.assertEqual(len(streamed), 8)
+        self.assertEqual(sorted(result["path"].name for result in report["ok"]),
+                         sorted(["1.0.jar", "1.0.json", "b.ogg", self.sha1["music"], self.sha1["sound"]]))
+        self.assertIn("asset_index", [result["category"] for result in report["ok"]])
+        self.assertEqual(sorted(result["path"].name for result in report["missing"]), ["b.ogg", "native.jar"])
+        self.assertEqual([(result["path"].name, result["actual_sha1"]) for result in report["corrupt"]],
+                         [("lib.jar", hashlib.sha1(b"corrupted").hexdigest())])
+
+        # 校验过的记进了校验索引，不深度校验的话不再算
+        self.installer.verify_index = granite_core.verify_index.VerifyIndex(self.installer.verify_index.index_path)
+        with unittest.mock.patch("granite_core.verify_index.file_sha1", side_effect=granite_core.verify_index.file_sha1) as file_sha1:
+            report = self.installer.verify(deep=False)
+        self.assertEqual(file_sha1.call_count, 3)  # 只剩缺的和坏的
+        self.assertEqual((len(report["ok"]), len(report["missing"]), len(report["corrupt"])), (5, 2, 1))
+        self.assertFalse(self.installer.journal_path.exists())  # 只校验不开安装日志
+
+    def test_journal_per_working_path(self) -> None:
+        settings: granite_core.granite_settings.GraniteSettings = granite_core.granite_settings.GraniteSettings()
+        settings.set("working_path", self.root / "other")
+        settings.set("temp_path", self.root / "temp")
+        settings.set("process_workers", 0)
+        other: granite_core.minecraft_installer.MinecraftInstaller = granite_core.minecraft_installer.MinecraftInstaller(
+            settings, "1.0", "Mojang")
+        # 同一个版本装到两个目录，日志分开
+        self.assertEqual(other.journal_path.parent, self.installer.journal_path.parent)
+        self.assertNotEqual(other.journal_path, self.installer.journal_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import errno
+import hashlib
+import os
+import pathlib
+import tempfile
+import unittest
+import unittest.mock
+
+import granite_core
+
+
+class ObjectStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.root: pathlib.Path = pathlib.Path(self.temp_dir.name)
+        self.store: granite_core.object_store.ObjectStore = granite_core.object_store.ObjectStore(self.root / "store")
+        self.sha1: str = hashlib.sha1(b"sound").hexdigest()
+        self.store.object_dir(self.sha1).mkdir(parents=True)
+        self.store.object_path(self.sha1).write_bytes(b"sound")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_hardlink(self) -> None:
+        # 两个游戏目录共用一个库
+        targets: list[pathlib.Path] = [self.root / f"instance-{i}" / "assets" / "virtual" / "legacy" / "a.ogg" for i in range(2)]
+        targets[1].parent.mkdir(parents=True)
+        targets[1].write_bytes(b"stale")
+        for target in targets:
+            self.assertEqual(self.store.link(self.sha1, target), "hardlink")
+            self.assertTrue(self.store.is_linked(self.sha1, target))
+        self.assertEqual(os.stat(self.store.object_path(self.sha1)).st_nlink, 3)
+        self.assertEqual(self.store.link(self.sha1, targets[0]), "hardlink")  # 已经链好的不动
+        self.assertEqual(len(list(self.root.rglob("*.tmp"))), 0)
+
+    def test_fallback_to_copy(self) -> None:
+        target: pathlib.Path = self.root / "other-disk" / "a.ogg"
+        with unittest.mock.patch("os.link", side_effect=OSError(errno.EXDEV, "cross-device link")), \
+                unittest.mock.patch.object(self.store, "_reflink", side_effect=OSError(errno.EOPNOTSUPP, "no reflink")) as reflink:
+            self.assertEqual(self.store.link(self.sha1, target), "copy")
+            self.assertEqual(self.store.link(self.sha1, self.root / "other-disk" / "b.ogg"), "copy")
+        self.assertEqual(reflink.call_count, 1)  # 同一个设备失败过的方式不再试
+        self.assertEqual(target.read_bytes(), b"sound")
+        self.assertFalse(self.store.is_linked(self.sha1, target))
+
+    def test_missing_object(self) -> None:
+        with self.assertRaises(FileNotFoundError):
+            self.store.link(hashlib.sha1(b"missing").hexdigest(), self.root / "a.ogg")
+        self.assertEqual(self.store.link_modes, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
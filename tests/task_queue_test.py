@@ -0,0 +1,471 @@
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+
+import granite_core
+
+
+class TaskQueueTest(unittest.TestCase):
+    def test_pre_tasks_chain(self) -> None:
+        order: list[str] = []
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(4)
+        for i in range(5):
+            queue.add_task({
+                "id": i,
+                "description": f"链上第 {i} 个任务",
+                "function": order.append,
+                "args": (str(i),),
+                "pre_tasks": [i - 1] if i else [],
+            })
+        queue.run()
+        queue.shutdown()
+
+        self.assertEqual(order, ["0", "1", "2", "3", "4"])
+
+    def test_pre_task_added_later(self) -> None:
+        for retention in ("all", "callback"):
+            ran: list[str] = []
+            queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(2, retention)
+            queue.add_task({
+                "id": "0",
+                "function": lambda: 0,
+            })
+            queue.add_task({
+                "id": "1",
+                "function": queue.add_task,
+                "args": ({
+                    "id": "2",
+                    "function": ran.append,
+                    "args": ("2",),
+                    "pre_tasks": ["0"],
+                },),
+                "pre_tasks": ["0"],
+            })
+            queue.run()
+            queue.shutdown()
+
+            self.assertEqual(ran, ["2"], retention)
+            # 只留全部结果的时候才一直记着跑完的 id，不然跑多少任务内存都不涨
+            self.assertEqual(len(queue.finished_tasks), 3 if retention == "all" else 0, retention)
+
+    def test_many_dependents(self) -> None:
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(8)
+        queue.add_task({
+            "id": "root",
+            "function": lambda: None,
+        })
+        for i in range(20000):
+            queue.add_task({
+                "id": f"dependent-{i}",
+                "function": lambda: None,
+                "pre_tasks": ["root"],
+            })
+        queue.run()
+        queue.shutdown()
+
+        self.assertEqual(len(queue.get_results()), 20001)
+
+    def test_add_tasks(self) -> None:
+        order: list[str] = []
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(1)
+        queue.add_task({"id": "big", "function": order.append, "args": ("big",), "priority": 5})
+        handles: list[granite_core.task_queue.TaskFuture] = queue.add_tasks(
+            {
+                "id": i,
+                "function": order.append,
+                "args": (str(i),),
+                "pre_tasks": ["last"] if i == 0 else [],  # 前置在同一批的后面
+                "priority": i,
+            } for i in range(4)
+        )
+        handles.append(queue.add_tasks([{"id": "last", "function": order.append, "args": ("last",), "priority": -1}])[0])
+        queue.run()
+        queue.shutdown()
+
+        self.assertEqual([handle.task_id for handle in handles], ["0", "1", "2", "3", "last"])
+        self.assertEqual(order, ["big", "3", "2", "1", "last", "0"])
+        self.assertEqual(queue.add_tasks([]), [])
+
+    def test_task_records(self) -> None:
+        formatted: list[str] = []
+
+        class Name:
+            def __format__(self, format_spec: str) -> str:
+                formatted.append(format_spec)
+                return "name"
+
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(2, "all")
+        record_handle: granite_core.task_queue.TaskFuture = queue.add_task(granite_core.task_queue.Task(
+            1, lambda x, y=0: x + y, (1,), {"y": 2}, description=("下载 {}", Name()), pre_tasks=[0], priority=3))
+        dict_handle: granite_core.task_queue.TaskFuture = queue.add_task({"id": 0, "function": lambda: "dict"})
+        self.assertFalse(formatted)  # 入队的时候不拼描述
+        queue.run()
+        queue.shutdown()
+
+        self.assertEqual(record_handle.result(1), 3)
+        self.assertEqual(dict_handle.result(1), "dict")
+        self.assertEqual(queue.get_task_info(1).description, "下载 name")
+        self.assertEqual(queue.get_task_info(1).priority, 3)
+        self.assertRaises(AttributeError, setattr, granite_core.task_queue.Task(2, print), "extra", 1)
+
+    def test_task_handles(self) -> None:
+        def fail() -> None:
+            raise ValueError("boom")
+
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(4)
+        callback_results: list[int] = []
+        handles: list[granite_core.task_queue.TaskFuture] = [
+            queue.add_task({
+                "id": i,
+                "function": lambda x=i: x * 2,
+            }) for i in range(10)
+        ]
+        handles[0].add_done_callback(lambda handle: callback_results.append(handle.result()))
+        failed_handle: granite_core.task_queue.TaskFuture = queue.add_task({
+            "id": "failed",
+            "function": fail,
+        })
+        threading.Thread(target=queue.run).start()
+
+        done, not_done = queue.wait(handles, timeout=10)
+        self.assertFalse(not_done)
+        self.assertEqual(sorted(handle.result(timeout=1) for handle in queue.as_completed(handles)),
+                         [i * 2 for i in range(10)])
+        self.assertRaises(ValueError, failed_handle.result, 10)
+        self.assertEqual(handles[3].task_id, "3")
+        self.assertTrue(handles[3].done())
+        self.assertEqual(callback_results, [0])
+        queue.shutdown()
+
+    def test_retention_policies(self) -> None:
+        def fail() -> None:
+            raise ValueError("boom")
+
+        for retention, expected in (("all", {"ok", "failed"}), ("callback", set()), ("failures", {"failed"})):
+            queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(2, retention)
+            queue.add_task({"id": "ok", "function": lambda: 1})
+            queue.add_task({"id": "failed", "function": fail})
+            queue.run()
+            queue.shutdown()
+
+            self.assertEqual(set(queue.get_results()), expected, retention)
+            self.assertEqual(len(queue.get_task_registry()), 2 if retention == "all" else 0, retention)
+
+        queue = granite_core.task_queue.TaskQueue(2, "consumed")
+        queue.add_task({"id": "ok", "function": lambda: 1})
+        queue.run()
+        queue.shutdown()
+        self.assertEqual(queue.get_result("ok"), 1)
+        self.assertIsNone(queue.get_result("ok"))
+
+        # 重试的任务登记表里一直留着，回调里还能查到重试了几次
+        attempts: list[int] = []
+        seen: list = []
+
+        def flaky() -> None:
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise ConnectionError("429")
+
+        queue = granite_core.task_queue.TaskQueue(1, "callback")
+        queue.add_task({"id": "flaky", "function": flaky, "max_retries": 1, "retry_delay": 0.01,
+                        "callback": lambda: seen.append(queue.get_task_info("flaky"))})
+        queue.run()
+        queue.shutdown()
+        self.assertEqual([(info.state, info.retries) for info in seen], [("succeeded", 1)])
+        self.assertEqual(len(queue.get_task_registry()), 0)
+
+    def test_result_stream(self) -> None:
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(4, "stream")
+        for i in range(100):
+            queue.add_task({"id": i, "function": lambda x=i: x})
+        threading.Thread(target=queue.run).start()
+
+        self.assertEqual(sorted(result for _, result in queue.iter_results(timeout=10)), list(range(100)))
+        self.assertFalse(queue.get_results())
+        queue.shutdown()
+
+    def test_max_time(self) -> None:
+        attempts: list[int] = []
+
+        def stall(cancel_token: granite_core.task_queue.CancellationToken) -> str:
+            attempts.append(1)
+            cancel_token.wait(5)  # 像一个卡住但会看令牌的下载
+            cancel_token.check()
+            return "never"
+
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(1)
+        stalled_handle: granite_core.task_queue.TaskFuture = queue.add_task({
+            "id": "stalled",
+            "function": stall,
+            "cancellable": True,
+            "max_time": 0.2,
+            "max_retries": 1,
+        })
+        other_handle: granite_core.task_queue.TaskFuture = queue.add_task({
+            "id": "other",
+            "function": lambda: "ok",
+            "priority": -1,
+        })
+        queue.run()
+
+        self.assertRaises(granite_core.task_queue.TaskTimedOut, stalled_handle.result, 1)
+        self.assertEqual(other_handle.result(1), "ok")
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(queue.get_task_state("stalled"), "timed_out")
+        self.assertTrue(queue.shutdown(timeout=5))
+
+    def test_shutdown_cancels_running_tasks(self) -> None:
+        started: threading.Event = threading.Event()
+
+        def long_running(cancel_token: granite_core.task_queue.CancellationToken) -> None:
+            started.set()
+            cancel_token.wait(30)
+            cancel_token.check()
+
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(1)
+        running_handle: granite_core.task_queue.TaskFuture = queue.add_task({
+            "id": "running",
+            "function": long_running,
+            "cancellable": True,
+        })
+        queued_handle: granite_core.task_queue.TaskFuture = queue.add_task({
+            "id": "queued",
+            "function": lambda: None,
+        })
+        threading.Thread(target=queue.run).start()
+        started.wait(5)
+
+        start_time: float = time.monotonic()
+        self.assertTrue(queue.shutdown(cancel_pending=True, timeout=5))
+        self.assertLess(time.monotonic() - start_time, 5)
+        self.assertTrue(queued_handle.cancelled())
+        self.assertRaises(granite_core.task_queue.TaskCancelled, running_handle.result, 1)
+
+    def test_retry_backoff(self) -> None:
+        attempt_times: list[float] = []
+        order: list[str] = []
+
+        def flaky() -> str:
+            attempt_times.append(time.monotonic())
+            if len(attempt_times) < 3:
+                raise ConnectionError("429")
+            return "ok"
+
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(1)
+        flaky_handle: granite_core.task_queue.TaskFuture = queue.add_task({
+            "id": "flaky",
+            "function": flaky,
+            "max_retries": -1,
+            "retry_delay": 0.1,
+            "retry_jitter": 0,
+            "priority": 1,
+        })
+        queue.add_task({
+            "id": "other",
+            "function": order.append,
+            "args": ("other",),
+        })
+        queue.run()
+        queue.shutdown()
+
+        self.assertEqual(flaky_handle.result(1), "ok")
+        self.assertEqual(len(attempt_times), 3)  # 成功了就不再跑
+        self.assertGreaterEqual(attempt_times[1] - attempt_times[0], 0.1)
+        self.assertGreaterEqual(attempt_times[2] - attempt_times[1], 0.2)
+        self.assertEqual(order, ["other"])  # 退避期间唯一的线程去跑别的任务了
+        self.assertEqual(queue.get_task_registry()["flaky"].retries, 2)
+
+    def test_rate_limit(self) -> None:
+        lock: threading.Lock = threading.Lock()
+        in_flight: list[int] = [0, 0]  # 当前，峰值
+        start_times: list[float] = []
+        other_done: list[float] = []
+
+        def throttled() -> None:
+            with lock:
+                start_times.append(time.monotonic())
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(
+            8, rate_limits={"slow.example": {"rate": 20, "burst": 2, "max_in_flight": 2}})
+        for i in range(10):
+            queue.add_task({"id": f"throttled-{i}", "function": throttled, "rate_key": "slow.example", "priority": 1})
+        queue.add_task({"id": "other", "function": lambda: other_done.append(time.monotonic())})
+        run_start: float = time.monotonic()
+        queue.run()
+        queue.shutdown()
+
+        self.assertEqual(len(start_times), 10)
+        self.assertLessEqual(in_flight[1], 2)
+        self.assertGreaterEqual(max(start_times) - run_start, 0.35)  # 桶里 2 个，剩下 8 个按 20/s 放
+        self.assertLess(other_done[0], max(start_times))  # 限流的时候别的任务照跑
+
+    def test_set_rate_limit_while_parked(self) -> None:
+        start_times: list[float] = []
+        started: threading.Event = threading.Event()
+        unparked: list = []
+
+        def throttled() -> None:
+            start_times.append(time.monotonic())
+            started.set()
+
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(
+            4, rate_limits={"slow.example": {"rate": 20, "burst": 1}})
+        unpark = queue._unpark
+        queue._unpark = lambda rate_limit: unparked.append(rate_limit) or unpark(rate_limit)
+        for i in range(5):
+            queue.add_task({"id": f"throttled-{i}", "function": throttled, "rate_key": "slow.example"})
+        threading.Thread(target=queue.run).start()
+        self.assertTrue(started.wait(5))
+        old_rate_limit: granite_core.task_queue.RateLimit = queue.rate_limits["slow.example"]
+        queue.set_rate_limit("slow.example", rate=0.5, burst=1)  # 收紧：新桶里 1 个令牌，下一个要等 2 秒
+        switched_at: float = time.monotonic()
+        unparked.clear()
+        time.sleep(0.5)  # 旧桶 50ms 后的定时器到点了，不能再按旧桶的令牌从暂存里往外放
+        queue.shutdown()
+
+        self.assertNotIn(old_rate_limit, unparked)
+        self.assertEqual(len([start_time for start_time in start_times if start_time >= switched_at]), 1)
+        self.assertEqual(len(start_times), 2)
+
+    def test_adaptive_concurrency(self) -> None:
+        class Response:
+            status_code: int = 429
+
+        class TooManyRequests(Exception):
+            response: Response = Response()
+
+        lock: threading.Lock = threading.Lock()
+        in_flight: list[int] = [0, 0]  # 当前，峰值
+
+        def request() -> None:  # 并发超过 4 就 429 的“服务器”
+            with lock:
+                in_flight[0] += 1
+                overloaded: bool = in_flight[0] > 4
+            time.sleep(0.005)
+            with lock:
+                in_flight[0] -= 1
+            if overloaded:
+                raise TooManyRequests()
+
+        adaptive_concurrency: granite_core.task_queue.AdaptiveConcurrency = granite_core.task_queue.AdaptiveConcurrency(
+            max_limit=32, initial_limit=32, latency_tolerance=None)
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(
+            32, adaptive_concurrency=adaptive_concurrency)
+        handles: list[granite_core.task_queue.TaskFuture] = [
+            queue.add_task({"id": i, "function": request, "adaptive": True, "max_retries": -1}) for i in range(400)
+        ]
+        queue.run()
+        queue.shutdown()
+
+        self.assertTrue(all(handle.exception() is None for handle in handles))
+        self.assertGreater(adaptive_concurrency.decreases, 0)
+        self.assertLessEqual(queue.get_concurrency(), 8)
+        self.assertEqual(queue.get_concurrency_stats()["adaptive"]["in_flight"], 0)
+
+    def test_metrics(self) -> None:
+        events: list[tuple[str, str]] = []
+        attempts: list[int] = []
+
+        def flaky() -> None:
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise ConnectionError("reset")
+            time.sleep(0.02)
+
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(2, "all")
+        for hook in granite_core.task_queue.TaskMetrics.HOOKS:
+            queue.add_hook(hook, lambda info, hook=hook: events.append((hook, info.task_id)))
+        queue.add_task({"id": "flaky", "function": flaky, "max_retries": 1, "category": "asset"})
+        queue.add_tasks({"id": f"lib-{i}", "function": lambda: None, "category": "library"} for i in range(3))
+        queue.add_task({"id": "failed", "function": lambda: 1 / 0, "category": "library"})
+        queue.run()
+        queue.shutdown()
+
+        metrics: dict = queue.get_metrics()
+        self.assertEqual(metrics["categories"]["asset"]["outcomes"], {"succeeded": 1})
+        self.assertEqual(metrics["categories"]["asset"]["retries"], 1)
+        self.assertEqual(metrics["categories"]["asset"]["run_time"]["count"], 2)
+        self.assertGreaterEqual(metrics["categories"]["asset"]["run_time"]["sum"], 0.02)
+        self.assertEqual(metrics["categories"]["library"]["outcomes"], {"succeeded": 3, "failed": 1})
+        self.assertEqual(metrics["gauges"]["queued_tasks"], 0)
+        info: granite_core.task_queue.TaskInfo = queue.get_task_info("flaky")
+        self.assertEqual((info.category, info.retries, info.state), ("asset", 1, "succeeded"))
+        self.assertGreaterEqual(info.run_time, 0.02)
+        self.assertIsNotNone(info.worker)
+
+        self.assertEqual(events.count(("on_enqueue", "flaky")), 1)
+        self.assertEqual(events.count(("on_start", "flaky")), 2)
+        self.assertEqual(events.count(("on_finish", "flaky")), 1)
+        self.assertEqual(len([event for event in events if event[0] == "on_finish"]), 5)
+
+        prometheus: str = queue.export_metrics("prometheus")
+        self.assertIn('granite_task_queue_tasks_total{category="library",outcome="failed"} 1', prometheus)
+        self.assertIn('granite_task_queue_run_time_seconds_bucket{category="asset",le="+Inf"} 2', prometheus)
+        self.assertIn("granite_task_queue_busy_workers 0", prometheus)
+        self.assertEqual(json.loads(queue.export_metrics())["categories"]["asset"]["retries"], 1)
+        self.assertRaises(ValueError, queue.add_hook, "on_everything", print)
+
+    def test_process_executor(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path: pathlib.Path = pathlib.Path(temp_dir) / "blob"
+            file_path.write_bytes(b"granite" * 100000)
+            callback_pids: list[int] = []
+
+            queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(2, process_workers=1)
+            pid_handle: granite_core.task_queue.TaskFuture = queue.add_task({
+                "id": "pid",
+                "function": os.getpid,
+                "executor": "process",
+                "callback": lambda: callback_pids.append(os.getpid()),
+            })
+            sha1_handle: granite_core.task_queue.TaskFuture = queue.add_task({
+                "id": "sha1",
+                "function": granite_core.minecraft_installer.MinecraftInstaller._get_file_sha1,
+                "args": (file_path,),  # 只传路径，子进程自己读
+                "executor": "process",
+            })
+            failed_handle: granite_core.task_queue.TaskFuture = queue.add_task({
+                "id": "failed",
+                "function": os.stat,
+                "args": (pathlib.Path(temp_dir) / "missing",),
+                "executor": "process",
+            })
+            queue.run()
+            queue.shutdown()
+
+            self.assertNotEqual(pid_handle.result(1), os.getpid())
+            self.assertEqual(callback_pids, [os.getpid()])  # 回调在父进程跑
+            self.assertEqual(sha1_handle.result(1), hashlib.sha1(file_path.read_bytes()).hexdigest())
+            self.assertRaises(FileNotFoundError, failed_handle.result, 1)
+            self.assertRaises(ValueError, granite_core.task_queue.Task, "bad", print, executor="process", cancellable=True)
+
+    def test_elastic_pool(self) -> None:
+        queue: granite_core.task_queue.TaskQueue = granite_core.task_queue.TaskQueue(8, min_workers=1, idle_timeout=0.2)
+        self.assertEqual(queue.get_worker_count(), 1)
+
+        for i in range(32):
+            queue.add_task({"id": i, "function": time.sleep, "args": (0.05,)})
+        self.assertEqual(queue.get_worker_count(), 1)  # run() 之前不起线程
+        threading.Thread(target=queue.run).start()
+        time.sleep(0.1)
+        self.assertEqual(queue.get_worker_count(), 8)
+
+        time.sleep(1)
+        self.assertEqual(queue.get_worker_count(), 1)  # 闲下来回收到 min_workers
+        self.assertEqual(len(queue.get_results()), 32)
+        queue.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
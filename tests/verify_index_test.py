@@ -0,0 +1,98 @@
+import hashlib
+import os
+import pathlib
+import tempfile
+import unittest
+import unittest.mock
+
+import granite_core
+
+
+class VerifyIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.root: pathlib.Path = pathlib.Path(self.temp_dir.name)
+        self.index_path: pathlib.Path = self.root / "verify_index.json"
+        self.library: pathlib.Path = self.root / "libraries" / "a.jar"
+        self.library.parent.mkdir()
+        self.library.write_bytes(b"library")
+        self.sha1: str = hashlib.sha1(b"library").hexdigest()
+        os.utime(self.library, ns=(0, 1000000000))  # 比索引早，不算 racy
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_persist(self) -> None:
+        self.assertEqual(granite_core.verify_index.file_sha1(self.library), self.sha1)
+        index: granite_core.verify_index.VerifyIndex = granite_core.verify_index.VerifyIndex(self.index_path)
+        index.record(self.library, self.sha1)
+        index.save()
+
+        index = granite_core.verify_index.VerifyIndex(self.index_path)
+        self.assertTrue(index.lookup(self.library, self.sha1))
+        self.assertFalse(index.lookup(self.library, hashlib.sha1(b"other").hexdigest()))
+
+        # 同样大小、改回原来的修改时间，但已经是另一个文件了
+        replacement: pathlib.Path = self.root / "libraries" / "a.jar.new"
+        replacement.write_bytes(b"LIBRARY")
+        os.utime(replacement, ns=(0, 1000000000))
+        os.replace(replacement, self.library)
+        self.assertFalse(index.lookup(self.library, self.sha1))
+
+    def test_racy_entry(self) -> None:
+        index: granite_core.verify_index.VerifyIndex = granite_core.verify_index.VerifyIndex(self.index_path)
+        os.utime(self.library, ns=(0, 2 ** 62))  # 修改时间不早于索引保存的时候
+        index.record(self.library, self.sha1)
+        index.save()
+        self.assertFalse(granite_core.verify_index.VerifyIndex(self.index_path).lookup(self.library, self.sha1))
+
+    def test_invalidate_and_rebuild(self) -> None:
+        asset: pathlib.Path = self.root / "assets" / "b.ogg"
+        asset.parent.mkdir()
+        asset.write_bytes(b"asset")
+        index: granite_core.verify_index.VerifyIndex = granite_core.verify_index.VerifyIndex(self.index_path)
+        index.record(self.library, self.sha1)
+        index.record(asset, hashlib.sha1(b"asset").hexdigest())
+
+        self.assertEqual(index.invalidate([self.root / "libraries"]), 1)
+        self.assertFalse(index.lookup(self.library, self.sha1))
+        self.assertTrue(index.lookup(asset, hashlib.sha1(b"asset").hexdigest()))
+
+        index.record(self.library, self.sha1)
+        with open(self.library, "r+b") as f:
+            f.write(b"L")  # 大小不变，改了内容
+        os.utime(self.library, ns=(0, 1000000000))
+        self.assertTrue(index.lookup(self.library, self.sha1))  # 光看 stat 看不出来，要 rebuild
+        self.assertEqual(index.rebuild(), 1)
+        self.assertFalse(index.lookup(self.library, self.sha1))
+        self.assertTrue(index.lookup(self.library, hashlib.sha1(b"Library").hexdigest()))
+
+        self.assertEqual(index.invalidate(), 2)
+        index.save()
+        self.assertEqual(granite_core.verify_index.VerifyIndex(self.index_path).entries, {})
+
+    def test_unreadable_files(self) -> None:
+        asset: pathlib.Path = self.root / "assets" / "b.ogg"
+        asset.parent.mkdir()
+        asset.write_bytes(b"asset")
+        # 一个文件读不了不影响别的
+        self.assertEqual(granite_core.verify_index.hash_files([self.root / "libraries", self.root / "missing", asset]),
+                         [None, None, hashlib.sha1(b"asset").hexdigest()])
+
+        index: granite_core.verify_index.VerifyIndex = granite_core.verify_index.VerifyIndex(self.index_path)
+        index.record(self.library, self.sha1)
+        index.record(asset, hashlib.sha1(b"asset").hexdigest())
+        file_sha1 = granite_core.verify_index.file_sha1
+
+        def locked_library(file_path: pathlib.Path) -> str:
+            if file_path == self.library:
+                raise PermissionError(f"permission denied: {file_path}")
+            return file_sha1(file_path)
+
+        with unittest.mock.patch("granite_core.verify_index.file_sha1", side_effect=locked_library):
+            self.assertEqual(index.rebuild(), 1)
+        self.assertEqual(list(index.entries), [str(asset)])
+
+
+if __name__ == "__main__":
+    unittest.main()